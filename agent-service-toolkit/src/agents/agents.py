@@ -1,12 +1,11 @@
-from dataclasses import dataclass
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from importlib import import_module
 
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.graph.state import CompiledStateGraph
 
-from agents.bg_task_agent.bg_task_agent import bg_task_agent
-from agents.chatbot import chatbot
-from agents.command_agent import command_agent
-from agents.research_assistant import research_assistant
-from agents.mcp_generate_agent.mcp_generate_agent import mcp_generate_agent
 from schema import AgentInfo
 
 DEFAULT_AGENT = "mcp-generate-agent"
@@ -15,22 +14,68 @@ DEFAULT_AGENT = "mcp-generate-agent"
 @dataclass
 class Agent:
     description: str
-    graph: CompiledStateGraph
+    graph: CompiledStateGraph | None = None
+    # "module:attribute" of the compiled graph. Building a graph imports its tools and
+    # provider SDKs, so it is only imported when the agent is first used.
+    graph_path: str | None = None
+    checkpointer: BaseCheckpointSaver | None = None
+    # Held while the graph is built, so concurrent first uses import and compile it once
+    build_lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
 
 
 agents: dict[str, Agent] = {
-    "chatbot": Agent(description="A simple chatbot.", graph=chatbot),
+    "chatbot": Agent(description="A simple chatbot.", graph_path="agents.chatbot:chatbot"),
     "research-assistant": Agent(
-        description="A research assistant with web search and calculator.", graph=research_assistant
+        description="A research assistant with web search and calculator.",
+        graph_path="agents.research_assistant:research_assistant",
+    ),
+    "command-agent": Agent(
+        description="A command agent.", graph_path="agents.command_agent:command_agent"
+    ),
+    "bg-task-agent": Agent(
+        description="A background task agent.",
+        graph_path="agents.bg_task_agent.bg_task_agent:bg_task_agent",
+    ),
+    "mcp-generate-agent": Agent(
+        description="A MCP generate agent.",
+        graph_path="agents.mcp_generate_agent.mcp_generate_agent:mcp_generate_agent",
     ),
-    "command-agent": Agent(description="A command agent.", graph=command_agent),
-    "bg-task-agent": Agent(description="A background task agent.", graph=bg_task_agent),
-    "mcp-generate-agent": Agent(description="A MCP generate agent.", graph=mcp_generate_agent),
 }
 
 
 def get_agent(agent_id: str) -> CompiledStateGraph:
-    return agents[agent_id].graph
+    agent = agents[agent_id]
+    if agent.graph is None and agent.graph_path:
+        with agent.build_lock:
+            if agent.graph is None:
+                module_name, _, attribute = agent.graph_path.partition(":")
+                graph = getattr(import_module(module_name), attribute)
+                if agent.checkpointer is not None:
+                    graph.checkpointer = agent.checkpointer
+                agent.graph = graph
+    return agent.graph
+
+
+async def aget_agent(agent_id: str) -> CompiledStateGraph:
+    """Like get_agent, but builds the graph in a worker thread, off the event loop."""
+    agent = agents[agent_id]
+    if agent.graph is None and agent.graph_path:
+        return await asyncio.to_thread(get_agent, agent_id)
+    return agent.graph
+
+
+def set_checkpointer(agent_id: str, checkpointer: BaseCheckpointSaver) -> None:
+    """Use checkpointer for the agent, without building its graph if it isn't yet."""
+    agent = agents[agent_id]
+    agent.checkpointer = checkpointer
+    if agent.graph is not None:
+        agent.graph.checkpointer = checkpointer
+
+
+def load_agents(agent_ids: list[str] | None = None) -> None:
+    """Build the graphs of agent_ids, or of all agents, ahead of their first use."""
+    for agent_id in agent_ids if agent_ids is not None else agents:
+        get_agent(agent_id)
 
 
 def get_all_agent_info() -> list[AgentInfo]:
@@ -7,10 +7,11 @@ from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import END, MessagesState, StateGraph
 
 from agents.bg_task_agent.task import Task
+from agents.context import ContextState, asummarize_context, fit_context
 from core import get_model, settings
 
 
-class AgentState(MessagesState, total=False):
+class AgentState(MessagesState, ContextState, total=False):
     """`total=False` is PEP589 specs.
 
     documentation: https://typing.readthedocs.io/en/latest/spec/typeddict.html#totality
@@ -19,7 +20,7 @@ class AgentState(MessagesState, total=False):
 
 def wrap_model(model: BaseChatModel) -> RunnableSerializable[AgentState, AIMessage]:
     preprocessor = RunnableLambda(
-        lambda state: state["messages"],
+        lambda state: fit_context(state),
         name="StateModifier",
     )
     return preprocessor | model
@@ -28,10 +29,11 @@ def wrap_model(model: BaseChatModel) -> RunnableSerializable[AgentState, AIMessa
 async def acall_model(state: AgentState, config: RunnableConfig) -> AgentState:
     m = get_model(config["configurable"].get("model", settings.DEFAULT_MODEL))
     model_runnable = wrap_model(m)
-    response = await model_runnable.ainvoke(state, config)
+    context = await asummarize_context(state, m)
+    response = await model_runnable.ainvoke({**state, **context}, config)
 
     # We return a list, because this will get added to the existing list
-    return {"messages": [response]}
+    return {**context, "messages": [response]}
 
 
 async def bg_task(state: AgentState, config: RunnableConfig) -> AgentState:
@@ -0,0 +1,169 @@
+import json
+import logging
+from collections.abc import Sequence
+from functools import cache
+
+import tiktoken
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
+from typing_extensions import TypedDict
+
+from core import settings
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+summary_instructions = """
+Extend the summary of a conversation with the messages that follow it. Keep the facts, decisions,
+open questions and user preferences the assistant needs to continue the conversation. Reply with
+the updated summary only.
+
+<BEGIN SUMMARY>
+{summary}
+<END SUMMARY>
+
+<BEGIN NEW MESSAGES>
+{conversation}
+<END NEW MESSAGES>"""
+
+
+class ContextState(TypedDict, total=False):
+    """Graph state for the "summary" strategy, add it to an agent's state to use it."""
+
+    context_summary: str
+    # How many of the leading state["messages"] the summary covers
+    summarized_messages: int
+
+
+@cache
+def _encoding() -> tiktoken.Encoding | None:
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # The encoding is downloaded on first use, which fails on air-gapped hosts
+        logger.warning(f"tiktoken encoding unavailable, estimating token counts: {e}")
+        return None
+
+
+def _text_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _message_text(message: BaseMessage) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(
+        part if isinstance(part, str) else str(part.get("text", "")) for part in message.content
+    )
+
+
+def count_tokens(messages: Sequence[BaseMessage]) -> int:
+    """
+    Count the tokens messages take up in a prompt.
+
+    Counts use OpenAI's cl100k_base encoding plus a fixed per-message overhead. Other
+    providers tokenize differently, so budgets should leave some headroom.
+    """
+    total = 0
+    for message in messages:
+        total += 4 + _text_tokens(_message_text(message))
+        if isinstance(message, AIMessage) and message.tool_calls:
+            total += _text_tokens(json.dumps(message.tool_calls, default=str))
+    return total
+
+
+def _turns(messages: Sequence[BaseMessage]) -> list[list[BaseMessage]]:
+    # Tool results stay with the AI message that called the tools, providers reject either alone
+    turns: list[list[BaseMessage]] = []
+    for message in messages:
+        if message.type == "tool" and turns:
+            turns[-1].append(message)
+        else:
+            turns.append([message])
+    return turns
+
+
+def trim_to_budget(
+    messages: Sequence[BaseMessage], max_tokens: int, pin_first: bool = False
+) -> list[BaseMessage]:
+    """
+    Keep the most recent messages that fit in max_tokens.
+
+    The kept messages start on a human message: the earliest one that fits, or else the
+    last one, even if that goes over budget. Tool results are kept or dropped together
+    with the tool call they answer. With `pin_first`, the first message is kept as well.
+    """
+    pinned = list(messages[:1]) if pin_first else []
+    turns = _turns(messages[len(pinned) :])
+    remaining = max_tokens - count_tokens(pinned)
+    start = len(turns)
+    for i in reversed(range(len(turns))):
+        cost = count_tokens(turns[i])
+        if start < len(turns) and cost > remaining:
+            break
+        start = i
+        remaining -= cost
+    # Providers reject or misread a conversation that opens with an AI or tool message
+    if human := [i for i, turn in enumerate(turns) if turn[0].type == "human"]:
+        start = next((i for i in human if i >= start), human[-1])
+    return pinned + [message for turn in turns[start:] for message in turn]
+
+
+def _summary_message(state: ContextState) -> list[BaseMessage]:
+    if summary := state.get("context_summary"):
+        return [SystemMessage(content=SUMMARY_PREFIX + summary)]
+    return []
+
+
+def fit_context(state: dict, system: Sequence[BaseMessage] = ()) -> list[BaseMessage]:
+    """
+    Build the prompt for a model call from the system messages and the thread history.
+
+    Meant for the preprocessor in an agent's `wrap_model`. System messages are always
+    sent; the history is reduced with the configured CONTEXT_STRATEGY.
+    """
+    messages = state["messages"]
+    strategy = settings.CONTEXT_STRATEGY
+    if strategy == "full":
+        return [*system, *messages]
+    if strategy == "summary":
+        system = [*system, *_summary_message(state)]
+        messages = messages[state.get("summarized_messages", 0) :]
+    budget = settings.CONTEXT_MAX_TOKENS - count_tokens(system)
+    return [*system, *trim_to_budget(messages, budget, pin_first=strategy == "pinned")]
+
+
+async def asummarize_context(
+    state: dict, model: BaseChatModel, system: Sequence[BaseMessage] = ()
+) -> ContextState:
+    """
+    Fold older messages into the running summary once the history outgrows its budget.
+
+    Only does anything with the "summary" strategy. The most recent messages, up to half
+    the budget, stay verbatim. Returns the state update, which the caller must pass on to
+    `fit_context` and return from its node.
+    """
+    if settings.CONTEXT_STRATEGY != "summary":
+        return {}
+    start = state.get("summarized_messages", 0)
+    messages = state["messages"][start:]
+    fixed = count_tokens([*system, *_summary_message(state)])
+    if fixed + count_tokens(messages) <= settings.CONTEXT_MAX_TOKENS:
+        return {}
+    kept = trim_to_budget(messages, (settings.CONTEXT_MAX_TOKENS - fixed) // 2)
+    folded = messages[: len(messages) - len(kept)]
+    if not folded:
+        return {}
+
+    conversation = "\n\n".join(f"{m.type}: {_message_text(m)}" for m in folded)
+    prompt = summary_instructions.format(
+        summary=state.get("context_summary") or "(empty)", conversation=conversation
+    )
+    # Isolated from the run's callbacks so the summary isn't streamed to the user
+    result = await model.ainvoke([HumanMessage(content=prompt)], RunnableConfig(callbacks=[]))
+    return {"context_summary": _message_text(result), "summarized_messages": start + len(folded)}
@@ -1,9 +1,15 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from enum import Enum
+from functools import cache
 
 from langchain_core.messages import AIMessage, AnyMessage, HumanMessage
 from langchain_core.prompts import PromptTemplate
 from pydantic import BaseModel, Field
 
+from agents.context import trim_to_budget
 from core import get_model, settings
 from schema.models import GroqModelName
 
@@ -75,36 +81,124 @@ def parse_llama_guard_output(output: str) -> LlamaGuardOutput:
         return LlamaGuardOutput(safety_assessment=SafetyAssessment.ERROR)
 
 
+@dataclass
+class VerdictCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    size: int = 0
+
+
 class LlamaGuard:
-    def __init__(self) -> None:
-        if settings.GROQ_API_KEY is None:
+    """
+    LlamaGuard safety classifier with an LRU cache of verdicts.
+
+    Verdicts are keyed on a hash of the role and the conversation as LlamaGuard sees it,
+    so a replayed turn or an unchanged conversation skips the Groq call. Errors aren't
+    cached. Use `get_llama_guard()` to share one instance, and its cache, across agents.
+    """
+
+    def __init__(self, cache_size: int = 1024) -> None:
+        self.cache_size = cache_size
+        self._verdicts: OrderedDict[str, LlamaGuardOutput] = OrderedDict()
+        self._stats = VerdictCacheStats()
+        self._lock = threading.Lock()
+        if settings.GROQ_API_KEY is not None:
+            model = get_model(GroqModelName.LLAMA_GUARD_3_8B)
+        elif settings.FAKE_MODEL_LLAMA_GUARD:
+            from core.fake_model import FakeStreamingChatModel
+
+            # Exercises the guard path in offline benchmarks, with the fake model's latency
+            model = FakeStreamingChatModel(
+                responses=["safe"],
+                first_token_delay=settings.FAKE_MODEL_FIRST_TOKEN_DELAY,
+                sleep=settings.FAKE_MODEL_TOKEN_DELAY or None,
+            )
+        else:
             print("GROQ_API_KEY not set, skipping LlamaGuard")
             self.model = None
             return
-        self.model = get_model(GroqModelName.LLAMA_GUARD_3_8B).with_config(tags=["llama_guard"])
+        self.model = model.with_config(tags=["llama_guard"])
         self.prompt = PromptTemplate.from_template(llama_guard_instructions)
 
-    def _compile_prompt(self, role: str, messages: list[AnyMessage]) -> str:
+    @staticmethod
+    def _conversation_history(messages: list[AnyMessage]) -> str:
         role_mapping = {"ai": "Agent", "human": "User"}
-        messages_str = [
-            f"{role_mapping[m.type]}: {m.content}" for m in messages if m.type in ["ai", "human"]
-        ]
-        conversation_history = "\n\n".join(messages_str)
+        messages = [m for m in messages if m.type in ["ai", "human"]]
+        # Only the last message is classified, older ones are context and can be trimmed
+        messages = trim_to_budget(messages, settings.CONTEXT_GUARD_MAX_TOKENS)
+        messages_str = [f"{role_mapping[m.type]}: {m.content}" for m in messages]
+        return "\n\n".join(messages_str)
+
+    def _compile_prompt(self, role: str, messages: list[AnyMessage]) -> str:
+        conversation_history = self._conversation_history(messages)
         return self.prompt.format(role=role, conversation_history=conversation_history)
 
+    def _cache_key(self, role: str, messages: list[AnyMessage]) -> str:
+        conversation_history = self._conversation_history(messages)
+        return hashlib.sha256(f"{role}\x00{conversation_history}".encode()).hexdigest()
+
+    def _lookup(self, key: str) -> LlamaGuardOutput | None:
+        with self._lock:
+            verdict = self._verdicts.get(key)
+            if verdict is None:
+                self._stats.misses += 1
+                return None
+            self._verdicts.move_to_end(key)
+            self._stats.hits += 1
+            return verdict
+
+    def _store(self, key: str, verdict: LlamaGuardOutput) -> None:
+        if verdict.safety_assessment == SafetyAssessment.ERROR or self.cache_size <= 0:
+            return
+        with self._lock:
+            self._verdicts[key] = verdict
+            self._verdicts.move_to_end(key)
+            while len(self._verdicts) > self.cache_size:
+                self._verdicts.popitem(last=False)
+                self._stats.evictions += 1
+
     def invoke(self, role: str, messages: list[AnyMessage]) -> LlamaGuardOutput:
         if self.model is None:
             return LlamaGuardOutput(safety_assessment=SafetyAssessment.SAFE)
+        key = self._cache_key(role, messages)
+        if verdict := self._lookup(key):
+            return verdict
         compiled_prompt = self._compile_prompt(role, messages)
         result = self.model.invoke([HumanMessage(content=compiled_prompt)])
-        return parse_llama_guard_output(result.content)
+        verdict = parse_llama_guard_output(result.content)
+        self._store(key, verdict)
+        return verdict
 
     async def ainvoke(self, role: str, messages: list[AnyMessage]) -> LlamaGuardOutput:
         if self.model is None:
             return LlamaGuardOutput(safety_assessment=SafetyAssessment.SAFE)
+        key = self._cache_key(role, messages)
+        if verdict := self._lookup(key):
+            return verdict
         compiled_prompt = self._compile_prompt(role, messages)
         result = await self.model.ainvoke([HumanMessage(content=compiled_prompt)])
-        return parse_llama_guard_output(result.content)
+        verdict = parse_llama_guard_output(result.content)
+        self._store(key, verdict)
+        return verdict
+
+    def stats(self) -> VerdictCacheStats:
+        with self._lock:
+            return VerdictCacheStats(
+                hits=self._stats.hits,
+                misses=self._stats.misses,
+                evictions=self._stats.evictions,
+                size=len(self._verdicts),
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._verdicts.clear()
+
+
+@cache
+def get_llama_guard() -> LlamaGuard:
+    return LlamaGuard(cache_size=settings.LLAMA_GUARD_CACHE_SIZE)
 
 
 if __name__ == "__main__":
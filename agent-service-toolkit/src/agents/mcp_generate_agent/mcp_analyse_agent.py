@@ -7,6 +7,7 @@ from langchain_core.runnables import RunnableConfig, RunnableLambda, RunnableSer
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import END, MessagesState, StateGraph
 
+from agents.context import ContextState, asummarize_context, fit_context
 from core import get_model, settings
 
 import os
@@ -24,7 +25,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-class AgentState(MessagesState, total=False):
+class AgentState(MessagesState, ContextState, total=False):
 	requirement_type: Literal["database", "browser", "other"]
 	operation_details: List[str]
 
@@ -73,7 +74,7 @@ MCP服务是一种固定格式的通信协议. 你是一个业务需求分析助
 # 包装模型
 def wrap_model(model: BaseChatModel) -> RunnableSerializable[AgentState, AIMessage]:
 	preprocessor = RunnableLambda(
-		lambda state: [SystemMessage(content=REQUIREMENT_ANALYSIS_PROMPT)] + state["messages"],
+		lambda state: fit_context(state, [SystemMessage(content=REQUIREMENT_ANALYSIS_PROMPT)]),
 		name="StateModifier",
 	)
 	return preprocessor | model
@@ -82,11 +83,14 @@ def wrap_model(model: BaseChatModel) -> RunnableSerializable[AgentState, AIMessa
 async def acall_model(state: AgentState, config: RunnableConfig) -> AgentState:
 	m = get_model(config["configurable"].get("model", settings.DEFAULT_MODEL))
 	model_runnable = wrap_model(m)
-	response = await model_runnable.ainvoke(state, config)
+	system = [SystemMessage(content=REQUIREMENT_ANALYSIS_PROMPT)]
+	context = await asummarize_context(state, m, system)
+	response = await model_runnable.ainvoke({**state, **context}, config)
 	logger.info(response)
 	analysis_result = json.loads(response.content)
     
 	return {
+		**context,
 		"messages": state.get("messages", []) + [response],
         "operation_details": analysis_result["operation_details"],
 		"requirement_type": analysis_result["requirement_type"]
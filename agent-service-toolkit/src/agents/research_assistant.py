@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime
 from typing import Literal
 
@@ -11,12 +12,14 @@ from langgraph.graph import END, MessagesState, StateGraph
 from langgraph.managed import RemainingSteps
 from langgraph.prebuilt import ToolNode
 
-from agents.llama_guard import LlamaGuard, LlamaGuardOutput, SafetyAssessment
+from agents.context import ContextState, asummarize_context, fit_context
+from agents.llama_guard import LlamaGuardOutput, SafetyAssessment, get_llama_guard
 from agents.tools import calculator
+from agents.utils import GateClosedError, GatedChatModel
 from core import get_model, settings
 
 
-class AgentState(MessagesState, total=False):
+class AgentState(MessagesState, ContextState, total=False):
     """`total=False` is PEP589 specs.
 
     documentation: https://typing.readthedocs.io/en/latest/spec/typeddict.html#totality
@@ -55,7 +58,7 @@ instructions = f"""
 def wrap_model(model: BaseChatModel) -> RunnableSerializable[AgentState, AIMessage]:
     model = model.bind_tools(tools)
     preprocessor = RunnableLambda(
-        lambda state: [SystemMessage(content=instructions)] + state["messages"],
+        lambda state: fit_context(state, [SystemMessage(content=instructions)]),
         name="StateModifier",
     )
     return preprocessor | model
@@ -70,11 +73,17 @@ def format_safety_message(safety: LlamaGuardOutput) -> AIMessage:
 
 async def acall_model(state: AgentState, config: RunnableConfig) -> AgentState:
     m = get_model(config["configurable"].get("model", settings.DEFAULT_MODEL))
+    context = await asummarize_context(state, m, [SystemMessage(content=instructions)])
+    result = await _call_model({**state, **context}, config, m)
+    return {**context, **result}
+
+
+async def _call_model(state: AgentState, config: RunnableConfig, m: BaseChatModel) -> AgentState:
     model_runnable = wrap_model(m)
     response = await model_runnable.ainvoke(state, config)
 
     # Run llama guard check here to avoid returning the message if it's unsafe
-    llama_guard = LlamaGuard()
+    llama_guard = get_llama_guard()
     safety_output = await llama_guard.ainvoke("Agent", state["messages"] + [response])
     if safety_output.safety_assessment == SafetyAssessment.UNSAFE:
         return {"messages": [format_safety_message(safety_output)], "safety": safety_output}
@@ -93,11 +102,51 @@ async def acall_model(state: AgentState, config: RunnableConfig) -> AgentState:
 
 
 async def llama_guard_input(state: AgentState, config: RunnableConfig) -> AgentState:
-    llama_guard = LlamaGuard()
+    llama_guard = get_llama_guard()
     safety_output = await llama_guard.ainvoke("User", state["messages"])
     return {"safety": safety_output}
 
 
+async def acall_model_speculative(state: AgentState, config: RunnableConfig) -> AgentState:
+    """
+    Check the input with LlamaGuard while the model already generates a response.
+
+    The model's output is held back until the input is found safe, so unsafe input still
+    never gets a response; the guard's latency is hidden behind the model's instead of
+    being added to it.
+    """
+    m = get_model(config["configurable"].get("model", settings.DEFAULT_MODEL))
+    llama_guard = get_llama_guard()
+    input_check = asyncio.ensure_future(llama_guard.ainvoke("User", state["messages"]))
+
+    async def input_is_safe() -> bool:
+        safety_output = await input_check
+        return safety_output.safety_assessment != SafetyAssessment.UNSAFE
+
+    gate = asyncio.ensure_future(input_is_safe())
+    # Summarizing older messages is an LLM call as well, so it also runs alongside the
+    # guard, and is abandoned as soon as the input turns out to be unsafe
+    summary = asyncio.ensure_future(
+        asummarize_context(state, m, [SystemMessage(content=instructions)])
+    )
+    try:
+        await asyncio.wait([summary, gate], return_when=asyncio.FIRST_COMPLETED)
+        if gate.done() and not gate.result():
+            raise GateClosedError("Gate closed, discarding the context summary")
+        context = await summary
+        gated = GatedChatModel(model=m, gate=gate)
+        result = {**context, **await _call_model({**state, **context}, config, gated)}
+    except GateClosedError:
+        safety_output = input_check.result()
+        return {"messages": [format_safety_message(safety_output)], "safety": safety_output}
+    finally:
+        summary.cancel()
+        gate.cancel()
+        input_check.cancel()
+        await asyncio.gather(summary, return_exceptions=True)
+    return {"safety": input_check.result(), **result}
+
+
 async def block_unsafe_content(state: AgentState, config: RunnableConfig) -> AgentState:
     safety: LlamaGuardOutput = state["safety"]
     return {"messages": [format_safety_message(safety)]}
@@ -109,7 +158,11 @@ agent.add_node("model", acall_model)
 agent.add_node("tools", ToolNode(tools))
 agent.add_node("guard_input", llama_guard_input)
 agent.add_node("block_unsafe_content", block_unsafe_content)
-agent.set_entry_point("guard_input")
+agent.add_node("speculative_model", acall_model_speculative)
+if settings.LLAMA_GUARD_SPECULATIVE:
+    agent.set_entry_point("speculative_model")
+else:
+    agent.set_entry_point("guard_input")
 
 
 # Check for unsafe input and block further processing if found
@@ -144,5 +197,9 @@ def pending_tool_calls(state: AgentState) -> Literal["tools", "done"]:
 
 
 agent.add_conditional_edges("model", pending_tool_calls, {"tools": "tools", "done": END})
+# The speculative path has already answered with a safety message if the input was unsafe
+agent.add_conditional_edges(
+    "speculative_model", pending_tool_calls, {"tools": "tools", "done": END}
+)
 
 research_assistant = agent.compile(checkpointer=MemorySaver())
@@ -1,11 +1,23 @@
+import asyncio
+from collections.abc import AsyncIterator, Callable, Sequence
 from typing import Any
 
-from langchain_core.callbacks import adispatch_custom_event
-from langchain_core.messages import ChatMessage
-from langchain_core.runnables import RunnableConfig
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+    adispatch_custom_event,
+)
+from langchain_core.language_models import LanguageModelInput
+from langchain_core.language_models.chat_models import BaseChatModel, agenerate_from_stream
+from langchain_core.messages import BaseMessage, ChatMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableConfig
 from langchain_core.runnables.config import merge_configs
+from langchain_core.tools import BaseTool
 from pydantic import BaseModel, Field
 
+from core.routing import to_generation_chunk
+
 
 class CustomData(BaseModel):
     "Custom data being sent by an agent"
@@ -28,3 +40,103 @@ class CustomData(BaseModel):
             data=self.to_langchain(),
             config=merge_configs(config, dispatch_config),
         )
+
+
+class GateClosedError(Exception):
+    """Raised by GatedChatModel when its gate resolves to False."""
+
+
+class GatedChatModel(BaseChatModel):
+    """
+    Chat model that starts the wrapped model right away but holds back its output.
+
+    Chunks from the wrapped model are buffered until `gate` resolves. If it resolves to
+    True, the buffer is flushed and the rest of the response streams through as usual.
+    If it resolves to False, the wrapped call is cancelled and GateClosedError is raised
+    without any output having been emitted.
+
+    Sync calls run the wrapped model to completion and then block on the gate, so they
+    must not be made from the event loop the gate belongs to.
+    """
+
+    model: Runnable[LanguageModelInput, BaseMessage]
+    gate: asyncio.Future
+
+    @property
+    def _llm_type(self) -> str:
+        return "gated"
+
+    def bind_tools(
+        self,
+        tools: Sequence[dict[str, Any] | type | Callable | BaseTool],
+        **kwargs: Any,
+    ) -> Runnable[LanguageModelInput, BaseMessage]:
+        return self.model_copy(update={"model": self.model.bind_tools(tools, **kwargs)})
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        config = RunnableConfig(callbacks=[])
+        message = self.model.invoke(messages, config, stop=stop, **kwargs)
+        if not self._wait_for_gate():
+            raise GateClosedError("Gate closed, discarding model output")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _wait_for_gate(self) -> bool:
+        loop = self.gate.get_loop()
+        if not self.gate.done():
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                raise RuntimeError("Can't block on the gate inside its own event loop")
+            asyncio.run_coroutine_threadsafe(asyncio.wait([self.gate]), loop).result()
+        return self.gate.result()
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await agenerate_from_stream(
+            self._astream(messages, stop=stop, run_manager=run_manager, **kwargs)
+        )
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        buffer: asyncio.Queue[BaseMessage | Exception | None] = asyncio.Queue()
+
+        async def produce() -> None:
+            try:
+                # Isolated callbacks: tokens must only be reported once they are let through
+                config = RunnableConfig(callbacks=[])
+                async for chunk in self.model.astream(messages, config, stop=stop, **kwargs):
+                    buffer.put_nowait(chunk)
+            except Exception as e:
+                buffer.put_nowait(e)
+            else:
+                buffer.put_nowait(None)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            if not await self.gate:
+                raise GateClosedError("Gate closed, discarding model output")
+            while (item := await buffer.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield to_generation_chunk(item)
+        finally:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
@@ -0,0 +1,73 @@
+"""
+Micro-benchmark for the SSE frames written by the /stream endpoint.
+
+Compares the original str-based encoding (a dict passed to json.dumps for every frame)
+with service.sse. Run from the src directory:
+
+    python -m benchmarks.sse_encoding
+"""
+
+import argparse
+import json
+import time
+from collections.abc import Callable
+
+from schema import ChatMessage
+from service import sse
+
+TOKEN = " weather"
+MESSAGE = ChatMessage(
+    type="ai",
+    content="The weather in Tokyo is sunny, with a high of 24 degrees. " * 4,
+    tool_calls=[
+        {"name": "Weather", "args": {"city": "Tokyo"}, "id": "call_1", "type": "tool_call"}
+    ],
+    run_id="847c6285-8fc9-4560-a83f-4e6285809254",
+    response_metadata={"model_name": "gpt-4o-mini", "finish_reason": "stop"},
+)
+
+
+def legacy_token(content: str) -> bytes:
+    return f"data: {json.dumps({'type': 'token', 'content': content})}\n\n".encode()
+
+
+def legacy_message(message: ChatMessage) -> bytes:
+    frame = json.dumps({"type": "message", "content": message.model_dump()})
+    return f"data: {frame}\n\n".encode()
+
+
+def events_per_second(encode: Callable[[], bytes], duration: float) -> float:
+    count = 0
+    started = time.perf_counter()
+    deadline = started + duration
+    while time.perf_counter() < deadline:
+        for _ in range(1000):
+            encode()
+        count += 1000
+    return count / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--duration", type=float, default=1.0, help="Seconds per measurement")
+    args = parser.parse_args()
+
+    # The legacy path encoded str frames, StreamingResponse then encoded them to bytes;
+    # that final encode is included above so both sides produce the bytes that are sent.
+    cases = {
+        "token": (lambda: legacy_token(TOKEN), lambda: sse.encode_token(TOKEN)),
+        "message": (lambda: legacy_message(MESSAGE), lambda: sse.encode_message(MESSAGE)),
+    }
+    print(f"orjson: {'yes' if sse.orjson is not None else 'no'}")
+    print(f"{'event':<10}{'before/s':>14}{'after/s':>14}{'speedup':>10}")
+    for name, (before, after) in cases.items():
+        assert json.loads(before()[6:]) == json.loads(after()[6:])
+        before_rate = events_per_second(before, args.duration)
+        after_rate = events_per_second(after, args.duration)
+        print(
+            f"{name:<10}{before_rate:>14,.0f}{after_rate:>14,.0f}{after_rate / before_rate:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
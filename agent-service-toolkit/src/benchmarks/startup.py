@@ -0,0 +1,71 @@
+"""
+Startup-time benchmark for the agent service.
+
+Measures, each in a fresh interpreter, how long it takes to import the service, and what
+building each agent graph and importing the provider SDKs adds on top of that. The service
+used to do all of it at import time; now agents are built on first use or as listed in
+PRELOAD_AGENTS, and a provider SDK is imported with its first model. Run from the src
+directory:
+
+    python -m benchmarks.startup
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+from agents.agents import agents
+
+PROVIDERS = [
+    "langchain_openai",
+    "langchain_anthropic",
+    "langchain_google_genai",
+    "langchain_groq",
+    "langchain_aws",
+    "langchain_ollama",
+]
+
+_TIMED = """
+import time
+started = time.perf_counter()
+{code}
+print(time.perf_counter() - started)
+"""
+
+
+def timed(code: str, setup: str = "") -> float:
+    """Seconds the code takes in a fresh interpreter, after running setup."""
+    script = setup + _TIMED.format(code=code)
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def median_time(code: str, setup: str = "", runs: int = 3) -> float | None:
+    try:
+        return statistics.median(timed(code, setup) for _ in range(runs))
+    except subprocess.CalledProcessError:
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=3, help="Runs per measurement")
+    args = parser.parse_args()
+
+    service = "import service\nfrom agents import get_agent\n"
+    cases = {"import service": ("import service", "")}
+    for agent_id in agents:
+        cases[f"+ build {agent_id}"] = (f"get_agent({agent_id!r})", service)
+    cases["+ import provider SDKs"] = ("\n".join(f"import {p}" for p in PROVIDERS), service)
+
+    print(f"{'step':<36}{'seconds':>10}")
+    for name, (code, setup) in cases.items():
+        seconds = median_time(code, setup, args.runs)
+        print(f"{name:<36}{'failed' if seconds is None else f'{seconds:.3f}':>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,24 @@
+import asyncio
+import itertools
 import json
 import os
+import random
+import socket
+import threading
+import time
 from collections.abc import AsyncGenerator, Generator
-from typing import Any
+from contextlib import asynccontextmanager, suppress
+from email.utils import parsedate_to_datetime
+from types import TracebackType
+from typing import Any, Self
+from uuid import uuid4
 
 import httpx
 
 from schema import (
+    BatchInput,
+    BatchOutput,
+    BatchResult,
     ChatHistory,
     ChatHistoryInput,
     ChatMessage,
@@ -15,11 +28,143 @@ from schema import (
     UserInput,
 )
 
+# Responses of a service that is overloaded right now, the request may succeed later
+RETRY_STATUS_CODES = (429, 503)
+
 
 class AgentClientError(Exception):
     pass
 
 
+def _shutdown_connections(aclient: httpx.AsyncClient) -> None:
+    """
+    Shut down the connections of an async pool whose event loop was closed (e.g. by the
+    asyncio.run() of a Streamlit rerun), so aclose() can no longer close them. The server
+    sees them close right away, their file descriptors are freed when they are collected.
+    """
+    pool = getattr(aclient._transport, "_pool", None)
+    for connection in getattr(pool, "connections", []):
+        stream = getattr(getattr(connection, "_connection", None), "_network_stream", None)
+        sock = stream.get_extra_info("socket") if stream is not None else None
+        if sock is not None:
+            with suppress(OSError):
+                sock.shutdown(socket.SHUT_RDWR)
+
+
+def _parse_retry_after(value: str | None) -> float:
+    """Seconds to wait from a Retry-After header, given in seconds or as an HTTP date."""
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class AgentSession:
+    """
+    A WebSocket session with the agent service, created by AgentClient.connect().
+
+    Streams started with astream() share the session's connection and may run concurrently.
+    """
+
+    def __init__(self, connection: Any) -> None:
+        self._connection = connection
+        self._runs: dict[str, asyncio.Queue[dict[str, Any] | None]] = {}
+        self._closed = False
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self) -> None:
+        try:
+            async for raw in self._connection:
+                event = json.loads(raw)
+                if queue := self._runs.get(event.get("id")):
+                    queue.put_nowait(event)
+        except Exception:
+            pass
+        finally:
+            # Wake up every waiting stream, the connection is gone
+            self._closed = True
+            for queue in self._runs.values():
+                queue.put_nowait(None)
+
+    async def aclose(self) -> None:
+        self._reader.cancel()
+        await asyncio.gather(self._reader, return_exceptions=True)
+
+    async def astream(
+        self,
+        message: str,
+        model: str | None = None,
+        thread_id: str | None = None,
+        agent_config: dict[str, Any] | None = None,
+        stream_tokens: bool = True,
+        coalesce_tokens: bool = False,
+    ) -> AsyncGenerator[ChatMessage | str, None]:
+        """
+        Stream the agent's response over the session's connection.
+
+        Yields the same messages and tokens as AgentClient.astream(). Closing the generator
+        before the run finishes cancels the run in the service.
+
+        Args:
+            message (str): The message to send to the agent
+            model (str, optional): LLM model to use for the agent
+            thread_id (str, optional): Thread ID for continuing a conversation
+            agent_config (dict[str, Any], optional): Additional configuration to pass through to the agent
+            stream_tokens (bool, optional): Stream tokens as they are generated
+                Default: True
+            coalesce_tokens (bool, optional): Have the service join tokens into fewer,
+                larger chunks. Default: False
+
+        Returns:
+            AsyncGenerator[ChatMessage | str, None]: The response from the agent
+        """
+        if self._closed:
+            raise AgentClientError("Error: session is closed")
+        request = StreamInput(
+            message=message, stream_tokens=stream_tokens, coalesce_tokens=coalesce_tokens
+        )
+        if thread_id:
+            request.thread_id = thread_id
+        if model:
+            request.model = model
+        if agent_config:
+            request.agent_config = agent_config
+        run_id = uuid4().hex
+        queue: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue()
+        self._runs[run_id] = queue
+        finished = False
+        try:
+            frame = {"type": "run", "id": run_id, "input": request.model_dump()}
+            await self._connection.send(json.dumps(frame))
+            while True:
+                event = await queue.get()
+                if event is None:
+                    raise AgentClientError("Error: session connection closed")
+                match event["type"]:
+                    case "message":
+                        try:
+                            yield ChatMessage.model_validate(event["content"])
+                        except Exception as e:
+                            raise Exception(f"Server returned invalid message: {e}")
+                    case "token":
+                        yield event["content"]
+                    case "error":
+                        raise AgentClientError(event["content"])
+                    case "end" | "cancelled":
+                        finished = True
+                        return
+        finally:
+            del self._runs[run_id]
+            if not finished and not self._closed:
+                await self._connection.send(json.dumps({"type": "cancel", "id": run_id}))
+
+
 class AgentClient:
     """Client for interacting with the agent service."""
 
@@ -29,20 +174,55 @@ class AgentClient:
         agent: str = None,
         timeout: float | None = None,
         get_info: bool = True,
+        http2: bool = False,
+        max_connections: int | None = 100,
+        max_keepalive_connections: int | None = 20,
+        keepalive_expiry: float | None = 5.0,
+        max_stream_reconnects: int = 3,
+        max_retries: int = 3,
     ) -> None:
         """
         Initialize the client.
 
+        The client owns a sync and an async connection pool, created lazily on first use,
+        so consecutive requests reuse keep-alive connections instead of paying a new TCP/TLS
+        handshake per call. Use the client as a (async) context manager, or call
+        close()/aclose(), to release the pooled connections.
+
         Args:
             base_url (str): The base URL of the agent service.
             agent (str): The name of the default agent to use.
             timeout (float, optional): The timeout for requests.
             get_info (bool, optional): Whether to fetch agent information on init.
                 Default: True
+            http2 (bool, optional): Negotiate HTTP/2 when the server supports it.
+                Requires the `h2` package (`pip install httpx[http2]`). Default: False
+            max_connections (int, optional): Maximum number of pooled connections.
+                Default: 100
+            max_keepalive_connections (int, optional): Maximum number of idle keep-alive
+                connections kept in each pool. Default: 20
+            keepalive_expiry (float, optional): Seconds an idle connection is kept alive.
+                Default: 5.0
+            max_stream_reconnects (int, optional): How often stream()/astream() reconnect
+                and resume a stream after its connection drops. Default: 3
+            max_retries (int, optional): How often a request the service rejected as
+                overloaded (503 or 429) is retried, after the delay in its Retry-After
+                header or an exponential backoff, whichever is longer. Default: 3
         """
         self.base_url = base_url
         self.auth_secret = os.getenv("AUTH_SECRET")
         self.timeout = timeout
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.max_stream_reconnects = max_stream_reconnects
+        self.max_retries = max_retries
+        self._client: httpx.Client | None = None
+        self._aclient: httpx.AsyncClient | None = None
+        self._aclient_loop: asyncio.AbstractEventLoop | None = None
         self.info: ServiceMetadata | None = None
         self.agent: str | None = None
         if get_info:
@@ -50,6 +230,84 @@ class AgentClient:
         if agent:
             self.update_agent(agent)
 
+    @property
+    def client(self) -> httpx.Client:
+        """The pooled sync HTTP client, created on first use."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.Client(http2=self.http2, limits=self.limits)
+        return self._client
+
+    @property
+    def aclient(self) -> httpx.AsyncClient:
+        """
+        The pooled async HTTP client, created on first use.
+
+        Connections in an async pool are bound to the event loop that opened them, so a new
+        pool is created if the client is used from a different loop (e.g. Streamlit calls
+        asyncio.run() on every rerun).
+        """
+        loop = asyncio.get_running_loop()
+        if self._aclient is not None and self._aclient_loop is not loop:
+            self._discard_aclient()
+        if self._aclient is None or self._aclient.is_closed:
+            self._aclient = httpx.AsyncClient(http2=self.http2, limits=self.limits)
+            self._aclient_loop = loop
+        return self._aclient
+
+    def _discard_aclient(self) -> None:
+        """Close the async pool of another event loop, which can't be awaited from this one."""
+        aclient, loop = self._aclient, self._aclient_loop
+        self._aclient = self._aclient_loop = None
+        if aclient is None or aclient.is_closed or loop is None:
+            return
+        if loop.is_running():
+            # The loop runs in another thread, close the pool there
+            asyncio.run_coroutine_threadsafe(aclient.aclose(), loop)
+        elif not loop.is_closed():
+            closing = threading.Thread(target=loop.run_until_complete, args=(aclient.aclose(),))
+            closing.start()
+            closing.join()
+        else:
+            _shutdown_connections(aclient)
+
+    def close(self) -> None:
+        """Close the sync connection pool."""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self) -> None:
+        """Close both the async and the sync connection pools."""
+        if self._aclient is not None:
+            if self._aclient_loop is asyncio.get_running_loop():
+                await self._aclient.aclose()
+                self._aclient = self._aclient_loop = None
+            else:
+                self._discard_aclient()
+        self.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        await self.aclose()
+
     @property
     def _headers(self) -> dict[str, str]:
         headers = {}
@@ -57,9 +315,38 @@ class AgentClient:
             headers["Authorization"] = f"Bearer {self.auth_secret}"
         return headers
 
+    def _retry_delay(self, response: httpx.Response, attempt: int) -> float | None:
+        """Seconds to wait before retrying a request the service rejected, None to not retry."""
+        if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+            return None
+        backoff = min(0.5 * 2**attempt, 30.0)
+        delay = max(backoff, _parse_retry_after(response.headers.get("Retry-After")))
+        # Jitter keeps clients rejected together from retrying together
+        return delay * random.uniform(1.0, 1.2)
+
+    def _post(self, path: str, json: dict[str, Any]) -> httpx.Response:
+        for attempt in itertools.count():
+            response = self.client.post(
+                f"{self.base_url}{path}", json=json, headers=self._headers, timeout=self.timeout
+            )
+            if (delay := self._retry_delay(response, attempt)) is None:
+                response.raise_for_status()
+                return response
+            time.sleep(delay)
+
+    async def _apost(self, path: str, json: dict[str, Any]) -> httpx.Response:
+        for attempt in itertools.count():
+            response = await self.aclient.post(
+                f"{self.base_url}{path}", json=json, headers=self._headers, timeout=self.timeout
+            )
+            if (delay := self._retry_delay(response, attempt)) is None:
+                response.raise_for_status()
+                return response
+            await asyncio.sleep(delay)
+
     def retrieve_info(self) -> None:
         try:
-            response = httpx.get(
+            response = self.client.get(
                 f"{self.base_url}/info",
                 headers=self._headers,
                 timeout=self.timeout,
@@ -111,17 +398,10 @@ class AgentClient:
             request.model = model
         if agent_config:
             request.agent_config = agent_config
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/{self.agent}/invoke",
-                    json=request.model_dump(),
-                    headers=self._headers,
-                    timeout=self.timeout,
-                )
-                response.raise_for_status()
-            except httpx.HTTPError as e:
-                raise AgentClientError(f"Error: {e}")
+        try:
+            response = await self._apost(f"/{self.agent}/invoke", request.model_dump())
+        except httpx.HTTPError as e:
+            raise AgentClientError(f"Error: {e}")
 
         return ChatMessage.model_validate(response.json())
 
@@ -154,18 +434,105 @@ class AgentClient:
         if agent_config:
             request.agent_config = agent_config
         try:
-            response = httpx.post(
-                f"{self.base_url}/{self.agent}/invoke",
-                json=request.model_dump(),
-                headers=self._headers,
-                timeout=self.timeout,
-            )
-            response.raise_for_status()
+            response = self._post(f"/{self.agent}/invoke", request.model_dump())
         except httpx.HTTPError as e:
             raise AgentClientError(f"Error: {e}")
 
         return ChatMessage.model_validate(response.json())
 
+    def _batch_request(
+        self,
+        inputs: list[str | UserInput],
+        model: str | None,
+        agent_config: dict[str, Any] | None,
+        max_concurrency: int | None,
+    ) -> BatchInput:
+        if not self.agent:
+            raise AgentClientError("No agent selected. Use update_agent() to select an agent.")
+        user_inputs = []
+        for item in inputs:
+            if isinstance(item, str):
+                item = UserInput(message=item)
+                if model:
+                    item.model = model
+                if agent_config:
+                    item.agent_config = agent_config
+            user_inputs.append(item)
+        return BatchInput(inputs=user_inputs, max_concurrency=max_concurrency)
+
+    async def abatch(
+        self,
+        inputs: list[str | UserInput],
+        model: str | None = None,
+        agent_config: dict[str, Any] | None = None,
+        max_concurrency: int | None = None,
+    ) -> list[BatchResult]:
+        """
+        Invoke the agent asynchronously with many inputs in a single request.
+
+        The service runs the inputs concurrently. Results are returned in input order,
+        and an input that fails has its error set instead of failing the whole batch.
+
+        Args:
+            inputs (list[str | UserInput]): Messages or full user inputs to send to the agent,
+                at most 100. Inputs with the same thread_id run one after another.
+            model (str, optional): LLM model to use for inputs given as plain messages
+            agent_config (dict[str, Any], optional): Additional configuration to pass through
+                to the agent for inputs given as plain messages
+            max_concurrency (int, optional): Maximum number of inputs run at the same time
+
+        Returns:
+            list[BatchResult]: The result for each input
+        """
+        request = self._batch_request(inputs, model, agent_config, max_concurrency)
+        try:
+            response = await self._apost(f"/{self.agent}/batch", request.model_dump())
+        except httpx.HTTPError as e:
+            raise AgentClientError(f"Error: {e}")
+
+        return BatchOutput.model_validate(response.json()).results
+
+    def batch(
+        self,
+        inputs: list[str | UserInput],
+        model: str | None = None,
+        agent_config: dict[str, Any] | None = None,
+        max_concurrency: int | None = None,
+    ) -> list[BatchResult]:
+        """
+        Invoke the agent synchronously with many inputs in a single request.
+
+        The service runs the inputs concurrently. Results are returned in input order,
+        and an input that fails has its error set instead of failing the whole batch.
+
+        Args:
+            inputs (list[str | UserInput]): Messages or full user inputs to send to the agent,
+                at most 100. Inputs with the same thread_id run one after another.
+            model (str, optional): LLM model to use for inputs given as plain messages
+            agent_config (dict[str, Any], optional): Additional configuration to pass through
+                to the agent for inputs given as plain messages
+            max_concurrency (int, optional): Maximum number of inputs run at the same time
+
+        Returns:
+            list[BatchResult]: The result for each input
+        """
+        request = self._batch_request(inputs, model, agent_config, max_concurrency)
+        try:
+            response = self._post(f"/{self.agent}/batch", request.model_dump())
+        except httpx.HTTPError as e:
+            raise AgentClientError(f"Error: {e}")
+
+        return BatchOutput.model_validate(response.json()).results
+
+    def _stream_headers(self, last_event_id: str | None) -> dict[str, str]:
+        if last_event_id is None:
+            return self._headers
+        return {**self._headers, "Last-Event-ID": last_event_id}
+
+    @staticmethod
+    def _reconnect_delay(attempt: int) -> float:
+        return 0.5 * attempt
+
     def _parse_stream_line(self, line: str) -> ChatMessage | str | None:
         line = line.strip()
         if line.startswith("data: "):
@@ -197,6 +564,7 @@ class AgentClient:
         thread_id: str | None = None,
         agent_config: dict[str, Any] | None = None,
         stream_tokens: bool = True,
+        coalesce_tokens: bool = False,
     ) -> Generator[ChatMessage | str, None, None]:
         """
         Stream the agent's response synchronously.
@@ -205,6 +573,9 @@ class AgentClient:
         If stream_tokens is True (the default value), the response will also yield
         content tokens from streaming models as they are generated.
 
+        If the connection drops mid-stream, the client reconnects and resumes the stream
+        after the last event it received, up to max_stream_reconnects times.
+
         Args:
             message (str): The message to send to the agent
             model (str, optional): LLM model to use for the agent
@@ -212,36 +583,66 @@ class AgentClient:
             agent_config (dict[str, Any], optional): Additional configuration to pass through to the agent
             stream_tokens (bool, optional): Stream tokens as they are generated
                 Default: True
+            coalesce_tokens (bool, optional): Have the service join tokens into fewer,
+                larger chunks. Default: False
 
         Returns:
             Generator[ChatMessage | str, None, None]: The response from the agent
         """
         if not self.agent:
             raise AgentClientError("No agent selected. Use update_agent() to select an agent.")
-        request = StreamInput(message=message, stream_tokens=stream_tokens)
+        request = StreamInput(
+            message=message, stream_tokens=stream_tokens, coalesce_tokens=coalesce_tokens
+        )
         if thread_id:
             request.thread_id = thread_id
         if model:
             request.model = model
         if agent_config:
             request.agent_config = agent_config
-        try:
-            with httpx.stream(
-                "POST",
-                f"{self.base_url}/{self.agent}/stream",
-                json=request.model_dump(),
-                headers=self._headers,
-                timeout=self.timeout,
-            ) as response:
-                response.raise_for_status()
-                for line in response.iter_lines():
-                    if line.strip():
-                        parsed = self._parse_stream_line(line)
-                        if parsed is None:
-                            break
-                        yield parsed
-        except httpx.HTTPError as e:
-            raise AgentClientError(f"Error: {e}")
+        last_event_id = None
+        reconnects = retries = 0
+        while True:
+            retry_delay = None
+            try:
+                with self.client.stream(
+                    "POST",
+                    f"{self.base_url}/{self.agent}/stream",
+                    json=request.model_dump(),
+                    headers=self._stream_headers(last_event_id),
+                    timeout=self.timeout,
+                ) as response:
+                    # Only starting a run can be rejected as overloaded, resuming it can't
+                    if last_event_id is None:
+                        retry_delay = self._retry_delay(response, retries)
+                    if retry_delay is None:
+                        response.raise_for_status()
+                        for line in response.iter_lines():
+                            if line.startswith("id: "):
+                                last_event_id = line[4:].strip()
+                            elif line.strip():
+                                parsed = self._parse_stream_line(line)
+                                if parsed is None:
+                                    return
+                                yield parsed
+            except httpx.TransportError as e:
+                if last_event_id is None:
+                    raise AgentClientError(f"Error: {e}")
+            except httpx.HTTPError as e:
+                raise AgentClientError(f"Error: {e}")
+            if retry_delay is not None:
+                retries += 1
+                time.sleep(retry_delay)
+                continue
+            # The connection dropped before [DONE]; resume the stream if it can be resumed
+            if last_event_id is None:
+                return
+            reconnects += 1
+            if reconnects > self.max_stream_reconnects:
+                raise AgentClientError(
+                    "Error: stream connection lost, reconnect attempts exhausted"
+                )
+            time.sleep(self._reconnect_delay(reconnects))
 
     async def astream(
         self,
@@ -250,6 +651,7 @@ class AgentClient:
         thread_id: str | None = None,
         agent_config: dict[str, Any] | None = None,
         stream_tokens: bool = True,
+        coalesce_tokens: bool = False,
     ) -> AsyncGenerator[ChatMessage | str, None]:
         """
         Stream the agent's response asynchronously.
@@ -258,6 +660,9 @@ class AgentClient:
         If stream_tokens is True (the default value), the response will also yield
         content tokens from streaming modelsas they are generated.
 
+        If the connection drops mid-stream, the client reconnects and resumes the stream
+        after the last event it received, up to max_stream_reconnects times.
+
         Args:
             message (str): The message to send to the agent
             model (str, optional): LLM model to use for the agent
@@ -265,37 +670,100 @@ class AgentClient:
             agent_config (dict[str, Any], optional): Additional configuration to pass through to the agent
             stream_tokens (bool, optional): Stream tokens as they are generated
                 Default: True
+            coalesce_tokens (bool, optional): Have the service join tokens into fewer,
+                larger chunks. Default: False
 
         Returns:
             AsyncGenerator[ChatMessage | str, None]: The response from the agent
         """
         if not self.agent:
             raise AgentClientError("No agent selected. Use update_agent() to select an agent.")
-        request = StreamInput(message=message, stream_tokens=stream_tokens)
+        request = StreamInput(
+            message=message, stream_tokens=stream_tokens, coalesce_tokens=coalesce_tokens
+        )
         if thread_id:
             request.thread_id = thread_id
         if model:
             request.model = model
         if agent_config:
             request.agent_config = agent_config
-        async with httpx.AsyncClient() as client:
+        last_event_id = None
+        reconnects = retries = 0
+        while True:
+            retry_delay = None
             try:
-                async with client.stream(
+                async with self.aclient.stream(
                     "POST",
                     f"{self.base_url}/{self.agent}/stream",
                     json=request.model_dump(),
-                    headers=self._headers,
+                    headers=self._stream_headers(last_event_id),
                     timeout=self.timeout,
                 ) as response:
-                    response.raise_for_status()
-                    async for line in response.aiter_lines():
-                        if line.strip():
-                            parsed = self._parse_stream_line(line)
-                            if parsed is None:
-                                break
-                            yield parsed
+                    # Only starting a run can be rejected as overloaded, resuming it can't
+                    if last_event_id is None:
+                        retry_delay = self._retry_delay(response, retries)
+                    if retry_delay is None:
+                        response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if line.startswith("id: "):
+                                last_event_id = line[4:].strip()
+                            elif line.strip():
+                                parsed = self._parse_stream_line(line)
+                                if parsed is None:
+                                    return
+                                yield parsed
+            except httpx.TransportError as e:
+                if last_event_id is None:
+                    raise AgentClientError(f"Error: {e}")
             except httpx.HTTPError as e:
                 raise AgentClientError(f"Error: {e}")
+            if retry_delay is not None:
+                retries += 1
+                await asyncio.sleep(retry_delay)
+                continue
+            # The connection dropped before [DONE]; resume the stream if it can be resumed
+            if last_event_id is None:
+                return
+            reconnects += 1
+            if reconnects > self.max_stream_reconnects:
+                raise AgentClientError(
+                    "Error: stream connection lost, reconnect attempts exhausted"
+                )
+            await asyncio.sleep(self._reconnect_delay(reconnects))
+
+    @asynccontextmanager
+    async def connect(self) -> AsyncGenerator[AgentSession, None]:
+        """
+        Open a WebSocket session with the current agent.
+
+        The session authenticates once and runs any number of streams, also concurrently,
+        over one connection, which saves a request per turn in chat UIs.
+        Requires the `websockets` package (`pip install websockets`).
+
+        Example:
+            async with client.connect() as session:
+                async for event in session.astream("Hello"):
+                    ...
+        """
+        if not self.agent:
+            raise AgentClientError("No agent selected. Use update_agent() to select an agent.")
+        try:
+            from websockets.asyncio.client import connect
+            from websockets.exceptions import WebSocketException
+        except ImportError:
+            raise AgentClientError("connect() requires the websockets package")
+        url = f"{self.base_url.replace('http', 'ws', 1)}/ws/{self.agent}"
+        try:
+            async with connect(
+                url, additional_headers=self._headers, open_timeout=self.timeout
+            ) as connection:
+                session = AgentSession(connection)
+                try:
+                    yield session
+                finally:
+                    await session.aclose()
+        except (OSError, WebSocketException) as e:
+            raise AgentClientError(f"Error: {e}")
 
     async def acreate_feedback(
         self, run_id: str, key: str, score: float, kwargs: dict[str, Any] = {}
@@ -308,34 +776,44 @@ class AgentClient:
         See: https://api.smith.langchain.com/redoc#tag/feedback/operation/create_feedback_api_v1_feedback_post
         """
         request = Feedback(run_id=run_id, key=key, score=score, kwargs=kwargs)
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/feedback",
-                    json=request.model_dump(),
-                    headers=self._headers,
-                    timeout=self.timeout,
-                )
-                response.raise_for_status()
-                response.json()
-            except httpx.HTTPError as e:
-                raise AgentClientError(f"Error: {e}")
+        try:
+            response = await self.aclient.post(
+                f"{self.base_url}/feedback",
+                json=request.model_dump(),
+                headers=self._headers,
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            response.json()
+        except httpx.HTTPError as e:
+            raise AgentClientError(f"Error: {e}")
+
+    def _history_request(
+        self, thread_id: str, limit: int | None, before: str | None
+    ) -> tuple[str, dict[str, Any]]:
+        url = f"{self.base_url}/{self.agent}/history" if self.agent else f"{self.base_url}/history"
+        request = ChatHistoryInput(thread_id=thread_id, limit=limit, before=before)
+        return url, request.model_dump()
 
     def get_history(
         self,
         thread_id: str,
+        limit: int | None = None,
+        before: str | None = None,
     ) -> ChatHistory:
         """
         Get chat history.
 
         Args:
             thread_id (str, optional): Thread ID for identifying a conversation
+            limit (int, optional): Maximum number of (latest) messages to return
+            before (str, optional): next_cursor of a previous page, to get the page before it
         """
-        request = ChatHistoryInput(thread_id=thread_id)
+        url, request = self._history_request(thread_id, limit, before)
         try:
-            response = httpx.post(
-                f"{self.base_url}/history",
-                json=request.model_dump(),
+            response = self.client.post(
+                url,
+                json=request,
                 headers=self._headers,
                 timeout=self.timeout,
             )
@@ -344,3 +822,73 @@ class AgentClient:
             raise AgentClientError(f"Error: {e}")
 
         return ChatHistory.model_validate(response.json())
+
+    async def aget_history(
+        self,
+        thread_id: str,
+        limit: int | None = None,
+        before: str | None = None,
+    ) -> ChatHistory:
+        """
+        Get chat history asynchronously.
+
+        Args:
+            thread_id (str, optional): Thread ID for identifying a conversation
+            limit (int, optional): Maximum number of (latest) messages to return
+            before (str, optional): next_cursor of a previous page, to get the page before it
+        """
+        url, request = self._history_request(thread_id, limit, before)
+        try:
+            response = await self.aclient.post(
+                url,
+                json=request,
+                headers=self._headers,
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise AgentClientError(f"Error: {e}")
+
+        return ChatHistory.model_validate(response.json())
+
+    def iter_history(
+        self, thread_id: str, page_size: int = 50
+    ) -> Generator[list[ChatMessage], None, None]:
+        """
+        Iterate over the chat history one page at a time, from the newest page to the oldest.
+
+        Each page is only requested once the previous one has been consumed.
+
+        Args:
+            thread_id (str, optional): Thread ID for identifying a conversation
+            page_size (int, optional): Number of messages per page. Default: 50
+        """
+        before = None
+        while True:
+            page = self.get_history(thread_id, limit=page_size, before=before)
+            if page.messages:
+                yield page.messages
+            if page.next_cursor is None:
+                return
+            before = page.next_cursor
+
+    async def aiter_history(
+        self, thread_id: str, page_size: int = 50
+    ) -> AsyncGenerator[list[ChatMessage], None]:
+        """
+        Iterate over the chat history one page at a time, from the newest page to the oldest.
+
+        Each page is only requested once the previous one has been consumed.
+
+        Args:
+            thread_id (str, optional): Thread ID for identifying a conversation
+            page_size (int, optional): Number of messages per page. Default: 50
+        """
+        before = None
+        while True:
+            page = await self.aget_history(thread_id, limit=page_size, before=before)
+            if page.messages:
+                yield page.messages
+            if page.next_cursor is None:
+                return
+            before = page.next_cursor
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import random
+import re
+import time
+from collections.abc import AsyncIterator, Callable, Iterator, Sequence
+from typing import Any
+from uuid import uuid4
+
+from langchain_community.chat_models import FakeListChatModel
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import LanguageModelInput
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    ToolMessage,
+    message_chunk_to_message,
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable
+from langchain_core.tools import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import Field, PrivateAttr
+
+# Words of generated responses, when the response length is drawn from a range
+_FILLER = (
+    "the agent service streams this simulated response one token at a time so that offline "
+    "benchmarks see the same shape of traffic as a real provider would send"
+).split()
+
+
+class FakeModelError(RuntimeError):
+    """Error injected by FakeStreamingChatModel."""
+
+
+def _tokens(text: str) -> list[str]:
+    """Split text into word tokens that keep their trailing whitespace."""
+    return re.findall(r"\s*\S+\s*", text) or [text]
+
+
+class FakeStreamingChatModel(FakeListChatModel):
+    """
+    Fake chat model that behaves like a real provider, for offline performance testing.
+
+    Responses stream word by word, with `first_token_delay` seconds before the first token
+    and `sleep` seconds before each one after it. Non-streamed calls take as long. With
+    `response_tokens=(min, max)`, every response has a random number of tokens in that range
+    instead of the configured responses. When tools are bound and the last message is not a
+    tool result, the model calls the bound tools among `tool_calls` instead of answering, so
+    agents run their tool loop once per turn. A call fails with FakeModelError with
+    probability `error_rate`, before its first token or partway through the stream.
+    """
+
+    first_token_delay: float = 0.0
+    response_tokens: tuple[int, int] | None = None
+    # Scripted calls, e.g. [{"name": "Calculator", "args": {"expression": "2 + 2"}}]
+    tool_calls: list[dict[str, Any]] = Field(default_factory=list)
+    error_rate: float = 0.0
+    seed: int | None = None
+    _random: random.Random = PrivateAttr()
+
+    def model_post_init(self, __context: Any) -> None:
+        self._random = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming-chat-model"
+
+    def bind_tools(
+        self,
+        tools: Sequence[dict[str, Any] | type | Callable | BaseTool],
+        **kwargs: Any,
+    ) -> Runnable[LanguageModelInput, BaseMessage]:
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _next_response(self) -> str:
+        response = self.responses[self.i]
+        self.i = (self.i + 1) % len(self.responses)
+        if self.response_tokens is not None:
+            length = self._random.randint(*self.response_tokens)
+            words = [_FILLER[i % len(_FILLER)] for i in range(length)]
+            response = " ".join(words).capitalize() + "."
+        return response
+
+    def _plan(self, messages: list[BaseMessage], tools: list[dict[str, Any]] | None) -> AIMessage:
+        """The complete message the model will send for this call."""
+        bound = {tool["function"]["name"] for tool in tools or []}
+        calls = [call for call in self.tool_calls if call["name"] in bound]
+        if calls and not (messages and isinstance(messages[-1], ToolMessage)):
+            return AIMessage(
+                content="",
+                tool_calls=[
+                    {"name": c["name"], "args": c.get("args", {}), "id": f"call_{uuid4().hex}"}
+                    for c in calls
+                ],
+            )
+        return AIMessage(content=self._next_response())
+
+    def _failure_point(self, tokens: int) -> int | None:
+        """The token before which the call fails, or None if it succeeds."""
+        if self.error_rate and self._random.random() < self.error_rate:
+            return self._random.randint(0, tokens - 1)
+        return None
+
+    def _usage(self, messages: list[BaseMessage], output_tokens: int) -> dict[str, int]:
+        input_tokens = sum(len(_tokens(str(m.content))) for m in messages)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+
+    def _chunks(
+        self, messages: list[BaseMessage], tools: list[dict[str, Any]] | None
+    ) -> tuple[list[AIMessageChunk], int | None]:
+        message = self._plan(messages, tools)
+        if message.tool_calls:
+            tool_call_chunks = [
+                {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                for i, c in enumerate(message.tool_calls)
+            ]
+            chunks = [AIMessageChunk(content="", tool_call_chunks=tool_call_chunks)]
+        else:
+            chunks = [AIMessageChunk(content=token) for token in _tokens(message.content)]
+        chunks[-1].usage_metadata = self._usage(messages, len(chunks))  # type: ignore[assignment]
+        chunks[-1].response_metadata = {"model_name": "fake"}
+        return chunks, self._failure_point(len(chunks))
+
+    def _delay(self, index: int) -> float:
+        return self.first_token_delay if index == 0 else self.sleep or 0.0
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        chunks, fail_at = self._chunks(messages, kwargs.get("tools"))
+        for i, chunk in enumerate(chunks):
+            if delay := self._delay(i):
+                time.sleep(delay)
+            if i == fail_at:
+                raise FakeModelError(f"Injected error after {i} tokens")
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        chunks, fail_at = self._chunks(messages, kwargs.get("tools"))
+        for i, chunk in enumerate(chunks):
+            if delay := self._delay(i):
+                await asyncio.sleep(delay)
+            if i == fail_at:
+                raise FakeModelError(f"Injected error after {i} tokens")
+            yield ChatGenerationChunk(message=chunk)
+
+    @staticmethod
+    def _result(chunks: list[ChatGenerationChunk]) -> ChatResult:
+        message = message_chunk_to_message(sum(chunks[1:], chunks[0]).message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # Same timing as streaming, without reporting the tokens
+        return self._result(list(self._stream(messages, stop, **kwargs)))
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return self._result([chunk async for chunk in self._astream(messages, stop, **kwargs)])
@@ -1,14 +1,9 @@
 from functools import cache
-from typing import TypeAlias
-
-from langchain_anthropic import ChatAnthropic
-from langchain_aws import ChatBedrock
-from langchain_community.chat_models import FakeListChatModel
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_groq import ChatGroq
-from langchain_ollama import ChatOllama
-from langchain_openai import ChatOpenAI
+from typing import TYPE_CHECKING, TypeAlias
 
+from core.llm_cache import get_response_cache
+from core.rate_limit import RateLimitedChatModel, get_provider_limiter, with_rate_limiter
+from core.routing import CircuitBreaker, RoutedChatModel
 from core.settings import settings
 from schema.models import (
     AllModelEnum,
@@ -20,6 +15,8 @@ from schema.models import (
     GroqModelName,
     OllamaModelName,
     OpenAIModelName,
+    Provider,
+    RoutedModelName,
 )
 
 _MODEL_TABLE = {
@@ -36,15 +33,71 @@ _MODEL_TABLE = {
     AWSModelName.BEDROCK_HAIKU: "anthropic.claude-3-5-haiku-20241022-v1:0",
     OllamaModelName.OLLAMA_GENERIC: "ollama",
     FakeModelName.FAKE: "fake",
+    RoutedModelName.ROUTED: "routed",
+}
+
+_PROVIDER_MODELS = {
+    Provider.OPENAI: OpenAIModelName,
+    Provider.DEEPSEEK: DeepseekModelName,
+    Provider.ANTHROPIC: AnthropicModelName,
+    Provider.GOOGLE: GoogleModelName,
+    Provider.GROQ: GroqModelName,
+    Provider.AWS: AWSModelName,
+    Provider.OLLAMA: OllamaModelName,
+    Provider.FAKE: FakeModelName,
 }
 
+# Provider SDKs are slow to import, so each is imported when its first model is created
+if TYPE_CHECKING:
+    from langchain_anthropic import ChatAnthropic
+    from langchain_aws import ChatBedrock
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from langchain_groq import ChatGroq
+    from langchain_ollama import ChatOllama
+    from langchain_openai import ChatOpenAI
+
 ModelT: TypeAlias = (
-    ChatOpenAI | ChatAnthropic | ChatGoogleGenerativeAI | ChatGroq | ChatBedrock | ChatOllama
+    "ChatOpenAI | ChatAnthropic | ChatGoogleGenerativeAI | ChatGroq | ChatBedrock | ChatOllama"
+    " | RoutedChatModel | RateLimitedChatModel"
 )
 
 
 @cache
 def get_model(model_name: AllModelEnum, /) -> ModelT:
+    if model_name == RoutedModelName.ROUTED:
+        return _create_routed_model()
+    model = _create_model(model_name)
+    if limiter := get_provider_limiter(get_provider(model_name)):
+        model = with_rate_limiter(model, limiter)
+    # Set on the outermost model, so cache hits don't take a rate limiter slot
+    if settings.LLM_CACHE_ENABLED:
+        model.cache = get_response_cache()
+    return model
+
+
+def _create_routed_model() -> RoutedChatModel:
+    if not settings.ROUTED_MODELS:
+        raise ValueError("ROUTED_MODELS must be set to use the routed model")
+    names = [str(m) for m in settings.ROUTED_MODELS]
+    return RoutedChatModel(
+        models=[get_model(m) for m in settings.ROUTED_MODELS],
+        model_names=names,
+        hedge_delay=settings.ROUTED_HEDGE_DELAY,
+        breakers={
+            name: CircuitBreaker(settings.ROUTED_FAILURE_THRESHOLD, settings.ROUTED_RESET_TIMEOUT)
+            for name in names
+        },
+    )
+
+
+def get_provider(model_name: AllModelEnum, /) -> Provider:
+    for provider, model_names in _PROVIDER_MODELS.items():
+        if isinstance(model_name, model_names):
+            return provider
+    raise ValueError(f"Unsupported model: {model_name}")
+
+
+def _create_model(model_name: AllModelEnum, /) -> ModelT:
     # NOTE: models with streaming=True will send tokens as they are generated
     # if the /stream endpoint is called with stream_tokens=True (the default)
     api_model_name = _MODEL_TABLE.get(model_name)
@@ -52,8 +105,12 @@ def get_model(model_name: AllModelEnum, /) -> ModelT:
         raise ValueError(f"Unsupported model: {model_name}")
 
     if model_name in OpenAIModelName:
+        from langchain_openai import ChatOpenAI
+
         return ChatOpenAI(model=api_model_name, temperature=0.5, streaming=True)
     if model_name in DeepseekModelName:
+        from langchain_openai import ChatOpenAI
+
         return ChatOpenAI(
             model=api_model_name,
             temperature=0.5,
@@ -62,16 +119,26 @@ def get_model(model_name: AllModelEnum, /) -> ModelT:
             openai_api_key=settings.DEEPSEEK_API_KEY,
         )
     if model_name in AnthropicModelName:
+        from langchain_anthropic import ChatAnthropic
+
         return ChatAnthropic(model=api_model_name, temperature=0.5, streaming=True)
     if model_name in GoogleModelName:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
         return ChatGoogleGenerativeAI(model=api_model_name, temperature=0.5, streaming=True)
     if model_name in GroqModelName:
+        from langchain_groq import ChatGroq
+
         if model_name == GroqModelName.LLAMA_GUARD_3_8B:
             return ChatGroq(model=api_model_name, temperature=0.0)
         return ChatGroq(model=api_model_name, temperature=0.5)
     if model_name in AWSModelName:
+        from langchain_aws import ChatBedrock
+
         return ChatBedrock(model_id=api_model_name, temperature=0.5)
     if model_name in OllamaModelName:
+        from langchain_ollama import ChatOllama
+
         if settings.OLLAMA_BASE_URL:
             chat_ollama = ChatOllama(
                 model=settings.OLLAMA_MODEL, temperature=0.5, base_url=settings.OLLAMA_BASE_URL
@@ -80,4 +147,13 @@ def get_model(model_name: AllModelEnum, /) -> ModelT:
             chat_ollama = ChatOllama(model=settings.OLLAMA_MODEL, temperature=0.5)
         return chat_ollama
     if model_name in FakeModelName:
-        return FakeListChatModel(responses=["This is a test response from the fake model."])
+        from core.fake_model import FakeStreamingChatModel
+
+        return FakeStreamingChatModel(
+            responses=["This is a test response from the fake model."],
+            first_token_delay=settings.FAKE_MODEL_FIRST_TOKEN_DELAY,
+            sleep=settings.FAKE_MODEL_TOKEN_DELAY or None,
+            response_tokens=settings.FAKE_MODEL_RESPONSE_TOKENS,
+            tool_calls=settings.FAKE_MODEL_TOOL_CALLS,
+            error_rate=settings.FAKE_MODEL_ERROR_RATE,
+        )
@@ -0,0 +1,296 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import warnings
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass, field
+from functools import cache
+from typing import Any
+
+import numpy as np
+from langchain_core._api import LangChainBetaWarning
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.embeddings import Embeddings
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, Generation
+
+from core.settings import settings
+
+# Evicting scans the table, so it runs at most this often, or once inserts may have grown
+# the table past max_entries by a tenth, rather than on every insert
+EVICT_INTERVAL = 60.0
+
+
+@dataclass
+class CacheStats:
+    exact_hits: int = 0
+    semantic_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    size: int = 0
+
+
+def normalize_messages(messages: Sequence[BaseMessage]) -> list[dict[str, Any]]:
+    """
+    Reduce messages to the fields that determine a model response.
+
+    Message ids, response metadata and provider-generated tool call ids differ between
+    otherwise identical conversations, so they are dropped. Tool call ids are replaced
+    by their order of appearance, which keeps tool calls and tool results paired.
+    """
+    tool_call_ids: dict[str, int] = {}
+    normalized = []
+    for message in messages:
+        item: dict[str, Any] = {"type": message.type, "content": message.content}
+        if isinstance(message, AIMessage) and message.tool_calls:
+            item["tool_calls"] = [
+                {
+                    "name": tool_call["name"],
+                    "args": tool_call["args"],
+                    "id": tool_call_ids.setdefault(tool_call["id"], len(tool_call_ids)),
+                }
+                for tool_call in message.tool_calls
+            ]
+        if tool_call_id := getattr(message, "tool_call_id", None):
+            item["tool_call_id"] = tool_call_ids.setdefault(tool_call_id, len(tool_call_ids))
+        normalized.append(item)
+    return normalized
+
+
+def _embedding_text(normalized: list[dict[str, Any]]) -> str:
+    return "\n\n".join(f"{m['type']}: {m['content']}" for m in normalized)
+
+
+def _loads(text: str) -> Any:
+    # langchain_core.load is in beta, which it warns about on every call
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", LangChainBetaWarning)
+        return loads(text)
+
+
+def _dumps(obj: Any) -> str:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", LangChainBetaWarning)
+        return dumps(obj)
+
+
+def _unit(vector: Sequence[float] | np.ndarray) -> np.ndarray:
+    """The vector scaled to length 1, so a dot product is the cosine similarity."""
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+@dataclass
+class _SemanticIndex:
+    """Unit embeddings of the cached prompts of one llm_string, searched in memory."""
+
+    keys: list[str] = field(default_factory=list)
+    created: list[float] = field(default_factory=list)
+    vectors: list[np.ndarray] = field(default_factory=list)
+    # Stacked vectors, rebuilt on the first search after an insert
+    matrix: np.ndarray | None = None
+
+    def add(self, key: str, created: float, vector: np.ndarray) -> None:
+        self.keys.append(key)
+        self.created.append(created)
+        self.vectors.append(vector)
+        self.matrix = None
+
+    def search(self, query: np.ndarray, cutoff: float, threshold: float) -> str | None:
+        """Key of the most similar prompt created after cutoff, if it reaches threshold."""
+        if not self.keys:
+            return None
+        if self.matrix is None:
+            self.matrix = np.stack(self.vectors)
+        scores = self.matrix @ query
+        scores[np.asarray(self.created) < cutoff] = -np.inf
+        best = int(np.argmax(scores))
+        return self.keys[best] if scores[best] >= threshold else None
+
+
+class SQLiteResponseCache(BaseCache):
+    """
+    Persistent LLM response cache with an exact-match and an optional semantic tier.
+
+    Entries are keyed on the model's llm_string (model name, temperature and any bound
+    tools or call kwargs) plus the normalized messages. When an embeddings model and a
+    similarity threshold are given, a miss on the exact tier falls back to the most similar
+    cached prompt for the same llm_string, searched in an in-memory index of the embeddings.
+    Entries expire after `ttl` seconds and the least recently used entries are evicted
+    beyond `max_entries`.
+    """
+
+    def __init__(
+        self,
+        path: str = "llm_cache.db",
+        ttl: float | None = 86400,
+        max_entries: int = 10000,
+        embeddings: Embeddings | None = None,
+        similarity_threshold: float | None = None,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+        # Loaded per llm_key on its first semantic lookup, and dropped when entries are evicted
+        self._indexes: dict[str, _SemanticIndex] = {}
+        self._last_evict = 0.0
+        self._inserts_since_evict = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                llm_key TEXT NOT NULL,
+                response TEXT NOT NULL,
+                embedding BLOB,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_llm_key ON llm_cache (llm_key)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)"
+        )
+        self._conn.commit()
+
+    @property
+    def semantic(self) -> bool:
+        return self.embeddings is not None and self.similarity_threshold is not None
+
+    def _keys(self, prompt: str, llm_string: str) -> tuple[str, str, list[dict[str, Any]]]:
+        normalized = normalize_messages(_loads(prompt))
+        llm_key = hashlib.sha256(llm_string.encode()).hexdigest()
+        prompt_json = json.dumps(normalized, sort_keys=True, default=str)
+        key = hashlib.sha256(f"{llm_key}\x00{prompt_json}".encode()).hexdigest()
+        return key, llm_key, normalized
+
+    def _expiry_cutoff(self, now: float) -> float:
+        return now - self.ttl if self.ttl is not None else float("-inf")
+
+    def lookup(self, prompt: str, llm_string: str) -> RETURN_VAL_TYPE | None:
+        key, llm_key, normalized = self._keys(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._row(key, now)
+            if row:
+                self._stats.exact_hits += 1
+        if not row and self.semantic:
+            # Embed outside the lock, it is usually a network call
+            query = _unit(self.embeddings.embed_query(_embedding_text(normalized)))
+            with self._lock:
+                match = self._index(llm_key).search(
+                    query, self._expiry_cutoff(now), self.similarity_threshold
+                )
+                row = self._row(match, now) if match else None
+                if row:
+                    self._stats.semantic_hits += 1
+        if not row:
+            with self._lock:
+                self._stats.misses += 1
+            return None
+        with self._lock:
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, row[0]))
+            self._conn.commit()
+        return self._load_generations(row[1])
+
+    def _row(self, key: str, now: float) -> tuple[str, str] | None:
+        return self._conn.execute(
+            "SELECT key, response FROM llm_cache WHERE key = ? AND created_at >= ?",
+            (key, self._expiry_cutoff(now)),
+        ).fetchone()
+
+    def _index(self, llm_key: str) -> _SemanticIndex:
+        index = self._indexes.get(llm_key)
+        if index is None:
+            index = self._indexes[llm_key] = _SemanticIndex()
+            rows = self._conn.execute(
+                "SELECT key, created_at, embedding FROM llm_cache "
+                "WHERE llm_key = ? AND embedding IS NOT NULL",
+                (llm_key,),
+            )
+            for key, created, blob in rows:
+                index.add(key, created, _unit(np.frombuffer(blob, dtype=np.float32)))
+        return index
+
+    @staticmethod
+    def _load_generations(response: str) -> list[Generation]:
+        generations = [_loads(g) for g in json.loads(response)]
+        for generation in generations:
+            # Cached messages must not reuse the id of the original run, or LangGraph's
+            # add_messages would treat them as an update of that earlier message.
+            if isinstance(generation, ChatGeneration):
+                generation.message.id = None
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key, llm_key, normalized = self._keys(prompt, llm_string)
+        response = json.dumps([_dumps(g) for g in return_val])
+        vector = None
+        if self.semantic:
+            vector = _unit(self.embeddings.embed_query(_embedding_text(normalized)))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, llm_key, response, None if vector is None else vector.tobytes(), now, now),
+            )
+            if vector is not None and llm_key in self._indexes:
+                self._indexes[llm_key].add(key, now, vector)
+            self._inserts_since_evict += 1
+            if (
+                self._inserts_since_evict >= max(1, self.max_entries // 10)
+                or now - self._last_evict >= EVICT_INTERVAL
+            ):
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        self._last_evict = now
+        self._inserts_since_evict = 0
+        expired = self._conn.execute(
+            "DELETE FROM llm_cache WHERE created_at < ?", (self._expiry_cutoff(now),)
+        ).rowcount
+        overflow = self._conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            "SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        self._stats.evictions += expired + overflow
+        if expired or overflow:
+            self._indexes.clear()
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+            self._indexes.clear()
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+            return CacheStats(**{**asdict(self._stats), "size": size})
+
+
+@cache
+def get_response_cache() -> SQLiteResponseCache:
+    embeddings = None
+    if settings.LLM_CACHE_SIMILARITY_THRESHOLD is not None:
+        from langchain_openai import OpenAIEmbeddings
+
+        embeddings = OpenAIEmbeddings(model=settings.LLM_CACHE_EMBEDDING_MODEL)
+    return SQLiteResponseCache(
+        path=settings.LLM_CACHE_PATH,
+        ttl=settings.LLM_CACHE_TTL,
+        max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+        embeddings=embeddings,
+        similarity_threshold=settings.LLM_CACHE_SIMILARITY_THRESHOLD,
+    )
@@ -0,0 +1,336 @@
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Callable, Iterator, Sequence
+from contextlib import suppress
+from dataclasses import dataclass
+from functools import cache
+from typing import Any
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import LangSmithParams, LanguageModelInput
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.rate_limiters import BaseRateLimiter
+from langchain_core.runnables import Runnable
+from langchain_core.tools import BaseTool
+
+from core.settings import settings
+from schema.models import Provider
+
+
+@dataclass
+class LimiterStats:
+    in_flight: int = 0
+    queue_depth: int = 0
+    requests: int = 0
+    tokens: int = 0
+    total_wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def seconds_until(self, amount: float) -> float:
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+
+class ProviderLimiter(BaseRateLimiter):
+    """
+    Concurrency cap plus request and token budgets for one LLM provider.
+
+    Callers queue in FIFO order, whether they wait from a thread or an event loop, so a
+    burst from one caller can't starve the others. The token budget is charged after a
+    call completes, from the provider's reported usage; while it is in debt, new requests
+    wait for it to refill.
+
+    Every granted slot counts as in flight until it is given back with `release()`. Models
+    wrapped with `with_rate_limiter()` do that, with the call's token usage, when the call
+    ends. Waiters are woken when a slot is released or they reach the head of the queue.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int | None = None,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._cond = threading.Condition()
+        self._queue: deque[int] = deque()
+        self._tickets = itertools.count()
+        # Event loop and event of each ticket waiting from async code
+        self._async_waiters: dict[int, tuple[asyncio.AbstractEventLoop, asyncio.Event]] = {}
+        self._stats = LimiterStats()
+
+    def _enqueue(self, waiter: tuple[asyncio.AbstractEventLoop, asyncio.Event] | None) -> int:
+        with self._cond:
+            ticket = next(self._tickets)
+            self._queue.append(ticket)
+            if waiter is not None:
+                self._async_waiters[ticket] = waiter
+            return ticket
+
+    def _dequeue(self, ticket: int) -> None:
+        with self._cond:
+            self._async_waiters.pop(ticket, None)
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                self._notify()
+
+    def _notify(self) -> None:
+        """Wake waiters after the queue or a budget changed. Call with the lock held."""
+        self._cond.notify_all()
+        # Only the head of the queue can take a slot, the others are woken once they get there
+        if self._queue and (waiter := self._async_waiters.get(self._queue[0])):
+            loop, event = waiter
+            with suppress(RuntimeError):  # The waiter's loop is already closed
+                loop.call_soon_threadsafe(event.set)
+
+    def _try_acquire(self, ticket: int) -> float | None:
+        """
+        Take a slot for ticket if it is first in line. Returns 0 once acquired, otherwise
+        the seconds until a budget refills, or None to wait until woken.
+        """
+        if self._queue[0] != ticket:
+            return None
+        if self.max_concurrency and self._stats.in_flight >= self.max_concurrency:
+            return None
+        now = time.monotonic()
+        wait = 0.0
+        if self._requests:
+            self._requests.refill(now)
+            wait = max(wait, self._requests.seconds_until(1))
+        if self._tokens:
+            self._tokens.refill(now)
+            wait = max(wait, self._tokens.seconds_until(0))
+        if wait > 0:
+            return wait
+        if self._requests:
+            self._requests.tokens -= 1
+        self._stats.in_flight += 1
+        self._queue.popleft()
+        self._async_waiters.pop(ticket, None)
+        self._notify()
+        return 0.0
+
+    def _record_wait(self, started: float) -> None:
+        waited = time.monotonic() - started
+        self._stats.requests += 1
+        self._stats.total_wait_seconds += waited
+        self._stats.max_wait_seconds = max(self._stats.max_wait_seconds, waited)
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        started = time.monotonic()
+        ticket = self._enqueue(None)
+        with self._cond:
+            try:
+                while (wait := self._try_acquire(ticket)) != 0:
+                    if not blocking:
+                        self._dequeue(ticket)
+                        return False
+                    self._cond.wait(wait)
+            except BaseException:
+                self._dequeue(ticket)
+                raise
+            self._record_wait(started)
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        started = time.monotonic()
+        event = asyncio.Event()
+        ticket = self._enqueue((asyncio.get_running_loop(), event))
+        try:
+            while True:
+                with self._cond:
+                    # Cleared under the lock, so a wakeup after this check is never lost
+                    event.clear()
+                    wait = self._try_acquire(ticket)
+                    if wait == 0:
+                        self._record_wait(started)
+                        return True
+                if not blocking:
+                    self._dequeue(ticket)
+                    return False
+                with suppress(TimeoutError):
+                    await asyncio.wait_for(event.wait(), wait)
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+
+    def release(self, tokens: int = 0) -> None:
+        """Give back a concurrency slot and charge the tokens the call used."""
+        with self._cond:
+            self._stats.in_flight -= 1
+            self._stats.tokens += tokens
+            if self._tokens:
+                self._tokens.refill(time.monotonic())
+                self._tokens.tokens -= tokens
+            self._notify()
+
+    def stats(self) -> LimiterStats:
+        with self._cond:
+            return LimiterStats(
+                in_flight=self._stats.in_flight,
+                queue_depth=len(self._queue),
+                requests=self._stats.requests,
+                tokens=self._stats.tokens,
+                total_wait_seconds=self._stats.total_wait_seconds,
+                max_wait_seconds=self._stats.max_wait_seconds,
+            )
+
+
+def _usage_tokens(message: BaseMessage) -> int:
+    usage = getattr(message, "usage_metadata", None)
+    return usage["total_tokens"] if usage else 0
+
+
+def _result_tokens(result: ChatResult | None) -> int:
+    if result is None:
+        return 0
+    return sum(_usage_tokens(g.message) for g in result.generations)
+
+
+class RateLimitedChatModel(BaseChatModel):
+    """
+    Chat model that holds a ProviderLimiter slot for each call of the wrapped model.
+
+    The slot is taken right before the wrapped model is called, so responses served from
+    this model's cache don't wait on the limiter. It is released, with the token usage the
+    provider reported, when the call returns or its stream is closed. Everything that
+    identifies the model (llm type, params, cache key) is taken from the wrapped model.
+    """
+
+    model: BaseChatModel
+    limiter: ProviderLimiter
+
+    @property
+    def _llm_type(self) -> str:
+        return self.model._llm_type
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return self.model._identifying_params
+
+    def _get_llm_string(self, stop: list[str] | None = None, **kwargs: Any) -> str:
+        return self.model._get_llm_string(stop=stop, **kwargs)
+
+    def _get_ls_params(self, stop: list[str] | None = None, **kwargs: Any) -> LangSmithParams:
+        return self.model._get_ls_params(stop=stop, **kwargs)
+
+    def _should_stream(self, *, async_api: bool, **kwargs: Any) -> bool:
+        return self.model._should_stream(async_api=async_api, **kwargs)
+
+    def bind_tools(
+        self,
+        tools: Sequence[dict[str, Any] | type | Callable | BaseTool],
+        **kwargs: Any,
+    ) -> Runnable[LanguageModelInput, BaseMessage]:
+        # Let the wrapped model format the tools, but keep the limiter in the call path
+        return self.bind(**self.model.bind_tools(tools, **kwargs).kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self.limiter.acquire()
+        result = None
+        try:
+            result = self.model._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            return result
+        finally:
+            self.limiter.release(_result_tokens(result))
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await self.limiter.aacquire()
+        result = None
+        try:
+            result = await self.model._agenerate(
+                messages, stop=stop, run_manager=run_manager, **kwargs
+            )
+            return result
+        finally:
+            self.limiter.release(_result_tokens(result))
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        self.limiter.acquire()
+        tokens = 0
+        try:
+            for chunk in self.model._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                tokens += _usage_tokens(chunk.message)
+                yield chunk
+        finally:
+            self.limiter.release(tokens)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await self.limiter.aacquire()
+        tokens = 0
+        try:
+            async for chunk in self.model._astream(
+                messages, stop=stop, run_manager=run_manager, **kwargs
+            ):
+                tokens += _usage_tokens(chunk.message)
+                yield chunk
+        finally:
+            self.limiter.release(tokens)
+
+
+def with_rate_limiter(model: BaseChatModel, limiter: ProviderLimiter) -> RateLimitedChatModel:
+    """Wrap model so each of its calls holds a slot of limiter. The model is left untouched."""
+    return RateLimitedChatModel(model=model, limiter=limiter)
+
+
+@cache
+def get_provider_limiter(provider: Provider) -> ProviderLimiter | None:
+    config = settings.LLM_RATE_LIMITS.get(provider)
+    if config is None:
+        return None
+    return ProviderLimiter(
+        max_concurrency=config.max_concurrency,
+        requests_per_minute=config.requests_per_minute,
+        tokens_per_minute=config.tokens_per_minute,
+    )
+
+
+def limiter_stats() -> dict[Provider, LimiterStats]:
+    """Queue depth, wait time and usage for every configured provider limiter."""
+    return {
+        provider: limiter.stats()
+        for provider in settings.LLM_RATE_LIMITS
+        if (limiter := get_provider_limiter(provider))
+    }
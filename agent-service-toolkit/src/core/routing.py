@@ -0,0 +1,273 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections.abc import AsyncIterator, Callable, Iterator, Sequence
+from typing import Any
+
+from langchain_core.callbacks import (
+    AsyncCallbackManager,
+    AsyncCallbackManagerForLLMRun,
+    CallbackManager,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import LanguageModelInput
+from langchain_core.language_models.chat_models import BaseChatModel, agenerate_from_stream
+from langchain_core.messages import AIMessageChunk, BaseMessage, ToolCallChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.tools import BaseTool
+from pydantic import Field
+
+logger = logging.getLogger(__name__)
+
+# Tags the inner model calls of a routed model. They are traced as children of the routed
+# call, but a hedged request would stream tokens from both providers, so token streams and
+# usage accounting skip them and only count the routed call, which re-emits the winner's.
+ROUTED_ATTEMPT_TAG = "routed_attempt"
+
+
+class NoModelAvailableError(Exception):
+    """Raised by RoutedChatModel when the circuit breakers of all its models are open."""
+
+
+def _attempt_config(
+    run_manager: CallbackManagerForLLMRun | AsyncCallbackManagerForLLMRun | None,
+) -> RunnableConfig:
+    if run_manager is None:
+        return RunnableConfig(tags=[ROUTED_ATTEMPT_TAG])
+    # LLM run managers have no get_child(), so build the child manager the same way
+    manager_class = (
+        AsyncCallbackManager
+        if isinstance(run_manager, AsyncCallbackManagerForLLMRun)
+        else CallbackManager
+    )
+    callbacks = manager_class(handlers=[], parent_run_id=run_manager.run_id)
+    callbacks.set_handlers(run_manager.inheritable_handlers)
+    callbacks.add_tags(run_manager.inheritable_tags)
+    callbacks.add_metadata(run_manager.inheritable_metadata)
+    return RunnableConfig(callbacks=callbacks, tags=[ROUTED_ATTEMPT_TAG])
+
+
+def to_generation_chunk(message: BaseMessage) -> ChatGenerationChunk:
+    """Wrap a streamed message as a generation chunk, converting it to a chunk if needed."""
+    # Models without native streaming yield a single complete message
+    if not isinstance(message, AIMessageChunk):
+        tool_call_chunks = [
+            ToolCallChunk(
+                name=tool_call["name"],
+                args=json.dumps(tool_call["args"]),
+                id=tool_call["id"],
+                index=index,
+            )
+            for index, tool_call in enumerate(getattr(message, "tool_calls", []))
+        ]
+        message = AIMessageChunk(
+            content=message.content,
+            id=message.id,
+            response_metadata=message.response_metadata,
+            usage_metadata=getattr(message, "usage_metadata", None),
+            tool_call_chunks=tool_call_chunks,
+        )
+    return ChatGenerationChunk(message=message)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one routed model.
+
+    After `failure_threshold` consecutive failures the breaker opens and the model is
+    skipped for `reset_timeout` seconds. It then lets a single trial request through
+    (half-open): a success closes it again, a failure re-opens it. Should the trial never
+    report back, e.g. because it lost a hedge and was cancelled, another one is let through
+    after `reset_timeout` seconds.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial_started: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state != "half-open":
+                return state == "closed"
+            now = time.monotonic()
+            if self.trial_started is not None and now - self.trial_started < self.reset_timeout:
+                return False
+            self.trial_started = now
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_started = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.trial_started = None
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class RoutedChatModel(BaseChatModel):
+    """
+    Chat model that routes each call across several provider models.
+
+    Models are tried in order. If the first chunk of the current attempt hasn't arrived
+    within `hedge_delay` seconds, the next model is started as a hedge; whichever produces
+    a chunk first wins and the other attempts are cancelled. A model that errors before
+    producing output is failed over to the next one, and models whose circuit breaker is
+    open are skipped; with all of them open, NoModelAvailableError is raised. Sync calls
+    fail over but don't hedge.
+    """
+
+    models: list[Runnable[LanguageModelInput, BaseMessage]]
+    model_names: list[str]
+    hedge_delay: float = 2.0
+    breakers: dict[str, CircuitBreaker] = Field(default_factory=dict)
+
+    def model_post_init(self, __context: Any) -> None:
+        for name in self.model_names:
+            self.breakers.setdefault(name, CircuitBreaker())
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed"
+
+    def bind_tools(
+        self,
+        tools: Sequence[dict[str, Any] | type | Callable | BaseTool],
+        **kwargs: Any,
+    ) -> Runnable[LanguageModelInput, BaseMessage]:
+        bound = [model.bind_tools(tools, **kwargs) for model in self.models]
+        return self.model_copy(update={"models": bound})
+
+    def _candidates(self) -> Iterator[int]:
+        # Lazy, so a half-open breaker only hands out its trial to a model that is started
+        return (i for i, name in enumerate(self.model_names) if self.breakers[name].allow())
+
+    @staticmethod
+    def _unavailable(error: Exception | None) -> Exception:
+        return error or NoModelAvailableError("No routed model available, all circuits are open")
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        error: Exception | None = None
+        for i in self._candidates():
+            name = self.model_names[i]
+            try:
+                config = _attempt_config(run_manager)
+                message = self.models[i].invoke(messages, config, stop=stop, **kwargs)
+            except Exception as e:
+                logger.warning(f"Routed model {name} failed, failing over: {e}")
+                self.breakers[name].record_failure()
+                error = e
+                continue
+            self.breakers[name].record_success()
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        raise self._unavailable(error)
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await agenerate_from_stream(
+            self._astream(messages, stop=stop, run_manager=run_manager, **kwargs)
+        )
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        candidates = self._candidates()
+        config = _attempt_config(run_manager)
+        # Pending first-chunk tasks, mapped to the model index and its stream
+        attempts: dict[asyncio.Task, tuple[int, AsyncIterator[BaseMessage]]] = {}
+        error: Exception | None = None
+
+        def launch() -> bool:
+            i = next(candidates, None)
+            if i is None:
+                return False
+            stream = aiter(self.models[i].astream(messages, config, stop=stop, **kwargs))
+            attempts[asyncio.ensure_future(anext(stream))] = (i, stream)
+            return True
+
+        launch()
+        winner = None
+        try:
+            while winner is None:
+                if not attempts:
+                    raise self._unavailable(error)
+                done, _ = await asyncio.wait(
+                    attempts, timeout=self.hedge_delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Latency budget exceeded: hedge with the next model, keep waiting on both
+                    if launch():
+                        name = self.model_names[attempts[next(reversed(attempts))][0]]
+                        logger.info(f"Routed model hedging with {name}")
+                    continue
+                for task in done:
+                    i, stream = attempts.pop(task)
+                    name = self.model_names[i]
+                    try:
+                        first = task.result()
+                    except StopAsyncIteration:
+                        first = None
+                    except Exception as e:
+                        logger.warning(f"Routed model {name} failed, failing over: {e}")
+                        self.breakers[name].record_failure()
+                        error = e
+                        if not attempts:
+                            launch()
+                        continue
+                    if winner is None:
+                        winner = (i, stream, first)
+                    else:
+                        await stream.aclose()
+        finally:
+            for task, (_, stream) in attempts.items():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await stream.aclose()
+
+        i, stream, first = winner
+        name = self.model_names[i]
+        try:
+            if first is not None:
+                yield to_generation_chunk(first)
+            async for chunk in stream:
+                yield to_generation_chunk(chunk)
+        except Exception:
+            # Output has already been streamed, so there's nothing left to fail over to
+            self.breakers[name].record_failure()
+            raise
+        self.breakers[name].record_success()
@@ -1,7 +1,15 @@
-from typing import Annotated, Any
+from typing import Annotated, Any, Literal
 
 from dotenv import find_dotenv
-from pydantic import BeforeValidator, HttpUrl, SecretStr, TypeAdapter, computed_field
+from pydantic import (
+    BaseModel,
+    BeforeValidator,
+    Field,
+    HttpUrl,
+    SecretStr,
+    TypeAdapter,
+    computed_field,
+)
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 from schema.models import (
@@ -15,6 +23,7 @@ from schema.models import (
     OllamaModelName,
     OpenAIModelName,
     Provider,
+    RoutedModelName,
 )
 
 
@@ -23,6 +32,27 @@ def check_str_is_http(x: str) -> str:
     return str(http_url_adapter.validate_python(x))
 
 
+class RateLimitConfig(BaseModel):
+    """Limits applied to all calls to one LLM provider. None means unlimited."""
+
+    max_concurrency: int | None = None
+    requests_per_minute: float | None = None
+    tokens_per_minute: float | None = None
+
+
+class ApiKeyConfig(BaseModel):
+    """A client API key and its quotas. None means unlimited."""
+
+    name: str
+    key: SecretStr
+    # Share of the service the key gets while keys compete for run slots
+    weight: float = Field(default=1.0, gt=0)
+    max_concurrency: int | None = None
+    tokens_per_minute: float | None = None
+    # May call the /admin endpoints, like AUTH_SECRET
+    admin: bool = False
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
         env_file=find_dotenv(),
@@ -37,6 +67,77 @@ class Settings(BaseSettings):
     PORT: int = 8080
 
     AUTH_SECRET: SecretStr | None = None
+    # Client API keys, as JSON, e.g. '[{"name": "batch", "key": "...", "weight": 0.5,
+    # "max_concurrency": 4, "tokens_per_minute": 100000}]'. Once set, requests must send one
+    # of them, or AUTH_SECRET, as their bearer token. Keys waiting for admission share the
+    # run slots in proportion to their weight, a key runs at most max_concurrency runs at
+    # once, and a key that spent its tokens_per_minute is rejected with a 429 until its
+    # budget refills. Usage per key is served at /usage and /metrics.
+    API_KEYS: list[ApiKeyConfig] = []
+
+    # Agent graphs are built on first use. Listed agents are built at startup instead,
+    # ["*"] builds all of them.
+    PRELOAD_AGENTS: list[str] = []
+    # After startup, warm up in the background: open the checkpointers, build PRELOAD_AGENTS,
+    # create AVAILABLE_MODELS and connect to their providers, and call the fake model once.
+    # /ready only reports ready once it is done. Each step may take WARMUP_TIMEOUT seconds.
+    WARMUP_ENABLED: bool = True
+    WARMUP_TIMEOUT: float = 10.0
+
+    # Admission control for /invoke, /batch, /stream and WebSocket runs: at most
+    # ADMISSION_MAX_IN_FLIGHT runs, and ADMISSION_MAX_IN_FLIGHT_PER_AGENT runs of one agent,
+    # execute at once (None is no cap). Up to ADMISSION_MAX_QUEUE more wait, by the priority
+    # in their X-Priority header (high, normal or low), for up to ADMISSION_QUEUE_TIMEOUT
+    # seconds. Other runs are rejected with a 503 and a Retry-After header.
+    ADMISSION_MAX_IN_FLIGHT: int | None = 64
+    ADMISSION_MAX_IN_FLIGHT_PER_AGENT: int | None = None
+    ADMISSION_MAX_QUEUE: int = 128
+    ADMISSION_QUEUE_TIMEOUT: float = 10.0
+    # Upper bound on how many inputs of a /batch request run at the same time
+    MAX_BATCH_CONCURRENCY: int = 8
+    # Share one graph run between identical concurrent /invoke requests without a thread_id.
+    # Only the first request gets the run_id, for feedback.
+    COALESCE_INVOKES: bool = False
+    # Frames kept per /stream run for clients resuming with Last-Event-ID
+    STREAM_BUFFER_SIZE: int = 1000
+    # How long a /stream run keeps going with no client attached, waiting for a reconnect,
+    # and how long a finished run stays resumable. 0 cancels the run on disconnect.
+    STREAM_RESUME_TIMEOUT: float = 10.0
+    # Where agents store their checkpoints, see service/checkpointer.py. "sqlite" gives every
+    # agent its own connection to CHECKPOINT_SQLITE_PATH, but SQLite still allows only one
+    # writer per file, so agents' writes queue behind each other. "sqlite-sharded" gives every
+    # agent its own file and write lock; existing checkpoints in the shared file aren't moved.
+    # Either way an agent has one connection, so concurrent runs of one agent serialize.
+    CHECKPOINT_BACKEND: str = "sqlite"
+    CHECKPOINT_SQLITE_PATH: str = "checkpoints.db"
+    # How long a checkpoint write waits for another agent's write lock before failing
+    CHECKPOINT_SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    # Checkpoints written within this window share one commit, 0 commits every checkpoint.
+    # Uncommitted checkpoints are lost if the process crashes.
+    CHECKPOINT_COMMIT_INTERVAL_MS: int = 0
+    # Every CHECKPOINT_MAINTENANCE_INTERVAL seconds (0 disables it), prune all but the latest
+    # CHECKPOINT_KEEP_PER_THREAD checkpoints of each thread, delete threads inactive for
+    # CHECKPOINT_THREAD_TTL seconds and vacuum the freed pages. None keeps everything.
+    CHECKPOINT_MAINTENANCE_INTERVAL: float = 3600
+    CHECKPOINT_KEEP_PER_THREAD: int | None = None
+    CHECKPOINT_THREAD_TTL: float | None = None
+    # Record a timeline of every run's nodes, LLM and tool calls and checkpoint accesses,
+    # served at /runs/{run_id}/timeline. The latest RUN_TIMELINE_BUFFER_SIZE runs are kept.
+    RUN_TIMELINE_ENABLED: bool = False
+    RUN_TIMELINE_BUFFER_SIZE: int = 200
+    # Start the research assistant's first model call while LlamaGuard checks the input
+    LLAMA_GUARD_SPECULATIVE: bool = False
+    # How many LlamaGuard verdicts to keep in memory, 0 disables the verdict cache
+    LLAMA_GUARD_CACHE_SIZE: int = 1024
+
+    # How much of a thread's history is sent to the model, see agents/context.py.
+    # "full" sends everything, "sliding" the most recent messages that fit CONTEXT_MAX_TOKENS,
+    # "pinned" also keeps the thread's first message, and "summary" folds older messages
+    # into a running summary stored in the graph state.
+    CONTEXT_STRATEGY: Literal["full", "sliding", "pinned", "summary"] = "full"
+    CONTEXT_MAX_TOKENS: int = 32000
+    # LlamaGuard only needs recent context to classify the last message
+    CONTEXT_GUARD_MAX_TOKENS: int = 4096
 
     OPENAI_API_KEY: SecretStr | None = None
     DEEPSEEK_API_KEY: SecretStr | None = None
@@ -47,11 +148,45 @@ class Settings(BaseSettings):
     OLLAMA_MODEL: str | None = None
     OLLAMA_BASE_URL: str | None = None
     USE_FAKE_MODEL: bool = False
+    # Make the fake model behave like a real provider for offline benchmarks (see
+    # run_benchmark.py and core/fake_model.py): seconds before the first token and between
+    # tokens, a (min, max) range of response tokens, tool calls it makes when the tools are
+    # bound, e.g. '[{"name": "Calculator", "args": {"expression": "2 + 2"}}]', and the share
+    # of calls that fail. FAKE_MODEL_LLAMA_GUARD has LlamaGuard use the fake model, which
+    # answers "safe", when GROQ_API_KEY is not set.
+    FAKE_MODEL_FIRST_TOKEN_DELAY: float = 0.0
+    FAKE_MODEL_TOKEN_DELAY: float = 0.0
+    FAKE_MODEL_RESPONSE_TOKENS: tuple[int, int] | None = None
+    FAKE_MODEL_TOOL_CALLS: list[dict[str, Any]] = []
+    FAKE_MODEL_ERROR_RATE: float = 0.0
+    FAKE_MODEL_LLAMA_GUARD: bool = False
 
     # If DEFAULT_MODEL is None, it will be set in model_post_init
     DEFAULT_MODEL: AllModelEnum | None = None  # type: ignore[assignment]
     AVAILABLE_MODELS: set[AllModelEnum] = set()  # type: ignore[assignment]
 
+    # Opt-in persistent cache of LLM responses, shared by every model from get_model()
+    LLM_CACHE_ENABLED: bool = False
+    LLM_CACHE_PATH: str = "llm_cache.db"
+    LLM_CACHE_TTL: int | None = 86400
+    LLM_CACHE_MAX_ENTRIES: int = 10000
+    # Setting a threshold (e.g. 0.95) enables the embedding-similarity tier (needs OpenAI)
+    LLM_CACHE_SIMILARITY_THRESHOLD: float | None = None
+    LLM_CACHE_EMBEDDING_MODEL: str = "text-embedding-3-small"
+
+    # Per-provider limits, e.g. LLM_RATE_LIMITS='{"openai": {"max_concurrency": 8,
+    # "requests_per_minute": 500, "tokens_per_minute": 200000}}'
+    LLM_RATE_LIMITS: dict[Provider, RateLimitConfig] = {}
+
+    # Models behind the "routed" model, in order of preference. The next model is started
+    # as a hedge if no token arrives within ROUTED_HEDGE_DELAY seconds, and is failed over
+    # to on errors. Models failing ROUTED_FAILURE_THRESHOLD times in a row are skipped for
+    # ROUTED_RESET_TIMEOUT seconds.
+    ROUTED_MODELS: list[AllModelEnum] = []  # type: ignore[valid-type]
+    ROUTED_HEDGE_DELAY: float = 2.0
+    ROUTED_FAILURE_THRESHOLD: int = 3
+    ROUTED_RESET_TIMEOUT: float = 30.0
+
     OPENWEATHERMAP_API_KEY: SecretStr | None = None
 
     LANGCHAIN_TRACING_V2: bool = False
@@ -113,6 +248,11 @@ class Settings(BaseSettings):
                 case _:
                     raise ValueError(f"Unknown provider: {provider}")
 
+        if self.ROUTED_MODELS:
+            if unavailable := set(self.ROUTED_MODELS) - self.AVAILABLE_MODELS:
+                raise ValueError(f"ROUTED_MODELS contains unavailable models: {unavailable}")
+            self.AVAILABLE_MODELS.add(RoutedModelName.ROUTED)
+
     @computed_field
     @property
     def BASE_URL(self) -> str:
@@ -0,0 +1,258 @@
+"""
+Load benchmark for the agent service.
+
+Drives concurrent virtual users through AgentClient.ainvoke() or AgentClient.astream()
+against a running service, and reports latency percentiles, time to first token, tokens per
+second, throughput and errors. Requests use the fake model, so no provider is called; start
+the service with USE_FAKE_MODEL=true, and the FAKE_MODEL_* settings to simulate a provider's
+latency and errors, or pass --serve to have the benchmark start one. For example:
+
+    python run_benchmark.py --serve --token-delay 0.02 --users 20 --requests 10 --mode stream
+    python run_benchmark.py --url http://localhost:8080 --json results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from typing import Any
+from uuid import uuid4
+
+import httpx
+
+from client import AgentClient
+from core import settings
+from schema.models import FakeModelName
+
+
+@dataclass
+class RequestResult:
+    latency: float
+    # Only set for streamed requests that received tokens
+    time_to_first_token: float | None = None
+    tokens: int = 0
+    tokens_per_second: float | None = None
+    error: str | None = None
+
+
+@dataclass
+class BenchmarkResults:
+    mode: str
+    users: int
+    duration: float = 0.0
+    results: list[RequestResult] = field(default_factory=list)
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    """The p-th percentile of values, interpolating between the closest ranks."""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * p / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def distribution(values: list[float]) -> dict[str, float | None]:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": sum(values) / len(values) if values else None,
+    }
+
+
+def summarize(benchmark: BenchmarkResults) -> dict[str, Any]:
+    results = benchmark.results
+    ok = [r for r in results if r.error is None]
+    errors = Counter(r.error for r in results if r.error is not None)
+    return {
+        "mode": benchmark.mode,
+        "users": benchmark.users,
+        "requests": len(results),
+        "duration_seconds": benchmark.duration,
+        "requests_per_second": len(results) / benchmark.duration if benchmark.duration else None,
+        "error_rate": len(results) and (len(results) - len(ok)) / len(results),
+        "errors": dict(errors),
+        "latency_seconds": distribution([r.latency for r in ok]),
+        "time_to_first_token_seconds": distribution(
+            [r.time_to_first_token for r in ok if r.time_to_first_token is not None]
+        ),
+        "tokens_per_second": distribution(
+            [r.tokens_per_second for r in ok if r.tokens_per_second is not None]
+        ),
+    }
+
+
+async def invoke_once(client: AgentClient, message: str, model: str) -> RequestResult:
+    started = time.perf_counter()
+    # A new thread, as without a thread_id, that also keeps a service with COALESCE_INVOKES
+    # from merging the benchmark's identical requests into one run
+    await client.ainvoke(message, model=model, thread_id=str(uuid4()))
+    return RequestResult(latency=time.perf_counter() - started)
+
+
+async def stream_once(client: AgentClient, message: str, model: str) -> RequestResult:
+    started = time.perf_counter()
+    first_token_at = last_token_at = None
+    tokens = 0
+    async for event in client.astream(message, model=model, thread_id=str(uuid4())):
+        if isinstance(event, str):
+            last_token_at = time.perf_counter()
+            first_token_at = first_token_at or last_token_at
+            tokens += 1
+    result = RequestResult(latency=time.perf_counter() - started, tokens=tokens)
+    if first_token_at is not None:
+        result.time_to_first_token = first_token_at - started
+        if tokens > 1 and last_token_at > first_token_at:
+            result.tokens_per_second = (tokens - 1) / (last_token_at - first_token_at)
+    return result
+
+
+async def virtual_user(
+    client: AgentClient, user: int, args: argparse.Namespace, results: list[RequestResult]
+) -> None:
+    for i in range(args.requests):
+        mode = args.mode if args.mode != "mixed" else ("invoke", "stream")[(user + i) % 2]
+        request = invoke_once if mode == "invoke" else stream_once
+        started = time.perf_counter()
+        try:
+            results.append(await request(client, args.message, args.model))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"[:200]
+            results.append(RequestResult(latency=time.perf_counter() - started, error=error))
+        if args.think_time:
+            await asyncio.sleep(args.think_time)
+
+
+async def run_benchmark(args: argparse.Namespace) -> BenchmarkResults:
+    benchmark = BenchmarkResults(mode=args.mode, users=args.users)
+    # One client shares its connection pool between the users, like a frontend would. It
+    # doesn't retry, so requests the service sheds under load count as errors.
+    async with AgentClient(
+        args.url,
+        agent=args.agent,
+        timeout=args.timeout,
+        max_connections=args.users,
+        max_retries=0,
+    ) as client:
+        if args.warmup:
+            await asyncio.gather(*(invoke_once(client, args.message, args.model) for _ in range(2)))
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(virtual_user(client, user, args, benchmark.results) for user in range(args.users))
+        )
+        benchmark.duration = time.perf_counter() - started
+    return benchmark
+
+
+def start_service(args: argparse.Namespace) -> subprocess.Popen:
+    """Start the service with the fake model in a subprocess and wait until it is ready."""
+    env = {
+        **os.environ,
+        "USE_FAKE_MODEL": "true",
+        "FAKE_MODEL_FIRST_TOKEN_DELAY": str(args.first_token_delay),
+        "FAKE_MODEL_TOKEN_DELAY": str(args.token_delay),
+        "FAKE_MODEL_ERROR_RATE": str(args.error_rate),
+        # Identical requests would share one run or a cached response instead of being measured
+        "COALESCE_INVOKES": "false",
+        "LLM_CACHE_ENABLED": "false",
+        "PORT": str(httpx.URL(args.url).port or 80),
+    }
+    service = subprocess.Popen(
+        [sys.executable, "run_service.py"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if service.poll() is not None:
+            raise RuntimeError("The service exited during startup")
+        try:
+            if httpx.get(f"{args.url}/ready").status_code == 200:
+                return service
+        except httpx.TransportError:
+            pass
+        time.sleep(0.5)
+    service.terminate()
+    raise RuntimeError("The service didn't become ready within 60 seconds")
+
+
+def print_summary(summary: dict[str, Any]) -> None:
+    def seconds(value: float | None) -> str:
+        return "-" if value is None else f"{value * 1000:.1f}ms"
+
+    print(
+        f"{summary['requests']} {summary['mode']} requests from {summary['users']} users "
+        f"in {summary['duration_seconds']:.2f}s ({summary['requests_per_second'] or 0:.1f}/s)"
+    )
+    print(f"error rate: {summary['error_rate']:.2%} {summary['errors'] or ''}")
+    for name in ("latency_seconds", "time_to_first_token_seconds"):
+        values = summary[name]
+        print(
+            f"{name.removesuffix('_seconds'):<20} p50 {seconds(values['p50']):>10}  "
+            f"p95 {seconds(values['p95']):>10}  p99 {seconds(values['p99']):>10}"
+        )
+    rates = summary["tokens_per_second"]
+    if rates["p50"] is not None:
+        print(f"{'tokens per second':<20} p50 {rates['p50']:>10.1f}  mean {rates['mean']:>9.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[1].replace("\n", " "),
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--url", default=settings.BASE_URL, help="Service base URL")
+    parser.add_argument("--agent", default="chatbot", help="Agent to call")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--requests", type=int, default=10, help="Requests per user")
+    parser.add_argument("--mode", choices=["invoke", "stream", "mixed"], default="stream")
+    parser.add_argument("--model", default=FakeModelName.FAKE, help="Model to request")
+    parser.add_argument("--message", default="Tell me a brief joke?", help="Message to send")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Seconds between requests")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Request timeout in seconds")
+    parser.add_argument(
+        "--warmup", action=argparse.BooleanOptionalAction, default=True, help="Warm up first"
+    )
+    parser.add_argument(
+        "--serve", action="store_true", help="Start a fake-model service, configured by the below"
+    )
+    parser.add_argument(
+        "--first-token-delay", type=float, default=0.3, help="Fake model time to first token"
+    )
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Fake model token delay")
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Share of failing fake model calls"
+    )
+    parser.add_argument("--json", metavar="PATH", help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    service = start_service(args) if args.serve else None
+    try:
+        benchmark = asyncio.run(run_benchmark(args))
+    finally:
+        if service:
+            service.terminate()
+            service.wait()
+
+    summary = summarize(benchmark)
+    print_summary(summary)
+    if args.json:
+        config = {k: v for k, v in vars(args).items() if k != "json"}
+        report = {"timestamp": datetime.now(UTC).isoformat(), "config": config, **summary}
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,31 @@
 from schema.models import AllModelEnum
 from schema.schema import (
     AgentInfo,
+    ApiKeyUsage,
+    BatchInput,
+    BatchOutput,
+    BatchResult,
     ChatHistory,
     ChatHistoryInput,
     ChatMessage,
+    CheckpointMaintenanceReport,
     Feedback,
     FeedbackResponse,
+    RunTimeline,
     ServiceMetadata,
     StreamInput,
+    TimelineSpan,
     UserInput,
 )
 
 __all__ = [
     "AgentInfo",
+    "ApiKeyUsage",
     "AllModelEnum",
     "UserInput",
+    "BatchInput",
+    "BatchOutput",
+    "BatchResult",
     "ChatMessage",
     "ServiceMetadata",
     "StreamInput",
@@ -22,4 +33,7 @@ __all__ = [
     "FeedbackResponse",
     "ChatHistoryInput",
     "ChatHistory",
+    "CheckpointMaintenanceReport",
+    "RunTimeline",
+    "TimelineSpan",
 ]
@@ -67,6 +67,12 @@ class FakeModelName(StrEnum):
     FAKE = "fake"
 
 
+class RoutedModelName(StrEnum):
+    """Hedges and fails over across the models configured in ROUTED_MODELS."""
+
+    ROUTED = "routed"
+
+
 AllModelEnum: TypeAlias = (
     OpenAIModelName
     | DeepseekModelName
@@ -76,4 +82,5 @@ AllModelEnum: TypeAlias = (
     | AWSModelName
     | OllamaModelName
     | FakeModelName
+    | RoutedModelName
 )
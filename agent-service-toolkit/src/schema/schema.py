@@ -69,6 +69,40 @@ class StreamInput(UserInput):
         description="Whether to stream LLM tokens to the client.",
         default=True,
     )
+    coalesce_tokens: bool = Field(
+        description="Join consecutive tokens into fewer frames. Buffered tokens are sent when "
+        "they reach coalesce_max_bytes, when coalesce_window_ms has passed since the first "
+        "of them, and before every message.",
+        default=False,
+    )
+    coalesce_window_ms: int = Field(
+        description="Longest time a token is held back when coalescing tokens.",
+        default=20,
+        ge=1,
+    )
+    coalesce_max_bytes: int = Field(
+        description="Buffered size, in UTF-8 bytes, that sends the frame when coalescing tokens.",
+        default=256,
+        ge=1,
+    )
+
+
+class BatchInput(BaseModel):
+    """A batch of user inputs to run through the agent concurrently."""
+
+    inputs: list[UserInput] = Field(
+        description="User inputs to run. Results are returned in the same order. "
+        "Inputs with the same thread_id run one after another, in this order.",
+        min_length=1,
+        max_length=100,
+    )
+    max_concurrency: int | None = Field(
+        description="Maximum number of inputs run at the same time. "
+        "Capped by the service's MAX_BATCH_CONCURRENCY setting.",
+        default=None,
+        ge=1,
+        examples=[4],
+    )
 
 
 class ToolCall(TypedDict):
@@ -131,6 +165,26 @@ class ChatMessage(BaseModel):
         print(self.pretty_repr())  # noqa: T201
 
 
+class BatchResult(BaseModel):
+    """Result of a single input in a batch. Exactly one of message or error is set."""
+
+    message: ChatMessage | None = Field(
+        description="Final response of the agent for this input.",
+        default=None,
+    )
+    error: str | None = Field(
+        description="Error raised while running this input.",
+        default=None,
+        examples=["Unexpected error"],
+    )
+
+
+class BatchOutput(BaseModel):
+    """Results of a batch, in the same order as the inputs."""
+
+    results: list[BatchResult]
+
+
 class Feedback(BaseModel):
     """Feedback for a run, to record to LangSmith."""
 
@@ -164,7 +218,118 @@ class ChatHistoryInput(BaseModel):
         description="Thread ID to persist and continue a multi-turn conversation.",
         examples=["847c6285-8fc9-4560-a83f-4e6285809254"],
     )
+    limit: int | None = Field(
+        description="Maximum number of messages to return. All messages if not set.",
+        default=None,
+        ge=1,
+        examples=[50],
+    )
+    before: str | None = Field(
+        description="Cursor from a previous page, the id of its oldest message. Only messages "
+        "before that message are returned.",
+        default=None,
+    )
 
 
 class ChatHistory(BaseModel):
     messages: list[ChatMessage]
+    next_cursor: str | None = Field(
+        description="Cursor to pass as `before` for the previous page, if there are older messages.",
+        default=None,
+    )
+
+
+class CheckpointMaintenanceReport(BaseModel):
+    """What a checkpoint maintenance run removed and reclaimed."""
+
+    checkpoints_deleted: int = Field(
+        description="Checkpoints pruned from threads or deleted with expired threads.",
+        default=0,
+    )
+    writes_deleted: int = Field(
+        description="Pending writes deleted along with their checkpoints.",
+        default=0,
+    )
+    threads_expired: int = Field(
+        description="Threads deleted because they were inactive for longer than the TTL.",
+        default=0,
+    )
+    size_bytes: int = Field(
+        description="Size of the checkpoint databases after maintenance.",
+        default=0,
+    )
+    bytes_reclaimed: int = Field(
+        description="How much smaller the checkpoint databases got.",
+        default=0,
+    )
+
+
+class TimelineSpan(BaseModel):
+    """A timed step of an agent run: a graph node, an LLM or tool call, or a checkpoint access."""
+
+    id: str = Field(description="Span ID, the LangChain run ID for nodes and calls.")
+    parent_id: str | None = Field(
+        description="ID of the span this one ran in, None for the run itself.",
+        default=None,
+    )
+    name: str = Field(
+        description="Node, model, tool or checkpointer operation name.",
+        examples=["model", "gpt-4o-mini", "Calculator", "put"],
+    )
+    kind: Literal["run", "node", "guard", "llm", "tool", "checkpoint"] = Field(
+        description="What the span measures. LlamaGuard nodes and calls are 'guard'.",
+    )
+    start: float = Field(description="Seconds from the start of the run to the start of the span.")
+    end: float | None = Field(
+        description="Seconds from the start of the run to the end of the span, None while running.",
+        default=None,
+    )
+    first_token: float | None = Field(
+        description="Seconds from the start of the run to the first streamed token of an LLM call.",
+        default=None,
+    )
+    provider: str | None = Field(description="LLM provider.", default=None)
+    model: str | None = Field(description="LLM model name.", default=None)
+    input_tokens: int | None = Field(description="Prompt tokens of an LLM call.", default=None)
+    output_tokens: int | None = Field(description="Completion tokens of an LLM call.", default=None)
+    error: str | None = Field(description="Error the span ended with.", default=None)
+
+
+class RunTimeline(BaseModel):
+    """Timeline of an agent run, recorded when RUN_TIMELINE_ENABLED is set."""
+
+    run_id: str
+    agent_id: str
+    thread_id: str
+    started_at: float = Field(description="Unix time the run started.")
+    duration: float | None = Field(
+        description="Seconds the run took, None while it is running.", default=None
+    )
+    spans: list[TimelineSpan] = Field(default=[])
+    breakdown: dict[str, float] = Field(
+        description=(
+            "Seconds spent per kind of span: guard, llm, tool and checkpoint. Concurrent spans "
+            "are summed, so the total can exceed the run duration."
+        ),
+        default={},
+    )
+
+
+class ApiKeyUsage(BaseModel):
+    """Usage of an API key since the service started."""
+
+    name: str = Field(description="Name of the API key, 'anonymous' without API keys.")
+    requests: int = Field(
+        description="Runs of the key that were admitted. Rejected runs aren't counted.", default=0
+    )
+    rejected: int = Field(
+        description="Runs rejected because the key had spent its tokens per minute.",
+        default=0,
+    )
+    in_flight: int = Field(description="Runs of the key executing now.", default=0)
+    input_tokens: int = Field(description="Prompt tokens of the key's LLM calls.", default=0)
+    output_tokens: int = Field(description="Completion tokens of the key's LLM calls.", default=0)
+    tokens_per_minute: float | None = Field(
+        description="The key's token budget per minute, None if it is unlimited.",
+        default=None,
+    )
@@ -0,0 +1,226 @@
+import asyncio
+import bisect
+import itertools
+import math
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import cache
+from typing import Literal
+
+from core import settings
+from core.settings import ApiKeyConfig
+
+Priority = Literal["high", "normal", "low"]
+_PRIORITY_RANKS: dict[str, int] = {"high": 0, "normal": 1, "low": 2}
+# Runs of requests without an API key are accounted to this key name
+ANONYMOUS = "anonymous"
+
+
+def key_name(api_key: ApiKeyConfig | None) -> str:
+    return api_key.name if api_key else ANONYMOUS
+
+
+class Overloaded(Exception):
+    """The service can't take the run now. Retry after retry_after seconds."""
+
+    def __init__(self, reason: str, retry_after: int) -> None:
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+@dataclass
+class AdmissionStats:
+    in_flight: int = 0
+    queue_depth: int = 0
+    admitted: int = 0
+    # Rejected because the queue was full, or shed from it for a higher-priority run
+    rejected: int = 0
+    # Gave up waiting after the queue timeout
+    timed_out: int = 0
+    in_flight_by_agent: dict[str, int] = field(default_factory=dict)
+    in_flight_by_key: dict[str, int] = field(default_factory=dict)
+
+
+@dataclass(order=True)
+class _Waiter:
+    rank: int
+    # Virtual start time of the run in the weighted fair queue of its priority
+    start: float
+    seq: int
+    agent_id: str = field(compare=False)
+    api_key: ApiKeyConfig | None = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class AdmissionSlot:
+    """A granted run slot. Release it, or use it as a context manager, when the run ends."""
+
+    def __init__(self, controller: "AdmissionController", agent_id: str, key: str) -> None:
+        self._controller = controller
+        self.agent_id = agent_id
+        self.key = key
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            seconds = time.monotonic() - self._started
+            self._controller._release(self.agent_id, self.key, seconds)
+
+    def __enter__(self) -> "AdmissionSlot":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.release()
+
+
+class AdmissionController:
+    """
+    Caps how many agent runs execute at once, globally, per agent and per API key.
+
+    Runs over the caps wait in a bounded queue, highest priority first. Within a priority,
+    the queue is a weighted fair queue of the API keys: every run is tagged with a virtual
+    start time, which advances by 1 / weight with each run of its key, and runs are served
+    in tag order. A key sending a burst of runs gets its weighted share of the slots, and a
+    key sending a single run is served next rather than after the burst. A waiting run is
+    granted a slot as soon as its agent, its key and the service have room, so a saturated
+    agent or key doesn't hold up the runs behind it. Runs that would overflow the queue are
+    rejected right away, unless they come before the last queued run, which is shed instead.
+    Runs that wait longer than queue_timeout are rejected too. Rejections carry a
+    Retry-After estimate from the recent run durations.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int | None = None,
+        max_in_flight_per_agent: int | None = None,
+        max_queue: int = 128,
+        queue_timeout: float = 10.0,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.max_in_flight_per_agent = max_in_flight_per_agent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._in_flight: Counter[str] = Counter()
+        self._in_flight_by_key: Counter[str] = Counter()
+        # Virtual finish time of each key's latest run, and the start time of the latest
+        # granted run, which new runs of idle keys start from
+        self._finish: dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._waiters: list[_Waiter] = []
+        self._seq = itertools.count()
+        self._stats = AdmissionStats()
+        # Moving average of how long runs hold their slot
+        self._run_seconds = 1.0
+
+    def _has_room(self, agent_id: str, api_key: ApiKeyConfig | None) -> bool:
+        if self.max_in_flight is not None and self._in_flight.total() >= self.max_in_flight:
+            return False
+        per_agent = self.max_in_flight_per_agent
+        if per_agent is not None and self._in_flight[agent_id] >= per_agent:
+            return False
+        per_key = api_key.max_concurrency if api_key else None
+        return per_key is None or self._in_flight_by_key[key_name(api_key)] < per_key
+
+    def _grant(self, agent_id: str, api_key: ApiKeyConfig | None, start: float) -> AdmissionSlot:
+        key = key_name(api_key)
+        self._in_flight[agent_id] += 1
+        self._in_flight_by_key[key] += 1
+        self._virtual_time = max(self._virtual_time, start)
+        self._stats.admitted += 1
+        return AdmissionSlot(self, agent_id, key)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free for a new run, at least 1."""
+        capacity = self.max_in_flight or self.max_in_flight_per_agent or 1
+        estimate = self._run_seconds * (len(self._waiters) + 1) / capacity
+        return max(1, min(60, math.ceil(estimate)))
+
+    def _reject(self, reason: str) -> Overloaded:
+        self._stats.rejected += 1
+        return Overloaded(reason, self.retry_after())
+
+    async def acquire(
+        self,
+        agent_id: str,
+        priority: Priority = "normal",
+        api_key: ApiKeyConfig | None = None,
+    ) -> AdmissionSlot:
+        """Wait for a slot to run agent_id for api_key. Raises Overloaded if it's rejected."""
+        key = key_name(api_key)
+        start = max(self._virtual_time, self._finish.get(key, 0.0))
+        finish = start + 1 / (api_key.weight if api_key else 1.0)
+        if not self._waiters and self._has_room(agent_id, api_key):
+            self._finish[key] = finish
+            return self._grant(agent_id, api_key, start)
+        rank = _PRIORITY_RANKS[priority]
+        if len(self._waiters) >= self.max_queue:
+            last = self._waiters[-1] if self._waiters else None
+            if last is None or (last.rank, last.start) <= (rank, start):
+                raise self._reject("Service is overloaded")
+            # Shed the last queued run, of the lowest priority and heaviest key, for this one
+            self._waiters.pop()
+            last.future.set_exception(self._reject("Service is overloaded"))
+        self._finish[key] = finish
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(rank, start, next(self._seq), agent_id, api_key, future)
+        bisect.insort(self._waiters, waiter)
+        # Runs ahead of it may be waiting for their own agent, which leaves room for this one
+        self._dispatch()
+        try:
+            return await asyncio.wait_for(waiter.future, self.queue_timeout)
+        except TimeoutError:
+            self._stats.timed_out += 1
+            raise Overloaded("Timed out waiting for a free slot", self.retry_after())
+        except asyncio.CancelledError:
+            # The slot may have been granted just as the caller was cancelled
+            if waiter.future.done() and not waiter.future.cancelled():
+                if waiter.future.exception() is None:
+                    waiter.future.result().release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _release(self, agent_id: str, key: str, seconds: float) -> None:
+        for counter, name in ((self._in_flight, agent_id), (self._in_flight_by_key, key)):
+            counter[name] -= 1
+            if not counter[name]:
+                del counter[name]
+        self._run_seconds = 0.9 * self._run_seconds + 0.1 * seconds
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Grant free slots to waiting runs, in queue order, skipping runs of full agents/keys."""
+        for waiter in list(self._waiters):
+            if self.max_in_flight is not None and self._in_flight.total() >= self.max_in_flight:
+                return
+            if waiter.future.done():
+                continue
+            if self._has_room(waiter.agent_id, waiter.api_key):
+                self._waiters.remove(waiter)
+                slot = self._grant(waiter.agent_id, waiter.api_key, waiter.start)
+                waiter.future.set_result(slot)
+
+    def stats(self) -> AdmissionStats:
+        return AdmissionStats(
+            in_flight=self._in_flight.total(),
+            queue_depth=len(self._waiters),
+            admitted=self._stats.admitted,
+            rejected=self._stats.rejected,
+            timed_out=self._stats.timed_out,
+            in_flight_by_agent=dict(self._in_flight),
+            in_flight_by_key=dict(self._in_flight_by_key),
+        )
+
+
+@cache
+def get_admission_controller() -> AdmissionController:
+    return AdmissionController(
+        max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+        max_in_flight_per_agent=settings.ADMISSION_MAX_IN_FLIGHT_PER_AGENT,
+        max_queue=settings.ADMISSION_MAX_QUEUE,
+        queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+    )
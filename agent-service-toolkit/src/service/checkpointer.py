@@ -0,0 +1,321 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import defaultdict
+from collections.abc import AsyncIterator, Callable, Iterable, Sequence
+from contextlib import AbstractAsyncContextManager, AsyncExitStack, asynccontextmanager
+from typing import Any
+
+import aiosqlite
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from core import settings
+from schema import CheckpointMaintenanceReport
+
+logger = logging.getLogger(__name__)
+
+# A backend opens the checkpointer for one agent, given the agent's id
+CheckpointerBackend = Callable[[str], AbstractAsyncContextManager[BaseCheckpointSaver]]
+
+
+class BatchedCommits:
+    """
+    Wraps an aiosqlite connection so commits made within `interval` seconds share one commit.
+
+    The connection still sees its own uncommitted writes, so the checkpointer using it reads
+    consistently, but a graph step no longer waits for the commit. Writes that are not yet
+    committed are lost if the process crashes. flush() commits right away.
+    """
+
+    def __init__(self, conn: aiosqlite.Connection, interval: float) -> None:
+        self._conn = conn
+        self.interval = interval
+        self._timer: asyncio.TimerHandle | None = None
+        self._commit_task: asyncio.Task | None = None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+    async def commit(self) -> None:
+        if self.interval <= 0:
+            await self._conn.commit()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.interval, self._start_commit)
+
+    def _start_commit(self) -> None:
+        self._timer = None
+        self._commit_task = asyncio.create_task(self._conn.commit())
+        self._commit_task.add_done_callback(self._log_commit_error)
+
+    @staticmethod
+    def _log_commit_error(task: asyncio.Task) -> None:
+        if not task.cancelled() and (e := task.exception()):
+            logger.error(f"Checkpoint commit failed: {e}")
+
+    async def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._commit_task is not None:
+            await asyncio.gather(self._commit_task, return_exceptions=True)
+            self._commit_task = None
+        await self._conn.commit()
+
+
+class CommittingSqliteSaver(AsyncSqliteSaver):
+    """
+    AsyncSqliteSaver that also commits the pending writes it stores.
+
+    AsyncSqliteSaver only commits in aput(). A run that fails or is cancelled stores its
+    last pending writes without a checkpoint after them, so its connection would keep a
+    write transaction open and every other connection to the database would fail with
+    "database is locked" until the agent saves its next checkpoint.
+    """
+
+    async def aput_writes(
+        self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str
+    ) -> None:
+        try:
+            await super().aput_writes(config, writes, task_id)
+        finally:
+            async with self.lock:
+                await self.conn.commit()
+
+
+@asynccontextmanager
+async def sqlite_checkpointer(
+    path: str, busy_timeout_ms: int = 5000, commit_interval: float = 0.0
+) -> AsyncIterator[CommittingSqliteSaver]:
+    """
+    Open a CommittingSqliteSaver on its own connection to the database at path.
+
+    The database runs in WAL mode, so readers don't block the writer, and writers wait up
+    to busy_timeout_ms for another connection's write lock instead of failing.
+    """
+    async with aiosqlite.connect(path) as conn:
+        await conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+        # Lets maintenance return free pages to the OS, only takes effect on new databases
+        await conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        await conn.execute("PRAGMA journal_mode = WAL")
+        # In WAL mode NORMAL only syncs at checkpoints and is still safe from corruption
+        await conn.execute("PRAGMA synchronous = NORMAL")
+        batched = BatchedCommits(conn, commit_interval)
+        try:
+            yield CommittingSqliteSaver(batched)
+        finally:
+            await batched.flush()
+
+
+def shard_path(path: str, agent_id: str) -> str:
+    """The database file of an agent in a sharded SQLite setup, e.g. checkpoints.chatbot.db"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{agent_id}{ext}"
+
+
+def _sqlite_backend(agent_id: str) -> AbstractAsyncContextManager[BaseCheckpointSaver]:
+    return sqlite_checkpointer(
+        settings.CHECKPOINT_SQLITE_PATH,
+        busy_timeout_ms=settings.CHECKPOINT_SQLITE_BUSY_TIMEOUT_MS,
+        commit_interval=settings.CHECKPOINT_COMMIT_INTERVAL_MS / 1000,
+    )
+
+
+def _sharded_sqlite_backend(agent_id: str) -> AbstractAsyncContextManager[BaseCheckpointSaver]:
+    return sqlite_checkpointer(
+        shard_path(settings.CHECKPOINT_SQLITE_PATH, agent_id),
+        busy_timeout_ms=settings.CHECKPOINT_SQLITE_BUSY_TIMEOUT_MS,
+        commit_interval=settings.CHECKPOINT_COMMIT_INTERVAL_MS / 1000,
+    )
+
+
+_backends: dict[str, CheckpointerBackend] = {
+    "sqlite": _sqlite_backend,
+    "sqlite-sharded": _sharded_sqlite_backend,
+}
+
+
+def register_checkpointer_backend(name: str, backend: CheckpointerBackend) -> None:
+    """
+    Make a checkpointer backend available as CHECKPOINT_BACKEND=name.
+
+    A backend is called with an agent id and returns an async context manager that yields
+    the agent's checkpointer, e.g. a Postgres saver on a connection pool.
+    """
+    _backends[name] = backend
+
+
+@asynccontextmanager
+async def agent_checkpointers(
+    agent_ids: Iterable[str], backend: str | None = None
+) -> AsyncIterator[dict[str, BaseCheckpointSaver]]:
+    """
+    Open a checkpointer for each agent, so agents don't share a connection.
+
+    Each agent still gets a single connection, which its concurrent runs take turns on.
+    """
+    backend = backend or settings.CHECKPOINT_BACKEND
+    if backend not in _backends:
+        raise ValueError(
+            f"Unknown checkpointer backend {backend}, available: {', '.join(_backends)}"
+        )
+    async with AsyncExitStack() as stack:
+        yield {
+            agent_id: await stack.enter_async_context(_backends[backend](agent_id))
+            for agent_id in agent_ids
+        }
+
+
+def _checkpoint_id_at(timestamp: float) -> str:
+    """
+    The smallest checkpoint id created at timestamp.
+
+    Checkpoint ids are UUIDv6, which start with their creation time, so ids compare in
+    creation order.
+    """
+    # 100 ns intervals since the start of the Gregorian calendar
+    t = int(timestamp * 10**7) + 0x01B21DD213814000
+    return str(uuid.UUID(int=((t >> 12) << 80) | (6 << 76) | ((t & 0xFFF) << 64)))
+
+
+async def _commit_now(conn: BatchedCommits | aiosqlite.Connection) -> None:
+    if isinstance(conn, BatchedCommits):
+        await conn.flush()
+    else:
+        await conn.commit()
+
+
+async def _database_size(conn: aiosqlite.Connection) -> int:
+    [(page_count,)] = await conn.execute_fetchall("PRAGMA page_count")
+    [(page_size,)] = await conn.execute_fetchall("PRAGMA page_size")
+    return page_count * page_size
+
+
+async def _maintain_database(
+    conn: aiosqlite.Connection,
+    report: CheckpointMaintenanceReport,
+    keep_per_thread: int | None,
+    thread_ttl: float | None,
+    full_vacuum: bool,
+) -> None:
+    size_before = await _database_size(conn)
+    if thread_ttl is not None:
+        inactive = (
+            "SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(checkpoint_id) < ?"
+        )
+        cutoff = (_checkpoint_id_at(time.time() - thread_ttl),)
+        [(expired,)] = await conn.execute_fetchall(f"SELECT COUNT(*) FROM ({inactive})", cutoff)
+        cursor = await conn.execute(
+            f"DELETE FROM checkpoints WHERE thread_id IN ({inactive})", cutoff
+        )
+        report.threads_expired += expired
+        report.checkpoints_deleted += cursor.rowcount
+    if keep_per_thread is not None:
+        cursor = await conn.execute(
+            """
+            DELETE FROM checkpoints WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid, ROW_NUMBER() OVER (
+                        PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+                    ) AS position FROM checkpoints
+                ) WHERE position > ?
+            )
+            """,
+            (keep_per_thread,),
+        )
+        report.checkpoints_deleted += cursor.rowcount
+    cursor = await conn.execute(
+        """
+        DELETE FROM writes WHERE NOT EXISTS (
+            SELECT 1 FROM checkpoints c WHERE c.thread_id = writes.thread_id
+            AND c.checkpoint_ns = writes.checkpoint_ns AND c.checkpoint_id = writes.checkpoint_id
+        )
+        """
+    )
+    report.writes_deleted += cursor.rowcount
+    await _commit_now(conn)
+
+    if full_vacuum:
+        # Rebuilds the whole file, which also switches older databases to incremental vacuum
+        await conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        await conn.execute("VACUUM")
+    else:
+        [(auto_vacuum,)] = await conn.execute_fetchall("PRAGMA auto_vacuum")
+        if auto_vacuum == 2:
+            # Every step of the pragma frees one page, executescript() runs it to completion
+            await conn.executescript("PRAGMA incremental_vacuum")
+    size_after = await _database_size(conn)
+    report.size_bytes += size_after
+    report.bytes_reclaimed += size_before - size_after
+
+
+async def maintain_checkpoints(
+    savers: Iterable[BaseCheckpointSaver],
+    keep_per_thread: int | None = None,
+    thread_ttl: float | None = None,
+    full_vacuum: bool = False,
+) -> CheckpointMaintenanceReport:
+    """
+    Compact the SQLite databases behind savers.
+
+    Keeps the latest keep_per_thread checkpoints of every thread, deletes threads without a
+    checkpoint in the last thread_ttl seconds, deletes the pending writes of removed
+    checkpoints and returns free pages to the OS. full_vacuum rebuilds the database files.
+    Savers of other backends are skipped.
+    """
+    report = CheckpointMaintenanceReport()
+    # Savers by database file, several agents can share one
+    databases: defaultdict[str | int, list[AsyncSqliteSaver]] = defaultdict(list)
+    for saver in savers:
+        if not isinstance(saver, AsyncSqliteSaver):
+            continue
+        [(_, _, path), *_] = await saver.conn.execute_fetchall("PRAGMA database_list")
+        databases[path or id(saver.conn)].append(saver)
+    for sharing in databases.values():
+        async with AsyncExitStack() as stack:
+            # Hold the locks of every agent on the database, so none of them writes meanwhile,
+            # and commit what they have batched so their write transactions don't block ours
+            # (AsyncSqliteSaver leaves pending writes uncommitted until its next checkpoint)
+            for saver in sharing:
+                await stack.enter_async_context(saver.lock)
+                await _commit_now(saver.conn)
+            # Until an agent has set its saver up, the database has no checkpoint tables
+            if used := next((s for s in sharing if s.is_setup), None):
+                await _maintain_database(
+                    used.conn, report, keep_per_thread, thread_ttl, full_vacuum
+                )
+    return report
+
+
+async def run_checkpoint_maintenance(
+    savers: Iterable[BaseCheckpointSaver], full_vacuum: bool = False
+) -> CheckpointMaintenanceReport:
+    """Run maintain_checkpoints() with the configured limits and log what it reclaimed."""
+    report = await maintain_checkpoints(
+        savers,
+        keep_per_thread=settings.CHECKPOINT_KEEP_PER_THREAD,
+        thread_ttl=settings.CHECKPOINT_THREAD_TTL,
+        full_vacuum=full_vacuum,
+    )
+    logger.info(
+        f"Checkpoint maintenance deleted {report.checkpoints_deleted} checkpoints, "
+        f"{report.writes_deleted} writes and {report.threads_expired} threads, "
+        f"reclaimed {report.bytes_reclaimed} bytes, databases are {report.size_bytes} bytes"
+    )
+    return report
+
+
+async def checkpoint_maintenance_loop(
+    savers: Iterable[BaseCheckpointSaver], interval: float
+) -> None:
+    """Run checkpoint maintenance every interval seconds until cancelled."""
+    savers = list(savers)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_checkpoint_maintenance(savers)
+        except Exception as e:
+            logger.error(f"Checkpoint maintenance failed: {e}")
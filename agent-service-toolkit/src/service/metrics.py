@@ -0,0 +1,583 @@
+import threading
+import time
+from collections import Counter
+from collections.abc import AsyncIterator, Callable, Collection, Iterable, Iterator, Sequence
+from dataclasses import dataclass, field
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver, CheckpointTuple
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.routing import ROUTED_ATTEMPT_TAG
+from service.timeline import record_checkpoint
+from service.utils import token_usage
+
+
+@dataclass
+class StreamMetrics:
+    """Counters for /stream runs."""
+
+    started: int = 0
+    completed: int = 0
+    # Runs cancelled because the client went away before the graph finished
+    cancelled: int = 0
+    cancelled_by_agent: Counter[str] = field(default_factory=Counter)
+    # Reconnects that resumed a run with Last-Event-ID
+    resumed: int = 0
+
+    def record_cancelled(self, agent_id: str) -> None:
+        self.cancelled += 1
+        self.cancelled_by_agent[agent_id] += 1
+
+
+stream_metrics = StreamMetrics()
+
+
+# Metrics in the Prometheus text format, see https://prometheus.io/docs/instrumenting/exposition_formats/
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+RATE_BUCKETS = (1, 5, 10, 20, 50, 100, 200, 500, 1000)
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _sample(name: str, labels: dict[str, str], value: float) -> str:
+    if labels:
+        label_text = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+        return f"{name}{{{label_text}}} {value:g}"
+    return f"{name} {value:g}"
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: dict[tuple[str, ...], Any] = {}
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _samples(self) -> Iterator[str]:
+        for key, value in sorted(self._values.items()):
+            yield _sample(self.name, dict(zip(self.labels, key)), value)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        with self._lock:
+            yield from list(self._samples())
+
+
+class CounterMetric(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # Per-bucket counts followed by the sum and the total count
+            counts = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    def _samples(self) -> Iterator[str]:
+        for key, counts in sorted(self._values.items()):
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield _sample(f"{self.name}_bucket", {**labels, "le": f"{bound:g}"}, cumulative)
+            yield _sample(f"{self.name}_bucket", {**labels, "le": "+Inf"}, counts[-1])
+            yield _sample(f"{self.name}_sum", labels, counts[-2])
+            yield _sample(f"{self.name}_count", labels, counts[-1])
+
+
+# A collector returns (name, type, documentation, [(labels, value)]) for values kept elsewhere
+Collector = Callable[[], Iterable[tuple[str, str, str, list[tuple[dict[str, str], float]]]]]
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self.metrics: list[Metric] = []
+        self.collectors: list[Collector] = []
+
+    def add(self, metric: Metric) -> Any:
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Collector) -> Collector:
+        self.collectors.append(collector)
+        return collector
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            for name, type_, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {type_}")
+                lines.extend(_sample(name, labels, value) for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.add(
+    CounterMetric(
+        "agent_service_http_requests_total",
+        "HTTP requests by route, agent and status.",
+        ["method", "route", "agent", "status"],
+    )
+)
+http_request_duration = registry.add(
+    Histogram(
+        "agent_service_http_request_duration_seconds",
+        "Time from receiving an HTTP request to sending the end of its response.",
+        ["method", "route", "agent"],
+    )
+)
+stream_time_to_first_token = registry.add(
+    Histogram(
+        "agent_service_stream_time_to_first_token_seconds",
+        "Time from the start of a /stream run to its first token.",
+        ["agent"],
+    )
+)
+stream_tokens_per_second = registry.add(
+    Histogram(
+        "agent_service_stream_tokens_per_second",
+        "Tokens per second of a /stream run, from its first to its last token.",
+        ["agent"],
+        buckets=RATE_BUCKETS,
+    )
+)
+runs_in_flight = registry.add(
+    Gauge("agent_service_runs_in_flight", "Agent runs currently in progress.", ["agent"])
+)
+node_duration = registry.add(
+    Histogram(
+        "agent_service_graph_node_duration_seconds",
+        "Duration of graph node executions.",
+        ["agent", "node"],
+    )
+)
+llm_duration = registry.add(
+    Histogram(
+        "agent_service_llm_call_duration_seconds",
+        "Duration of LLM calls made by agents.",
+        ["agent", "provider", "model"],
+    )
+)
+llm_tokens = registry.add(
+    CounterMetric(
+        "agent_service_llm_tokens_total",
+        "Tokens used by LLM calls, by direction (input or output).",
+        ["agent", "provider", "model", "direction"],
+    )
+)
+checkpointer_duration = registry.add(
+    Histogram(
+        "agent_service_checkpointer_operation_duration_seconds",
+        "Duration of checkpointer reads (get, list) and writes (put, put_writes).",
+        ["agent", "operation"],
+    )
+)
+
+
+@registry.add_collector
+def _collect_stream_metrics():
+    yield (
+        "agent_service_streams_total",
+        "counter",
+        "/stream runs by outcome. Resumed counts reconnects.",
+        [
+            ({"outcome": "started"}, stream_metrics.started),
+            ({"outcome": "completed"}, stream_metrics.completed),
+            ({"outcome": "cancelled"}, stream_metrics.cancelled),
+            ({"outcome": "resumed"}, stream_metrics.resumed),
+        ],
+    )
+    yield (
+        "agent_service_streams_cancelled_total",
+        "counter",
+        "/stream runs cancelled because the client went away, by agent.",
+        [({"agent": agent}, count) for agent, count in stream_metrics.cancelled_by_agent.items()],
+    )
+
+
+@registry.add_collector
+def _collect_rate_limits():
+    from core.rate_limit import limiter_stats
+
+    stats = {str(provider): s for provider, s in limiter_stats().items()}
+    for attribute, name, type_, documentation in (
+        ("in_flight", "llm_requests_in_flight", "gauge", "LLM requests being made."),
+        ("queue_depth", "llm_rate_limit_queue_depth", "gauge", "LLM requests waiting."),
+        ("requests", "llm_rate_limited_requests_total", "counter", "LLM requests admitted."),
+        ("tokens", "llm_rate_limited_tokens_total", "counter", "LLM tokens admitted."),
+        ("total_wait_seconds", "llm_rate_limit_wait_seconds_total", "counter", "Time waited."),
+    ):
+        samples = [({"provider": p}, getattr(s, attribute)) for p, s in stats.items()]
+        yield f"agent_service_{name}", type_, documentation, samples
+
+
+@registry.add_collector
+def _collect_admission():
+    from service.admission import get_admission_controller
+
+    if not get_admission_controller.cache_info().currsize:
+        return
+    stats = get_admission_controller().stats()
+    yield (
+        "agent_service_admission_in_flight",
+        "gauge",
+        "Runs holding an admission slot, by agent.",
+        [({"agent": agent}, count) for agent, count in stats.in_flight_by_agent.items()],
+    )
+    yield (
+        "agent_service_admission_in_flight_by_key",
+        "gauge",
+        "Runs holding an admission slot, by API key.",
+        [({"key": key}, count) for key, count in stats.in_flight_by_key.items()],
+    )
+    yield (
+        "agent_service_admission_queue_depth",
+        "gauge",
+        "Runs waiting for an admission slot.",
+        [({}, stats.queue_depth)],
+    )
+    yield (
+        "agent_service_admission_decisions_total",
+        "counter",
+        "Admission decisions: admitted, rejected (queue full or shed) and timed out.",
+        [
+            ({"decision": "admitted"}, stats.admitted),
+            ({"decision": "rejected"}, stats.rejected),
+            ({"decision": "timed_out"}, stats.timed_out),
+        ],
+    )
+
+
+@registry.add_collector
+def _collect_api_keys():
+    from service.quotas import get_usage_tracker
+
+    if not get_usage_tracker.cache_info().currsize:
+        return
+    usage = get_usage_tracker().usage()
+    yield (
+        "agent_service_api_key_requests_total",
+        "counter",
+        "Runs admitted per API key, and runs rejected for the key's tokens per minute.",
+        [({"key": key, "outcome": "started"}, u.requests) for key, u in usage.items()]
+        + [({"key": key, "outcome": "rejected"}, u.rejected) for key, u in usage.items()],
+    )
+    yield (
+        "agent_service_api_key_tokens_total",
+        "counter",
+        "LLM tokens spent per API key.",
+        [({"key": key, "direction": "input"}, u.input_tokens) for key, u in usage.items()]
+        + [({"key": key, "direction": "output"}, u.output_tokens) for key, u in usage.items()],
+    )
+
+
+@registry.add_collector
+def _collect_caches():
+    # The caches are only created when used, collecting shouldn't create them
+    from agents.llama_guard import get_llama_guard
+    from core.llm_cache import get_response_cache
+
+    if get_response_cache.cache_info().currsize:
+        stats = get_response_cache().stats()
+        yield (
+            "agent_service_llm_cache_lookups_total",
+            "counter",
+            "LLM response cache lookups by result.",
+            [
+                ({"result": "exact_hit"}, stats.exact_hits),
+                ({"result": "semantic_hit"}, stats.semantic_hits),
+                ({"result": "miss"}, stats.misses),
+            ],
+        )
+        yield (
+            "agent_service_llm_cache_entries",
+            "gauge",
+            "LLM responses cached.",
+            [({}, stats.size)],
+        )
+    if get_llama_guard.cache_info().currsize:
+        stats = get_llama_guard().stats()
+        yield (
+            "agent_service_llama_guard_cache_lookups_total",
+            "counter",
+            "LlamaGuard verdict cache lookups by result.",
+            [({"result": "hit"}, stats.hits), ({"result": "miss"}, stats.misses)],
+        )
+
+
+class RunMetricsHandler(BaseCallbackHandler):
+    """
+    Records run, graph node and LLM call metrics of an agent run.
+
+    Added to the callbacks of every run, so invoke, batch, stream and WebSocket runs are all
+    measured. It only does bookkeeping, so it runs inline rather than in a thread.
+    """
+
+    run_inline = True
+
+    def __init__(self, agent_id: str) -> None:
+        self.agent_id = agent_id
+        self._started: dict[UUID, tuple[float, str]] = {}
+        self._llm_calls: dict[UUID, tuple[float, str, str]] = {}
+
+    def on_chain_start(
+        self,
+        serialized: dict[str, Any],
+        inputs: dict[str, Any],
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        tags: list[str] | None = None,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> None:
+        if parent_run_id is None:
+            runs_in_flight.inc(agent=self.agent_id)
+            self._started[run_id] = (time.perf_counter(), "")
+        elif any(t.startswith("graph:step:") for t in tags or []):
+            node = (metadata or {}).get("langgraph_node") or kwargs.get("name") or ""
+            if node == kwargs.get("name", node):
+                self._started[run_id] = (time.perf_counter(), node)
+
+    def _end_chain(self, run_id: UUID, parent_run_id: UUID | None) -> None:
+        if (started := self._started.pop(run_id, None)) is None:
+            return
+        if parent_run_id is None:
+            runs_in_flight.dec(agent=self.agent_id)
+        else:
+            start, node = started
+            node_duration.observe(time.perf_counter() - start, agent=self.agent_id, node=node)
+
+    def on_chain_end(
+        self, outputs: Any, *, run_id: UUID, parent_run_id: UUID | None = None, **kwargs: Any
+    ) -> None:
+        self._end_chain(run_id, parent_run_id)
+
+    def on_chain_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        **kwargs: Any,
+    ) -> None:
+        self._end_chain(run_id, parent_run_id)
+
+    def on_chat_model_start(
+        self,
+        serialized: dict[str, Any],
+        messages: list[list[Any]],
+        *,
+        run_id: UUID,
+        tags: list[str] | None = None,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> None:
+        # Counted once, as the routed call that re-emits the winning attempt
+        if ROUTED_ATTEMPT_TAG in (tags or []):
+            return
+        metadata = metadata or {}
+        provider = metadata.get("ls_provider", "")
+        model = metadata.get("ls_model_name", "")
+        self._llm_calls[run_id] = (time.perf_counter(), provider, model)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        if (call := self._llm_calls.pop(run_id, None)) is None:
+            return
+        started, provider, model = call
+        labels = {"agent": self.agent_id, "provider": provider, "model": model}
+        llm_duration.observe(time.perf_counter() - started, **labels)
+        input_tokens, output_tokens = token_usage(response)
+        if input_tokens:
+            llm_tokens.inc(input_tokens, direction="input", **labels)
+        if output_tokens:
+            llm_tokens.inc(output_tokens, direction="output", **labels)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        if (call := self._llm_calls.pop(run_id, None)) is not None:
+            started, provider, model = call
+            llm_duration.observe(
+                time.perf_counter() - started, agent=self.agent_id, provider=provider, model=model
+            )
+
+
+class InstrumentedCheckpointer(BaseCheckpointSaver):
+    """
+    Checkpointer that times the async reads and writes of an agent's checkpointer.
+
+    The durations are recorded as metrics and added to run timelines. Everything else,
+    including attributes of the wrapped saver such as its connection, is delegated to it.
+    """
+
+    def __init__(self, saver: BaseCheckpointSaver, agent_id: str) -> None:
+        super().__init__(serde=saver.serde)
+        self.saver = saver
+        self.agent_id = agent_id
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.saver, name)
+
+    @property
+    def config_specs(self) -> list:
+        return self.saver.config_specs
+
+    def _record(self, config: Any, operation: str, started: float) -> None:
+        ended = time.perf_counter()
+        checkpointer_duration.observe(ended - started, agent=self.agent_id, operation=operation)
+        record_checkpoint(config, operation, started, ended)
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return self.saver.get_tuple(config)
+
+    def list(self, config: RunnableConfig | None, **kwargs: Any) -> Iterator[CheckpointTuple]:
+        return self.saver.list(config, **kwargs)
+
+    def put(self, config: RunnableConfig, *args: Any, **kwargs: Any) -> RunnableConfig:
+        return self.saver.put(config, *args, **kwargs)
+
+    def put_writes(self, config: RunnableConfig, *args: Any, **kwargs: Any) -> None:
+        self.saver.put_writes(config, *args, **kwargs)
+
+    def get_next_version(self, current: Any, channel: Any) -> Any:
+        return self.saver.get_next_version(current, channel)
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        started = time.perf_counter()
+        try:
+            return await self.saver.aget_tuple(config)
+        finally:
+            self._record(config, "get", started)
+
+    async def alist(
+        self, config: RunnableConfig | None, **kwargs: Any
+    ) -> AsyncIterator[CheckpointTuple]:
+        started = time.perf_counter()
+        try:
+            async for item in self.saver.alist(config, **kwargs):
+                yield item
+        finally:
+            self._record(config, "list", started)
+
+    async def aput(self, config: RunnableConfig, *args: Any, **kwargs: Any) -> RunnableConfig:
+        started = time.perf_counter()
+        try:
+            return await self.saver.aput(config, *args, **kwargs)
+        finally:
+            self._record(config, "put", started)
+
+    async def aput_writes(self, config: RunnableConfig, *args: Any, **kwargs: Any) -> None:
+        started = time.perf_counter()
+        try:
+            await self.saver.aput_writes(config, *args, **kwargs)
+        finally:
+            self._record(config, "put_writes", started)
+
+
+class HTTPMetricsMiddleware:
+    """
+    Counts HTTP requests and measures their duration, by route template and agent.
+
+    Unlike a BaseHTTPMiddleware, it measures until the end of the response body, so
+    streamed responses are timed completely, and it doesn't get in the way of disconnects.
+    """
+
+    def __init__(
+        self, app: ASGIApp, default_agent: str = "", agent_ids: Collection[str] = ()
+    ) -> None:
+        self.app = app
+        self.default_agent = default_agent
+        # Any other agent id in a request is labeled "unknown", so that requests for made
+        # up agents can't add series without bound
+        self.agent_ids = frozenset(agent_ids) | {default_agent}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router records the matched route in the scope
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            agent = ""
+            if route is not None and _has_agent_param(route):
+                agent = scope.get("path_params", {}).get("agent_id", self.default_agent)
+                if agent not in self.agent_ids:
+                    agent = "unknown"
+            labels = {"method": scope["method"], "route": route_path, "agent": agent}
+            http_requests.inc(status=str(status), **labels)
+            http_request_duration.observe(time.perf_counter() - started, **labels)
+
+
+def _has_agent_param(route: Any) -> bool:
+    dependant = getattr(route, "dependant", None)
+    if dependant is None:
+        return False
+    params = dependant.path_params + dependant.query_params
+    return any(param.name == "agent_id" for param in params)
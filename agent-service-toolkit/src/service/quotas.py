@@ -0,0 +1,95 @@
+import math
+import time
+from collections import defaultdict
+from dataclasses import dataclass, replace
+from functools import cache
+from typing import Any
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from core.rate_limit import TokenBucket
+from core.routing import ROUTED_ATTEMPT_TAG
+from core.settings import ApiKeyConfig
+from service.admission import Overloaded, key_name
+from service.utils import token_usage
+
+
+class QuotaExceeded(Overloaded):
+    """The API key spent its tokens per minute. Retry after retry_after seconds."""
+
+
+@dataclass
+class KeyUsage:
+    requests: int = 0
+    # Rejected because the key had spent its tokens per minute
+    rejected: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+class UsageTracker:
+    """
+    Counts runs and LLM tokens per API key, and enforces each key's tokens per minute.
+
+    How many tokens a run takes is only known once its LLM calls finish, so a run is
+    admitted while its key has budget left and may overdraw it. Runs of the key are then
+    rejected until the budget has refilled past the overdraft.
+    """
+
+    def __init__(self) -> None:
+        self._usage: defaultdict[str, KeyUsage] = defaultdict(KeyUsage)
+        self._budgets: dict[str, TokenBucket] = {}
+
+    def _budget(self, api_key: ApiKeyConfig | None) -> TokenBucket | None:
+        if api_key is None or api_key.tokens_per_minute is None:
+            return None
+        budget = self._budgets.get(api_key.name)
+        if budget is None or budget.capacity != api_key.tokens_per_minute:
+            budget = self._budgets[api_key.name] = TokenBucket(api_key.tokens_per_minute)
+        budget.refill(time.monotonic())
+        return budget
+
+    def check(self, api_key: ApiKeyConfig | None) -> None:
+        """Raise QuotaExceeded, and count the rejection, if api_key has no tokens left."""
+        budget = self._budget(api_key)
+        if budget is not None and budget.tokens <= 0:
+            self._usage[key_name(api_key)].rejected += 1
+            retry_after = max(1, math.ceil(budget.seconds_until(1)))
+            raise QuotaExceeded("API key exceeded its tokens per minute", retry_after)
+
+    def start(self, api_key: ApiKeyConfig | None) -> None:
+        """Count a run of api_key, once it has been admitted."""
+        self._usage[key_name(api_key)].requests += 1
+
+    def record(self, api_key: ApiKeyConfig | None, input_tokens: int, output_tokens: int) -> None:
+        usage = self._usage[key_name(api_key)]
+        usage.input_tokens += input_tokens
+        usage.output_tokens += output_tokens
+        if budget := self._budget(api_key):
+            budget.tokens -= input_tokens + output_tokens
+
+    def usage(self) -> dict[str, KeyUsage]:
+        return {key: replace(usage) for key, usage in self._usage.items()}
+
+
+class UsageHandler(BaseCallbackHandler):
+    """Charges the LLM tokens of an agent run to the API key that started it."""
+
+    run_inline = True
+
+    def __init__(self, api_key: ApiKeyConfig | None) -> None:
+        self.api_key = api_key
+
+    def on_llm_end(
+        self, response: LLMResult, *, tags: list[str] | None = None, **kwargs: Any
+    ) -> None:
+        # A routed call reports the usage of its winning attempt itself
+        if ROUTED_ATTEMPT_TAG in (tags or []):
+            return
+        get_usage_tracker().record(self.api_key, *token_usage(response))
+
+
+@cache
+def get_usage_tracker() -> UsageTracker:
+    return UsageTracker()
@@ -1,71 +1,194 @@
+import asyncio
+import hmac
 import json
 import logging
+import time
 import warnings
-from collections.abc import AsyncGenerator
-from contextlib import asynccontextmanager
-from typing import Annotated, Any
+from collections import defaultdict
+from collections.abc import AsyncGenerator, AsyncIterator, Awaitable, Callable
+from contextlib import aclosing, asynccontextmanager, nullcontext
+from dataclasses import asdict
+from functools import partial
+from typing import Annotated, Any, get_args
 from uuid import UUID, uuid4
 
-from fastapi import APIRouter, Depends, FastAPI, HTTPException, status
-from fastapi.responses import StreamingResponse
+from fastapi import (
+    APIRouter,
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from fastapi.responses import PlainTextResponse
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from langchain_core._api import LangChainBetaWarning
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.messages import AnyMessage, HumanMessage
 from langchain_core.runnables import RunnableConfig
-from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.checkpoint.base import CheckpointTuple
 from langgraph.graph.state import CompiledStateGraph
 from langgraph.types import Command
 from langsmith import Client as LangsmithClient
+from pydantic import ValidationError
 
-from agents import DEFAULT_AGENT, get_agent, get_all_agent_info
+from agents import DEFAULT_AGENT, aget_agent, get_all_agent_info, load_agents, set_checkpointer
 from core import settings
+from core.routing import ROUTED_ATTEMPT_TAG
+from core.settings import ApiKeyConfig
 from schema import (
+    ApiKeyUsage,
+    BatchInput,
+    BatchOutput,
+    BatchResult,
     ChatHistory,
     ChatHistoryInput,
     ChatMessage,
+    CheckpointMaintenanceReport,
     Feedback,
     FeedbackResponse,
+    RunTimeline,
     ServiceMetadata,
     StreamInput,
     UserInput,
 )
+from service.admission import (
+    ANONYMOUS,
+    AdmissionSlot,
+    Overloaded,
+    Priority,
+    get_admission_controller,
+    key_name,
+)
+from service.checkpointer import (
+    agent_checkpointers,
+    checkpoint_maintenance_loop,
+    run_checkpoint_maintenance,
+)
+from service.metrics import (
+    METRICS_CONTENT_TYPE,
+    HTTPMetricsMiddleware,
+    InstrumentedCheckpointer,
+    RunMetricsHandler,
+    registry,
+    stream_metrics,
+    stream_time_to_first_token,
+    stream_tokens_per_second,
+)
+from service.quotas import QuotaExceeded, UsageHandler, get_usage_tracker
+from service.sse import (
+    DONE_FRAME,
+    ERROR_FRAME,
+    EventStreamResponse,
+    TokenCoalescer,
+    encode_message,
+    encode_token,
+    encode_websocket_event,
+)
+from service.streams import get_stream_run, start_stream_run
+from service.timeline import TimelineTracer, chrome_trace, get_timeline
 from service.utils import (
     convert_message_content_to_string,
     langchain_to_chat_message,
     remove_tool_calls,
 )
+from service.warmup import warmup
 
 warnings.filterwarnings("ignore", category=LangChainBetaWarning)
 logger = logging.getLogger(__name__)
 
 
+def _api_keys() -> list[ApiKeyConfig]:
+    api_keys = list(settings.API_KEYS)
+    if settings.AUTH_SECRET:
+        api_keys.append(ApiKeyConfig(name="default", key=settings.AUTH_SECRET, admin=True))
+    return api_keys
+
+
+def _authenticate(credentials: str | None) -> ApiKeyConfig | None:
+    """The API key matching the bearer credentials, or None if auth is disabled."""
+    api_keys = _api_keys()
+    if not api_keys:
+        return None
+    for api_key in api_keys:
+        secret = api_key.key.get_secret_value()
+        if credentials is not None and hmac.compare_digest(credentials.encode(), secret.encode()):
+            return api_key
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+
+
 def verify_bearer(
     http_auth: Annotated[
         HTTPAuthorizationCredentials | None,
-        Depends(HTTPBearer(description="Please provide AUTH_SECRET api key.", auto_error=False)),
+        Depends(
+            HTTPBearer(
+                description="Please provide AUTH_SECRET or one of API_KEYS.", auto_error=False
+            )
+        ),
     ],
-) -> None:
-    if not settings.AUTH_SECRET:
-        return
-    auth_secret = settings.AUTH_SECRET.get_secret_value()
-    if not http_auth or http_auth.credentials != auth_secret:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+) -> ApiKeyConfig | None:
+    return _authenticate(http_auth.credentials if http_auth else None)
+
+
+# The API key of the request, for quotas and usage accounting
+ApiKey = Annotated[ApiKeyConfig | None, Depends(verify_bearer)]
+
+
+def verify_admin(api_key: ApiKey) -> None:
+    """Only let AUTH_SECRET and admin API keys through. Everyone is admin if auth is off."""
+    if api_key is not None and not api_key.admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
-    # Construct agent with Sqlite checkpointer
-    # TODO: It's probably dangerous to share the same checkpointer on multiple agents
-    async with AsyncSqliteSaver.from_conn_string("checkpoints.db") as saver:
-        agents = get_all_agent_info()
-        for a in agents:
-            agent = get_agent(a.key)
-            agent.checkpointer = saver
-        yield
-    # context manager will clean up the AsyncSqliteSaver on exit
+    # Give agents their own checkpointer, so they don't share a connection. Agent graphs are
+    # built on first use, unless they are listed in PRELOAD_AGENTS.
+    agent_ids = [a.key for a in get_all_agent_info()]
+    async with agent_checkpointers(agent_ids) as checkpointers:
+        # Maintenance and warmup use the savers themselves, agents use them instrumented
+        app.state.checkpointers = checkpointers
+        for agent_id, saver in checkpointers.items():
+            set_checkpointer(agent_id, InstrumentedCheckpointer(saver, agent_id))
+        preload = agent_ids if "*" in settings.PRELOAD_AGENTS else settings.PRELOAD_AGENTS
+        app.state.ready = False
+        warming_up = None
+        if settings.WARMUP_ENABLED:
+
+            async def warm_up() -> None:
+                await warmup(preload, checkpointers.values())
+                app.state.ready = True
+
+            warming_up = asyncio.create_task(warm_up())
+        else:
+            load_agents(preload)
+            app.state.ready = True
+        maintenance = None
+        if settings.CHECKPOINT_MAINTENANCE_INTERVAL > 0:
+            maintenance = asyncio.create_task(
+                checkpoint_maintenance_loop(
+                    checkpointers.values(), settings.CHECKPOINT_MAINTENANCE_INTERVAL
+                )
+            )
+        try:
+            yield
+        finally:
+            background = [task for task in (warming_up, maintenance) if task]
+            for task in background:
+                task.cancel()
+            await asyncio.gather(*background, return_exceptions=True)
+    # context manager flushes pending checkpoint writes and closes the connections on exit
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(
+    HTTPMetricsMiddleware,
+    default_agent=DEFAULT_AGENT,
+    agent_ids=[a.key for a in get_all_agent_info()],
+)
 router = APIRouter(dependencies=[Depends(verify_bearer)])
 
 
@@ -81,7 +204,9 @@ async def info() -> ServiceMetadata:
     )
 
 
-def _parse_input(user_input: UserInput) -> tuple[dict[str, Any], UUID]:
+def _parse_input(
+    user_input: UserInput, agent_id: str, api_key: ApiKeyConfig | None = None
+) -> tuple[dict[str, Any], UUID]:
     run_id = uuid4()
     thread_id = user_input.thread_id or str(uuid4())
 
@@ -94,99 +219,362 @@ def _parse_input(user_input: UserInput) -> tuple[dict[str, Any], UUID]:
             )
         configurable.update(user_input.agent_config)
 
+    callbacks: list[BaseCallbackHandler] = [RunMetricsHandler(agent_id), UsageHandler(api_key)]
+    if settings.RUN_TIMELINE_ENABLED:
+        callbacks.append(TimelineTracer(run_id, agent_id, thread_id, key_name(api_key)))
     kwargs = {
         "input": {"messages": [HumanMessage(content=user_input.message)]},
         "config": RunnableConfig(
             configurable=configurable,
             run_id=run_id,
+            callbacks=callbacks,
+            # Saved with the thread's checkpoints, only this API key may read or continue it
+            metadata={"owner": key_name(api_key)},
         ),
     }
     return kwargs, run_id
 
 
+async def _owned_checkpoint(
+    agent: CompiledStateGraph, thread_id: str, api_key: ApiKeyConfig | None
+) -> CheckpointTuple | None:
+    """
+    The latest checkpoint of thread_id, None for a new thread. Raises a 404 if another API
+    key started the thread. Threads from before owners were recorded count as anonymous.
+    """
+    checkpoint = await agent.checkpointer.aget_tuple(
+        RunnableConfig(configurable={"thread_id": thread_id})
+    )
+    if checkpoint is not None and checkpoint.metadata.get("owner", ANONYMOUS) != key_name(api_key):
+        raise HTTPException(status_code=404, detail="Thread not found")
+    return checkpoint
+
+
+async def _check_thread_owner(
+    agent_id: str, user_input: UserInput, api_key: ApiKeyConfig | None
+) -> None:
+    """Only let the API key that started a thread continue it."""
+    # Without API keys every request is anonymous, so there is nothing to check
+    if user_input.thread_id and _api_keys():
+        await _owned_checkpoint(await aget_agent(agent_id), user_input.thread_id, api_key)
+
+
 @router.post("/{agent_id}/invoke")
 @router.post("/invoke")
-async def invoke(user_input: UserInput, agent_id: str = DEFAULT_AGENT) -> ChatMessage:
+async def invoke(
+    user_input: UserInput,
+    agent_id: str = DEFAULT_AGENT,
+    x_priority: Annotated[Priority, Header()] = "normal",
+    api_key: ApiKey = None,
+) -> ChatMessage:
     """
     Invoke an agent with user input to retrieve a final response.
 
     If agent_id is not provided, the default agent will be used.
     Use thread_id to persist and continue a multi-turn conversation. run_id kwarg
     is also attached to messages for recording feedback.
+
+    When the service is saturated, the request waits for a free slot in the order of its
+    `X-Priority` header, or fails with a 503 and a `Retry-After` header. A request whose
+    API key spent its tokens per minute fails with a 429 and a `Retry-After` header.
     """
-    agent: CompiledStateGraph = get_agent(agent_id)
-    kwargs, run_id = _parse_input(user_input)
+    agent: CompiledStateGraph = await aget_agent(agent_id)
+    await _check_thread_owner(agent_id, user_input, api_key)
+    kwargs, run_id = _parse_input(user_input, agent_id, api_key)
+    coalesce_key = _coalesce_key(user_input, agent_id, api_key)
+    run = partial(_admitted_invoke, agent_id, x_priority, api_key, agent, kwargs, run_id)
+    if coalesce_key is None:
+        return await run()
+    return await _coalesced_invoke(coalesce_key, run)
+
+
+async def _admitted_invoke(
+    agent_id: str,
+    priority: Priority,
+    api_key: ApiKeyConfig | None,
+    agent: CompiledStateGraph,
+    kwargs: dict[str, Any],
+    run_id: UUID,
+) -> ChatMessage:
+    """Wait for an admission slot, then invoke the agent while holding it."""
+    with await _admit(agent_id, priority, api_key):
+        try:
+            return await _ainvoke_agent(agent, kwargs, run_id)
+        except Exception as e:
+            logger.error(f"An exception occurred: {e}")
+            raise HTTPException(status_code=500, detail="Unexpected error")
+
+
+async def _acquire(
+    agent_id: str, priority: Priority, api_key: ApiKeyConfig | None
+) -> AdmissionSlot:
+    """Check the API key's quota and wait for an admission slot. Raises Overloaded if not."""
+    tracker = get_usage_tracker()
+    tracker.check(api_key)
+    slot = await get_admission_controller().acquire(agent_id, priority, api_key)
+    # Only counted once admitted, runs shed under load weren't served
+    tracker.start(api_key)
+    return slot
+
+
+async def _admit(agent_id: str, priority: Priority, api_key: ApiKeyConfig | None) -> AdmissionSlot:
+    """Wait for an admission slot for a run, or fail with a 429 or 503 if it's rejected."""
     try:
-        response = await agent.ainvoke(**kwargs)
-        output = langchain_to_chat_message(response["messages"][-1])
-        output.run_id = str(run_id)
-        return output
-    except Exception as e:
-        logger.error(f"An exception occurred: {e}")
-        raise HTTPException(status_code=500, detail="Unexpected error")
+        return await _acquire(agent_id, priority, api_key)
+    except Overloaded as e:
+        code = (
+            status.HTTP_429_TOO_MANY_REQUESTS
+            if isinstance(e, QuotaExceeded)
+            else status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        raise HTTPException(
+            status_code=code, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+        )
 
 
-async def message_generator(
-    user_input: StreamInput, agent_id: str = DEFAULT_AGENT
-) -> AsyncGenerator[str, None]:
+# In-flight /invoke runs that identical requests can attach to, keyed by _coalesce_key()
+_inflight_invokes: dict[tuple[str, ...], asyncio.Task[ChatMessage]] = {}
+
+
+def _coalesce_key(
+    user_input: UserInput, agent_id: str, api_key: ApiKeyConfig | None
+) -> tuple[str, ...] | None:
+    # Requests with a thread_id read and write conversation state, so they must run on their own
+    if not settings.COALESCE_INVOKES or user_input.thread_id:
+        return None
+    agent_config = json.dumps(user_input.agent_config, sort_keys=True, default=str)
+    # Runs are only shared within an API key, which is charged for their tokens
+    return (agent_id, key_name(api_key), str(user_input.model), user_input.message, agent_config)
+
+
+async def _coalesced_invoke(
+    key: tuple[str, ...], run: Callable[[], Awaitable[ChatMessage]]
+) -> ChatMessage:
     """
-    Generate a stream of messages from the agent.
+    Single-flight wrapper around an admitted invoke.
+
+    The first request for a key starts run() as a task; identical requests that arrive
+    while it is in flight await the same task and receive a copy of its result (or its
+    exception, including an admission rejection). The task takes the run's one admission
+    slot and holds it until the run ends, so the requests sharing it count once against
+    the admission caps and the key's quota. The task is shielded so a disconnecting caller
+    does not cancel the run for the others. Only the first request gets the run_id, since
+    feedback on the run is the first requester's; the copies have no run_id.
+    """
+    task = _inflight_invokes.get(key)
+    leader = task is None
+    if task is None:
+        task = asyncio.ensure_future(run())
+        _inflight_invokes[key] = task
+
+        def _forget(done: asyncio.Task[ChatMessage]) -> None:
+            if _inflight_invokes.get(key) is done:
+                del _inflight_invokes[key]
+
+        task.add_done_callback(_forget)
+    else:
+        logger.debug(f"Coalescing /invoke request onto in-flight run for agent {key[0]}")
+    output = await asyncio.shield(task)
+    return output.model_copy(deep=True, update=None if leader else {"run_id": None})
+
+
+async def _ainvoke_agent(
+    agent: CompiledStateGraph, kwargs: dict[str, Any], run_id: UUID
+) -> ChatMessage:
+    response = await agent.ainvoke(**kwargs)
+    output = langchain_to_chat_message(response["messages"][-1])
+    output.run_id = str(run_id)
+    return output
+
+
+@router.post("/{agent_id}/batch")
+@router.post("/batch")
+async def batch(
+    batch_input: BatchInput,
+    agent_id: str = DEFAULT_AGENT,
+    x_priority: Annotated[Priority, Header()] = "normal",
+    api_key: ApiKey = None,
+) -> BatchOutput:
+    """
+    Invoke an agent with many user inputs concurrently.
 
-    This is the workhorse method for the /stream endpoint.
+    If agent_id is not provided, the default agent will be used.
+    Inputs run with bounded concurrency and results are returned in input order.
+    A failing input does not fail the batch; its result carries an error instead.
+    Every input is admitted on its own, so inputs rejected under load fail individually.
+    Inputs with the same thread_id are turns of one conversation, so they run one after
+    another in input order rather than racing on the thread's checkpoint.
     """
-    agent: CompiledStateGraph = get_agent(agent_id)
-    kwargs, run_id = _parse_input(user_input)
-
-    # Process streamed events from the graph and yield messages over the SSE stream.
-    async for event in agent.astream_events(**kwargs, version="v2"):
-        if not event:
-            continue
-
-        new_messages = []
-        # Yield messages written to the graph state after node execution finishes.
-        if (
-            event["event"] == "on_chain_end"
-            # on_chain_end gets called a bunch of times in a graph execution
-            # This filters out everything except for "graph node finished"
-            and any(t.startswith("graph:step:") for t in event.get("tags", []))
-        ):
-            if isinstance(event["data"]["output"], Command):
-                new_messages = event["data"]["output"].update.get("messages", [])
-            elif "messages" in event["data"]["output"]:
-                new_messages = event["data"]["output"]["messages"]
-
-        # Also yield intermediate messages from agents.utils.CustomData.adispatch().
-        if event["event"] == "on_custom_event" and "custom_data_dispatch" in event.get("tags", []):
-            new_messages = [event["data"]]
-
-        for message in new_messages:
+    agent: CompiledStateGraph = await aget_agent(agent_id)
+    max_concurrency = min(
+        batch_input.max_concurrency or settings.MAX_BATCH_CONCURRENCY,
+        settings.MAX_BATCH_CONCURRENCY,
+    )
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # asyncio.Lock wakes its waiters in FIFO order, and the runs start in input order
+    thread_locks: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def run(user_input: UserInput) -> BatchResult:
+        thread_lock = thread_locks[user_input.thread_id] if user_input.thread_id else nullcontext()
+        async with thread_lock, semaphore:
             try:
-                chat_message = langchain_to_chat_message(message)
-                chat_message.run_id = str(run_id)
+                await _check_thread_owner(agent_id, user_input, api_key)
+                kwargs, run_id = _parse_input(user_input, agent_id, api_key)
+                with await _acquire(agent_id, x_priority, api_key):
+                    return BatchResult(message=await _ainvoke_agent(agent, kwargs, run_id))
+            except Overloaded as e:
+                return BatchResult(error=f"{e}, retry after {e.retry_after}s")
+            except HTTPException as e:
+                return BatchResult(error=str(e.detail))
             except Exception as e:
-                logger.error(f"Error parsing message: {e}")
-                yield f"data: {json.dumps({'type': 'error', 'content': 'Unexpected error'})}\n\n"
+                logger.error(f"An exception occurred: {e}")
+                return BatchResult(error="Unexpected error")
+
+    results = await asyncio.gather(*(run(user_input) for user_input in batch_input.inputs))
+    return BatchOutput(results=results)
+
+
+async def _with_deadlines(
+    events: AsyncIterator[dict[str, Any]], timeout: Callable[[], float | None]
+) -> AsyncGenerator[dict[str, Any] | None, None]:
+    """Yield from events, and yield None whenever timeout() passes before the next event."""
+    pending: asyncio.Future | None = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(anext(events))
+            # Waiting on the task rather than wait_for() keeps the event stream intact
+            done, _ = await asyncio.wait({pending}, timeout=timeout())
+            if not done:
+                yield None
                 continue
-            # LangGraph re-sends the input message, which feels weird, so drop it
-            if chat_message.type == "human" and chat_message.content == user_input.message:
+            task, pending = pending, None
+            try:
+                event = task.result()
+            except StopAsyncIteration:
+                return
+            yield event
+    finally:
+        if pending is not None:
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+
+
+async def message_generator(
+    user_input: StreamInput, agent_id: str = DEFAULT_AGENT, api_key: ApiKeyConfig | None = None
+) -> AsyncGenerator[bytes, None]:
+    """
+    Generate a stream of messages from the agent.
+
+    This is the workhorse method for the /stream endpoint.
+    """
+    agent: CompiledStateGraph = await aget_agent(agent_id)
+    kwargs, run_id = _parse_input(user_input, agent_id, api_key)
+
+    graph_events = agent.astream_events(**kwargs, version="v2")
+    events = graph_events
+    coalescer = None
+    if user_input.coalesce_tokens:
+        coalescer = TokenCoalescer(
+            max_bytes=user_input.coalesce_max_bytes,
+            window=user_input.coalesce_window_ms / 1000,
+        )
+        events = _with_deadlines(events, coalescer.timeout)
+
+    stream_metrics.started += 1
+    finished = False
+    started = time.perf_counter()
+    first_token_at = last_token_at = None
+    tokens = 0
+    try:
+        # Process streamed events from the graph and yield messages over the SSE stream.
+        async for event in events:
+            # Send buffered tokens when they are due or when the model's message is complete
+            if coalescer and (event is None or event["event"] == "on_chat_model_end"):
+                if frame := coalescer.flush():
+                    yield frame
+            if not event:
                 continue
-            yield f"data: {json.dumps({'type': 'message', 'content': chat_message.model_dump()})}\n\n"
 
-        # Yield tokens streamed from LLMs.
-        if (
-            event["event"] == "on_chat_model_stream"
-            and user_input.stream_tokens
-            and "llama_guard" not in event.get("tags", [])
-        ):
-            content = remove_tool_calls(event["data"]["chunk"].content)
-            if content:
-                # Empty content in the context of OpenAI usually means
-                # that the model is asking for a tool to be invoked.
-                # So we only print non-empty content.
-                yield f"data: {json.dumps({'type': 'token', 'content': convert_message_content_to_string(content)})}\n\n"
-            continue
+            new_messages = []
+            # Yield messages written to the graph state after node execution finishes.
+            if (
+                event["event"] == "on_chain_end"
+                # on_chain_end gets called a bunch of times in a graph execution
+                # This filters out everything except for "graph node finished"
+                and any(t.startswith("graph:step:") for t in event.get("tags", []))
+            ):
+                if isinstance(event["data"]["output"], Command):
+                    new_messages = event["data"]["output"].update.get("messages", [])
+                elif "messages" in event["data"]["output"]:
+                    new_messages = event["data"]["output"]["messages"]
+
+            # Also yield intermediate messages from agents.utils.CustomData.adispatch().
+            if event["event"] == "on_custom_event" and "custom_data_dispatch" in event.get(
+                "tags", []
+            ):
+                new_messages = [event["data"]]
+
+            # Tokens always arrive before the messages that follow them
+            if coalescer and new_messages and (frame := coalescer.flush()):
+                yield frame
+            for message in new_messages:
+                try:
+                    chat_message = langchain_to_chat_message(message)
+                    chat_message.run_id = str(run_id)
+                except Exception as e:
+                    logger.error(f"Error parsing message: {e}")
+                    yield ERROR_FRAME
+                    continue
+                # LangGraph re-sends the input message, which feels weird, so drop it
+                if chat_message.type == "human" and chat_message.content == user_input.message:
+                    continue
+                yield encode_message(chat_message)
+
+            # Yield tokens streamed from LLMs.
+            if (
+                event["event"] == "on_chat_model_stream"
+                and user_input.stream_tokens
+                and "llama_guard" not in event.get("tags", [])
+                and ROUTED_ATTEMPT_TAG not in event.get("tags", [])
+            ):
+                content = remove_tool_calls(event["data"]["chunk"].content)
+                if content:
+                    last_token_at = time.perf_counter()
+                    tokens += 1
+                    if first_token_at is None:
+                        first_token_at = last_token_at
+                        stream_time_to_first_token.observe(first_token_at - started, agent=agent_id)
+                    # Empty content in the context of OpenAI usually means
+                    # that the model is asking for a tool to be invoked.
+                    # So we only print non-empty content.
+                    token = convert_message_content_to_string(content)
+                    if coalescer:
+                        if frame := coalescer.add(token):
+                            yield frame
+                    else:
+                        yield encode_token(token)
+                continue
 
-    yield "data: [DONE]\n\n"
+        finished = True
+        stream_metrics.completed += 1
+        if tokens > 1 and last_token_at > first_token_at:
+            stream_tokens_per_second.observe(
+                (tokens - 1) / (last_token_at - first_token_at), agent=agent_id
+            )
+        if coalescer and (frame := coalescer.flush()):
+            yield frame
+        yield DONE_FRAME
+    except (GeneratorExit, asyncio.CancelledError):
+        if not finished:
+            stream_metrics.record_cancelled(agent_id)
+            logger.info(f"Stream closed before the run finished, cancelling run {run_id}")
+        raise
+    finally:
+        # Closing the event stream cancels the graph run, including provider calls in flight
+        if events is not graph_events:
+            await events.aclose()
+        await graph_events.aclose()
 
 
 def _sse_response_example() -> dict[int, Any]:
@@ -204,10 +592,16 @@ def _sse_response_example() -> dict[int, Any]:
 
 
 @router.post(
-    "/{agent_id}/stream", response_class=StreamingResponse, responses=_sse_response_example()
+    "/{agent_id}/stream", response_class=EventStreamResponse, responses=_sse_response_example()
 )
-@router.post("/stream", response_class=StreamingResponse, responses=_sse_response_example())
-async def stream(user_input: StreamInput, agent_id: str = DEFAULT_AGENT) -> StreamingResponse:
+@router.post("/stream", response_class=EventStreamResponse, responses=_sse_response_example())
+async def stream(
+    user_input: StreamInput,
+    agent_id: str = DEFAULT_AGENT,
+    last_event_id: Annotated[str | None, Header()] = None,
+    x_priority: Annotated[Priority, Header()] = "normal",
+    api_key: ApiKey = None,
+) -> EventStreamResponse:
     """
     Stream an agent's response to a user input, including intermediate messages and tokens.
 
@@ -216,11 +610,141 @@ async def stream(user_input: StreamInput, agent_id: str = DEFAULT_AGENT) -> Stre
     is also attached to all messages for recording feedback.
 
     Set `stream_tokens=false` to return intermediate messages but not token-by-token.
+
+    Every frame carries an SSE `id`. After a dropped connection, repeat the request with a
+    `Last-Event-ID` header to resume the still running stream after that frame. If no
+    client reconnects within STREAM_RESUME_TIMEOUT seconds, the run is cancelled. Only the
+    API key that started a stream can resume it.
+
+    New runs are admitted like /invoke requests, and rejected with a 429 or 503 like them.
+    Resumed ones don't wait again.
     """
-    return StreamingResponse(
-        message_generator(user_input, agent_id),
-        media_type="text/event-stream",
+    if last_event_id:
+        stream_id, _, seq = last_event_id.rpartition(":")
+        run = get_stream_run(stream_id, key_name(api_key))
+        if run is None or not seq.isdigit():
+            raise HTTPException(status_code=404, detail="Stream not found or expired")
+        if not run.can_resume(int(seq)):
+            raise HTTPException(status_code=410, detail="Stream position no longer buffered")
+        stream_metrics.resumed += 1
+        return EventStreamResponse(run.subscribe(after=int(seq)))
+
+    await _check_thread_owner(agent_id, user_input, api_key)
+    slot = await _admit(agent_id, x_priority, api_key)
+    run = start_stream_run(
+        _holding_slot(slot, message_generator(user_input, agent_id, api_key)),
+        buffer_size=settings.STREAM_BUFFER_SIZE,
+        resume_timeout=settings.STREAM_RESUME_TIMEOUT,
+        owner=key_name(api_key),
     )
+    return EventStreamResponse(run.subscribe())
+
+
+async def _holding_slot(
+    slot: AdmissionSlot, frames: AsyncGenerator[bytes, None]
+) -> AsyncGenerator[bytes, None]:
+    """Yield from frames, and release the run's admission slot when they end."""
+    with slot:
+        async with aclosing(frames):
+            async for frame in frames:
+                yield frame
+
+
+def _websocket_api_key(websocket: WebSocket) -> ApiKeyConfig | None:
+    scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+    return _authenticate(credentials if scheme.lower() == "bearer" else None)
+
+
+@app.websocket("/ws/{agent_id}")
+@app.websocket("/ws")
+async def websocket_session(websocket: WebSocket, agent_id: str = DEFAULT_AGENT) -> None:
+    """
+    Run many agent streams over one WebSocket, authenticated once when it connects.
+
+    Client frames are JSON objects:
+    - `{"type": "run", "id": ..., "input": StreamInput}` starts a run
+    - `{"type": "cancel", "id": ...}` cancels a run
+
+    Runs are multiplexed on the socket. Every server frame is a /stream event with the `id`
+    of its run added: message, token and error events, then `{"type": "end"}` when the run
+    finishes or `{"type": "cancelled"}` when it was cancelled. Closing the socket cancels
+    all of its runs. Runs are admitted like /invoke requests, with the priority from the
+    socket's `X-Priority` header; a rejected run gets an error event.
+    """
+    try:
+        api_key = _websocket_api_key(websocket)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    runs: dict[str, asyncio.Task] = {}
+    send_lock = asyncio.Lock()
+    priority = websocket.headers.get("x-priority", "normal")
+    if priority not in get_args(Priority):
+        priority = "normal"
+
+    async def send(event: str) -> None:
+        async with send_lock:
+            await websocket.send_text(event)
+
+    async def send_error(run_id: str, content: str) -> None:
+        await send(json.dumps({"id": run_id, "type": "error", "content": content}))
+
+    async def run(run_id: str, user_input: StreamInput) -> None:
+        try:
+            await _check_thread_owner(agent_id, user_input, api_key)
+            with await _acquire(agent_id, priority, api_key):
+                # Closed right away when the run is cancelled, which stops the graph run
+                async with aclosing(message_generator(user_input, agent_id, api_key)) as frames:
+                    async for frame in frames:
+                        await send(encode_websocket_event(run_id, frame))
+        except Overloaded as e:
+            await send_error(run_id, f"{e}, retry after {e.retry_after}s")
+        except HTTPException as e:
+            await send_error(run_id, str(e.detail))
+        except asyncio.CancelledError:
+            if runs.get(run_id) is asyncio.current_task():
+                await send(json.dumps({"id": run_id, "type": "cancelled"}))
+            raise
+        except Exception as e:
+            logger.error(f"An exception occurred: {e}")
+            await send_error(run_id, "Unexpected error")
+        finally:
+            if runs.get(run_id) is asyncio.current_task():
+                del runs[run_id]
+
+    try:
+        while True:
+            try:
+                frame = json.loads(await websocket.receive_text())
+                frame_type, run_id = frame["type"], str(frame["id"])
+            except (ValueError, TypeError, KeyError):
+                await send_error("", "Invalid frame")
+                continue
+            if frame_type == "run":
+                if run_id in runs:
+                    await send_error(run_id, f"Run {run_id} is already running")
+                    continue
+                try:
+                    user_input = StreamInput.model_validate(frame.get("input"))
+                except ValidationError as e:
+                    await send_error(run_id, f"Invalid input: {e}")
+                    continue
+                runs[run_id] = asyncio.create_task(run(run_id, user_input))
+            elif frame_type == "cancel":
+                if task := runs.get(run_id):
+                    task.cancel()
+            else:
+                await send_error(run_id, f"Unknown frame type: {frame_type}")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Nobody is listening anymore, so cancel the runs without reporting it
+        tasks = list(runs.values())
+        runs.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
 @router.post("/feedback")
@@ -243,33 +767,132 @@ async def feedback(feedback: Feedback) -> FeedbackResponse:
     return FeedbackResponse()
 
 
+@router.post("/{agent_id}/history")
 @router.post("/history")
-def history(input: ChatHistoryInput) -> ChatHistory:
+async def history(
+    input: ChatHistoryInput, agent_id: str = DEFAULT_AGENT, api_key: ApiKey = None
+) -> ChatHistory:
     """
     Get chat history.
+
+    If agent_id is not provided, the default agent will be used.
+    Pages go from newest to oldest: set `limit` to get the latest messages, then pass the
+    returned `next_cursor` as `before` to get the page before them. Cursors are message
+    ids, so pages stay consistent while messages are added or removed. A cursor whose
+    message has been removed from the thread gets a 410. Only the API key that started a
+    thread can read it, other keys get a 404.
+
+    The checkpoint stores a thread's messages as one value, so every page still loads all
+    of them; only the page is converted and returned.
     """
-    # TODO: Hard-coding DEFAULT_AGENT here is wonky
-    agent: CompiledStateGraph = get_agent(DEFAULT_AGENT)
+    agent: CompiledStateGraph = await aget_agent(agent_id)
     try:
-        state_snapshot = agent.get_state(
-            config=RunnableConfig(
-                configurable={
-                    "thread_id": input.thread_id,
-                }
-            )
+        # Read the latest checkpoint directly rather than assembling the full graph state
+        checkpoint = await _owned_checkpoint(agent, input.thread_id, api_key)
+        if checkpoint is None:
+            return ChatHistory(messages=[])
+        messages: list[AnyMessage] = checkpoint.checkpoint["channel_values"].get("messages", [])
+        end = len(messages)
+        if input.before is not None:
+            end = next((i for i, m in enumerate(messages) if m.id == input.before), -1)
+            if end < 0:
+                raise HTTPException(status_code=410, detail="Cursor message no longer in thread")
+        start = 0 if input.limit is None else max(end - input.limit, 0)
+        chat_messages: list[ChatMessage] = [
+            langchain_to_chat_message(m) for m in messages[start:end]
+        ]
+        return ChatHistory(
+            messages=chat_messages, next_cursor=messages[start].id if start else None
         )
-        messages: list[AnyMessage] = state_snapshot.values["messages"]
-        chat_messages: list[ChatMessage] = [langchain_to_chat_message(m) for m in messages]
-        return ChatHistory(messages=chat_messages)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"An exception occurred: {e}")
         raise HTTPException(status_code=500, detail="Unexpected error")
 
 
+@router.post("/admin/checkpoints/maintenance", dependencies=[Depends(verify_admin)])
+async def checkpoint_maintenance(
+    request: Request, full_vacuum: bool = False
+) -> CheckpointMaintenanceReport:
+    """
+    Prune old checkpoints and expired threads now, instead of waiting for the background task.
+
+    Limits come from the CHECKPOINT_KEEP_PER_THREAD and CHECKPOINT_THREAD_TTL settings.
+    Set `full_vacuum=true` to also rebuild the database files, which blocks checkpoint writes
+    while it runs. Only AUTH_SECRET and API keys with `admin` set may call it.
+    """
+    savers = request.app.state.checkpointers.values()
+    try:
+        return await run_checkpoint_maintenance(savers, full_vacuum=full_vacuum)
+    except Exception as e:
+        logger.error(f"An exception occurred: {e}")
+        raise HTTPException(status_code=500, detail="Unexpected error")
+
+
+def _get_timeline(run_id: str, api_key: ApiKeyConfig | None) -> RunTimeline:
+    if not settings.RUN_TIMELINE_ENABLED:
+        raise HTTPException(status_code=404, detail="Run timelines are disabled")
+    if (timeline := get_timeline(run_id, key_name(api_key))) is None:
+        raise HTTPException(status_code=404, detail="Timeline not found")
+    return timeline
+
+
+@router.get("/usage")
+async def usage(api_key: ApiKey = None) -> ApiKeyUsage:
+    """
+    Get the usage of the request's API key: runs admitted, runs rejected for its tokens per
+    minute, runs executing now and LLM tokens spent. All keys are in /metrics.
+    """
+    name = key_name(api_key)
+    counts = get_usage_tracker().usage().get(name)
+    return ApiKeyUsage(
+        name=name,
+        in_flight=get_admission_controller().stats().in_flight_by_key.get(name, 0),
+        tokens_per_minute=api_key.tokens_per_minute if api_key else None,
+        **(asdict(counts) if counts else {}),
+    )
+
+
+@router.get("/runs/{run_id}/timeline")
+async def run_timeline(run_id: str, api_key: ApiKey = None) -> RunTimeline:
+    """
+    Get the timeline of a recent run: its graph nodes, LLM and tool calls and checkpointer
+    calls, and how the run's time split between them.
+
+    Requires RUN_TIMELINE_ENABLED. Only the latest RUN_TIMELINE_BUFFER_SIZE runs are kept,
+    and only the API key that started a run can read its timeline.
+    """
+    return _get_timeline(run_id, api_key)
+
+
+@router.get("/runs/{run_id}/timeline/chrome")
+async def run_timeline_chrome(run_id: str, api_key: ApiKey = None) -> dict[str, Any]:
+    """Get the timeline of a recent run as Chrome trace events, for chrome://tracing or Perfetto."""
+    return chrome_trace(_get_timeline(run_id, api_key))
+
+
+@app.get("/metrics", dependencies=[Depends(verify_admin)])
+async def metrics() -> PlainTextResponse:
+    """
+    Service metrics in the Prometheus text format. They cover every API key, so they need
+    AUTH_SECRET or an admin API key.
+    """
+    return PlainTextResponse(registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
     return {"status": "ok"}
 
 
+@app.get("/ready")
+async def readiness_check(request: Request):
+    """Readiness endpoint, which only reports ready once the startup warmup has finished."""
+    if not getattr(request.app.state, "ready", False):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Warming up")
+    return {"status": "ready"}
+
+
 app.include_router(router)
@@ -0,0 +1,110 @@
+import json
+import time
+from typing import Any
+
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from schema import ChatMessage
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# Every frame is `data: {"type": ..., "content": ...}\n\n`. Only the content varies, so the
+# rest is encoded once and the content is serialized straight to bytes.
+_TOKEN_PREFIX = b'data: {"type":"token","content":'
+_MESSAGE_PREFIX = b'data: {"type":"message","content":'
+_FRAME_SUFFIX = b"}\n\n"
+
+ERROR_FRAME = b'data: {"type":"error","content":"Unexpected error"}\n\n'
+DONE_FRAME = b"data: [DONE]\n\n"
+
+
+def dumps(value: Any) -> bytes:
+    """Serialize value to compact JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def encode_token(content: str) -> bytes:
+    return _TOKEN_PREFIX + dumps(content) + _FRAME_SUFFIX
+
+
+def encode_message(message: ChatMessage) -> bytes:
+    return _MESSAGE_PREFIX + message.model_dump_json().encode() + _FRAME_SUFFIX
+
+
+def encode_websocket_event(run_id: str, frame: bytes) -> str:
+    """
+    Turn an SSE frame into a WebSocket event for the given run.
+
+    The event is the frame's JSON object with the run's `id` spliced in, so it is not
+    parsed again. The closing [DONE] frame becomes `{"id": ..., "type": "end"}`.
+    """
+    head = b'{"id":' + dumps(run_id) + b","
+    if frame == DONE_FRAME:
+        return (head + b'"type":"end"}').decode()
+    return (head + frame[len(b"data: {") : -len(b"\n\n")]).decode()
+
+
+class TokenCoalescer:
+    """
+    Joins consecutive tokens into one token frame.
+
+    A frame is due once `max_bytes` are buffered or `window` seconds have passed since the
+    first buffered token; `timeout()` tells the caller how long it may wait before calling
+    `flush()`.
+    """
+
+    def __init__(self, max_bytes: int = 256, window: float = 0.02) -> None:
+        self.max_bytes = max_bytes
+        self.window = window
+        self._parts: list[str] = []
+        self._size = 0
+        self._started = 0.0
+
+    def add(self, token: str) -> bytes | None:
+        """Buffer token. Returns a frame if the buffer is full."""
+        if not self._parts:
+            self._started = time.monotonic()
+        self._parts.append(token)
+        self._size += len(token.encode())
+        if self._size >= self.max_bytes:
+            return self.flush()
+        return None
+
+    def flush(self) -> bytes | None:
+        if not self._parts:
+            return None
+        frame = encode_token("".join(self._parts))
+        self._parts.clear()
+        self._size = 0
+        return frame
+
+    def timeout(self) -> float | None:
+        """Seconds until the buffered tokens are due, or None if the buffer is empty."""
+        if not self._parts:
+            return None
+        return max(0.0, self._started + self.window - time.monotonic())
+
+
+class EventStreamResponse(StreamingResponse):
+    """
+    StreamingResponse for server-sent events that closes its generator on disconnect.
+
+    Starlette stops sending when the client disconnects but leaves the generator
+    suspended until it is garbage collected. Closing it right away lets the generator
+    cancel the work behind the stream.
+    """
+
+    media_type = "text/event-stream"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if aclose := getattr(self.body_iterator, "aclose", None):
+                await aclose()
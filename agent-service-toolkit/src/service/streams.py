@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from collections import deque
+from collections.abc import AsyncGenerator, AsyncIterator
+from uuid import uuid4
+
+from service.sse import ERROR_FRAME
+
+logger = logging.getLogger(__name__)
+
+
+class StreamRun:
+    """
+    A /stream run, decoupled from the connections reading it.
+
+    A background task writes the run's SSE frames into a bounded ring buffer, numbering
+    each with an `id: <stream id>:<seq>` field. Connections read from the buffer, so a
+    client that lost its connection can reconnect with the last id it saw and pick up where
+    it left off while the run keeps going. A run with no client attached for
+    `resume_timeout` seconds is cancelled, and a finished run stays resumable as long.
+    `owner` names the API key that started the run, only it may resume the run.
+    """
+
+    def __init__(
+        self,
+        frames: AsyncIterator[bytes],
+        buffer_size: int = 1000,
+        resume_timeout: float = 10.0,
+        owner: str | None = None,
+    ) -> None:
+        self.id = str(uuid4())
+        self.resume_timeout = resume_timeout
+        self.owner = owner
+        self.done = False
+        self._buffer: deque[tuple[int, bytes]] = deque(maxlen=buffer_size)
+        self._last_seq = 0
+        self._changed = asyncio.Event()
+        self._subscribers = 0
+        self._expiry: asyncio.TimerHandle | None = None
+        self._task = asyncio.create_task(self._produce(frames))
+
+    async def _produce(self, frames: AsyncIterator[bytes]) -> None:
+        try:
+            async for frame in frames:
+                self._last_seq += 1
+                self._buffer.append((self._last_seq, self._event_id(self._last_seq) + frame))
+                self._notify()
+        except Exception as e:
+            logger.error(f"An exception occurred: {e}")
+            self._last_seq += 1
+            self._buffer.append((self._last_seq, self._event_id(self._last_seq) + ERROR_FRAME))
+        finally:
+            self.done = True
+            self._notify()
+            if not self._subscribers:
+                self._schedule_expiry()
+
+    def _event_id(self, seq: int) -> bytes:
+        return f"id: {self.id}:{seq}\n".encode()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def can_resume(self, after: int) -> bool:
+        """Whether every frame after seq `after` is still buffered."""
+        first = self._buffer[0][0] if self._buffer else self._last_seq + 1
+        return first - 1 <= after <= self._last_seq
+
+    async def subscribe(self, after: int = 0) -> AsyncGenerator[bytes, None]:
+        """Yield the frames after seq `after`, then follow the run until it finishes."""
+        self._attach()
+        try:
+            while True:
+                changed = self._changed
+                for seq, frame in list(self._buffer):
+                    if seq <= after:
+                        continue
+                    if seq != after + 1:
+                        # Fell behind the ring buffer; the client can't resume past the gap
+                        logger.warning(f"Stream {self.id} reader fell behind, closing it")
+                        return
+                    yield frame
+                    after = seq
+                if after >= self._last_seq:
+                    if self.done:
+                        return
+                    await changed.wait()
+        finally:
+            self._detach()
+
+    def _attach(self) -> None:
+        self._subscribers += 1
+        if self._expiry:
+            self._expiry.cancel()
+            self._expiry = None
+
+    def _detach(self) -> None:
+        self._subscribers -= 1
+        if not self._subscribers:
+            self._schedule_expiry()
+
+    def _schedule_expiry(self) -> None:
+        if self.resume_timeout <= 0:
+            self._expire()
+        else:
+            loop = asyncio.get_running_loop()
+            self._expiry = loop.call_later(self.resume_timeout, self._expire)
+
+    def _expire(self) -> None:
+        if self._subscribers:
+            return
+        if not self.done:
+            logger.info(f"No client reconnected to stream {self.id}, cancelling it")
+            self._task.cancel()
+        _stream_runs.pop(self.id, None)
+
+
+_stream_runs: dict[str, StreamRun] = {}
+
+
+def start_stream_run(
+    frames: AsyncIterator[bytes], buffer_size: int, resume_timeout: float, owner: str | None
+) -> StreamRun:
+    run = StreamRun(frames, buffer_size=buffer_size, resume_timeout=resume_timeout, owner=owner)
+    _stream_runs[run.id] = run
+    return run
+
+
+def get_stream_run(stream_id: str, owner: str | None) -> StreamRun | None:
+    """The run with stream_id, if it is still resumable and owner started it."""
+    run = _stream_runs.get(stream_id)
+    return run if run is not None and run.owner == owner else None
@@ -0,0 +1,260 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+from uuid import UUID, uuid4
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from core import settings
+from schema import RunTimeline, TimelineSpan
+from service.utils import token_usage
+
+_timelines: OrderedDict[str, "TimelineTracer"] = OrderedDict()
+# Runs in progress by thread, so checkpointer calls can be attributed to their run
+_active_threads: dict[str, "TimelineTracer"] = {}
+_lock = threading.Lock()
+
+
+class TimelineTracer(BaseCallbackHandler):
+    """
+    Records the timeline of an agent run from its callback events.
+
+    Graph nodes, LLM calls (with their provider, first token and token usage) and tool calls
+    become spans, nested under the span they ran in. Checkpointer calls of the run's thread
+    are added by record_checkpoint(). The tracer keeps everything in memory and doesn't need
+    LangSmith. The latest runs are kept in a bounded buffer, see get_timeline().
+    `owner` names the API key that started the run, only it may read the timeline.
+    """
+
+    run_inline = True
+
+    def __init__(
+        self, run_id: UUID, agent_id: str, thread_id: str, owner: str | None = None
+    ) -> None:
+        self.owner = owner
+        self.timeline = RunTimeline(
+            run_id=str(run_id), agent_id=agent_id, thread_id=thread_id, started_at=time.time()
+        )
+        self._started = time.perf_counter()
+        self._spans: dict[UUID, TimelineSpan] = {}
+        # Nearest recorded ancestor of every run that isn't a span itself, e.g. a prompt chain
+        self._parents: dict[UUID, str | None] = {}
+
+    def _now(self) -> float:
+        return time.perf_counter() - self._started
+
+    def _parent_id(self, parent_run_id: UUID | None) -> str | None:
+        if parent_run_id in self._spans:
+            return str(parent_run_id)
+        return self._parents.get(parent_run_id)
+
+    def _start_span(
+        self, run_id: UUID, parent_run_id: UUID | None, name: str, kind: str, **fields: Any
+    ) -> TimelineSpan:
+        span = TimelineSpan(
+            id=str(run_id),
+            parent_id=self._parent_id(parent_run_id),
+            name=name,
+            kind=kind,
+            start=self._now(),
+            **fields,
+        )
+        self._spans[run_id] = span
+        self.timeline.spans.append(span)
+        return span
+
+    def _end_span(self, run_id: UUID, error: BaseException | None = None) -> TimelineSpan | None:
+        span = self._spans.get(run_id)
+        if span is not None:
+            span.end = self._now()
+            if error is not None:
+                span.error = repr(error)
+            if span.kind in ("guard", "llm", "tool"):
+                self._add_time(span.kind, span.end - span.start)
+        return span
+
+    def _add_time(self, kind: str, seconds: float) -> None:
+        breakdown = self.timeline.breakdown
+        breakdown[kind] = breakdown.get(kind, 0.0) + seconds
+
+    def add_checkpoint_span(self, operation: str, started: float, ended: float) -> None:
+        """Add a checkpointer call, timed with time.perf_counter(), to the run."""
+        span = TimelineSpan(
+            id=str(uuid4()),
+            parent_id=self.timeline.run_id,
+            name=operation,
+            kind="checkpoint",
+            start=started - self._started,
+            end=ended - self._started,
+        )
+        self.timeline.spans.append(span)
+        self._add_time("checkpoint", ended - started)
+
+    def on_chain_start(
+        self,
+        serialized: dict[str, Any],
+        inputs: dict[str, Any],
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        tags: list[str] | None = None,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> None:
+        name = kwargs.get("name") or ""
+        # Graph nodes are tagged with their step, the runnables they call inherit the metadata
+        is_node = name == (metadata or {}).get("langgraph_node")
+        if parent_run_id is None:
+            self._start_span(run_id, None, self.timeline.agent_id, "run")
+            store_timeline(self)
+        elif is_node and any(t.startswith("graph:step:") for t in tags or []):
+            kind = "guard" if "guard" in name else "node"
+            self._start_span(run_id, parent_run_id, name, kind)
+        else:
+            self._parents[run_id] = self._parent_id(parent_run_id)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._parents.pop(run_id, None)
+        if (span := self._end_span(run_id)) is not None and span.kind == "run":
+            self._finish()
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._parents.pop(run_id, None)
+        if (span := self._end_span(run_id, error)) is not None and span.kind == "run":
+            self._finish()
+
+    def _finish(self) -> None:
+        self.timeline.duration = self._now()
+        with _lock:
+            if _active_threads.get(self.timeline.thread_id) is self:
+                del _active_threads[self.timeline.thread_id]
+
+    def on_chat_model_start(
+        self,
+        serialized: dict[str, Any],
+        messages: list[list[Any]],
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        tags: list[str] | None = None,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> None:
+        metadata = metadata or {}
+        model = metadata.get("ls_model_name") or kwargs.get("name") or "llm"
+        self._start_span(
+            run_id,
+            parent_run_id,
+            model,
+            "guard" if "llama_guard" in (tags or []) else "llm",
+            provider=metadata.get("ls_provider"),
+            model=metadata.get("ls_model_name"),
+        )
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        span = self._spans.get(run_id)
+        if span is not None and span.first_token is None and token:
+            span.first_token = self._now()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        if (span := self._end_span(run_id)) is not None:
+            span.input_tokens, span.output_tokens = token_usage(response)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_span(run_id, error)
+
+    def on_tool_start(
+        self,
+        serialized: dict[str, Any],
+        input_str: str,
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        **kwargs: Any,
+    ) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name") or "tool"
+        self._start_span(run_id, parent_run_id, name, "tool")
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_span(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_span(run_id, error)
+
+
+def store_timeline(tracer: TimelineTracer) -> None:
+    """Keep the tracer's timeline, dropping the oldest beyond RUN_TIMELINE_BUFFER_SIZE."""
+    with _lock:
+        _timelines[tracer.timeline.run_id] = tracer
+        _timelines.move_to_end(tracer.timeline.run_id)
+        while len(_timelines) > settings.RUN_TIMELINE_BUFFER_SIZE:
+            _timelines.popitem(last=False)
+        _active_threads[tracer.timeline.thread_id] = tracer
+
+
+def get_timeline(run_id: str, owner: str | None) -> RunTimeline | None:
+    """The timeline of run_id, if it is still buffered and owner started the run."""
+    with _lock:
+        tracer = _timelines.get(run_id)
+    return tracer.timeline if tracer is not None and tracer.owner == owner else None
+
+
+def record_checkpoint(config: Any, operation: str, started: float, ended: float) -> None:
+    """Add a checkpointer call to the timeline of the run in progress on its thread, if any."""
+    if not _active_threads or not isinstance(config, dict):
+        return
+    thread_id = config.get("configurable", {}).get("thread_id")
+    if tracer := _active_threads.get(thread_id):
+        tracer.add_checkpoint_span(operation, started, ended)
+
+
+def chrome_trace(timeline: RunTimeline) -> dict[str, Any]:
+    """
+    Convert a timeline to the Chrome trace event format.
+
+    Load the JSON in chrome://tracing or https://ui.perfetto.dev. Spans are laid out on as few
+    rows as possible, each span on the row of the span it ran in unless they overlap.
+    """
+    events: list[dict[str, Any]] = [
+        {
+            "name": "process_name",
+            "ph": "M",
+            "pid": 1,
+            "args": {"name": f"{timeline.agent_id} run {timeline.run_id}"},
+        }
+    ]
+    end_of_run = timeline.duration or max((s.end or s.start for s in timeline.spans), default=0)
+    # Each row is a stack of the ends of the spans open on it
+    rows: list[list[float]] = []
+    for span in sorted(timeline.spans, key=lambda s: (s.start, -(s.end or end_of_run))):
+        end = span.end if span.end is not None else end_of_run
+        for row, stack in enumerate(rows):
+            while stack and stack[-1] <= span.start:
+                stack.pop()
+            if not stack or stack[-1] >= end:
+                stack.append(end)
+                break
+        else:
+            rows.append([end])
+            row = len(rows) - 1
+        args = span.model_dump(
+            include={"provider", "model", "input_tokens", "output_tokens", "error"},
+            exclude_none=True,
+        )
+        if span.first_token is not None:
+            args["time_to_first_token_ms"] = (span.first_token - span.start) * 1000
+        events.append(
+            {
+                "name": span.name,
+                "cat": span.kind,
+                "ph": "X",
+                "ts": (timeline.started_at + span.start) * 1_000_000,
+                "dur": (end - span.start) * 1_000_000,
+                "pid": 1,
+                "tid": row,
+                "args": args,
+            }
+        )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
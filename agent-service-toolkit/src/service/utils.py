@@ -7,6 +7,7 @@ from langchain_core.messages import (
 from langchain_core.messages import (
     ChatMessage as LangchainChatMessage,
 )
+from langchain_core.outputs import LLMResult
 
 from schema import ChatMessage
 
@@ -74,3 +75,22 @@ def remove_tool_calls(content: str | list[str | dict]) -> str | list[str | dict]
         for content_item in content
         if isinstance(content_item, str) or content_item["type"] != "tool_use"
     ]
+
+
+def token_usage(result: LLMResult) -> tuple[int, int]:
+    """Input and output tokens of an LLM call, from its messages' usage or response metadata."""
+    input_tokens = output_tokens = 0
+    for generations in result.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            if message is None:
+                continue
+            if usage := getattr(message, "usage_metadata", None):
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+                continue
+            metadata = message.response_metadata
+            usage = metadata.get("token_usage") or metadata.get("usage") or {}
+            input_tokens += usage.get("prompt_tokens", usage.get("input_tokens", 0)) or 0
+            output_tokens += usage.get("completion_tokens", usage.get("output_tokens", 0)) or 0
+    return input_tokens, output_tokens
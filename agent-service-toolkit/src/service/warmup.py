@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Iterable
+from typing import Any
+
+import httpx
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver
+
+from agents import load_agents
+from core import get_model, settings
+from core.rate_limit import RateLimitedChatModel
+from core.routing import RoutedChatModel
+from schema.models import FakeModelName
+
+logger = logging.getLogger(__name__)
+
+# Attributes under which LangChain chat models keep their async provider SDK client
+_SDK_CLIENT_ATTRIBUTES = ("root_async_client", "_async_client")
+
+
+async def preconnect(model: Any) -> int:
+    """
+    Open a connection from the model's provider SDK client to its API.
+
+    The connection stays in the client's keep-alive pool, so the first real call skips the
+    TCP and TLS handshakes. The request is unauthenticated and its response is ignored.
+    Models whose SDK doesn't use an httpx client are skipped. Returns how many connections
+    were opened.
+    """
+    if isinstance(model, RoutedChatModel):
+        return sum(await asyncio.gather(*(preconnect(m) for m in model.models)))
+    if isinstance(model, RateLimitedChatModel):
+        return await preconnect(model.model)
+    for attribute in _SDK_CLIENT_ATTRIBUTES:
+        client = getattr(model, attribute, None)
+        http_client = getattr(client, "_client", None)
+        if isinstance(http_client, httpx.AsyncClient) and getattr(client, "base_url", None):
+            await http_client.head(str(client.base_url))
+            return 1
+    return 0
+
+
+async def _step(name: str, step: Awaitable[Any]) -> None:
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(step, timeout=settings.WARMUP_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Warmup step {name} failed: {e!r}")
+    else:
+        logger.info(f"Warmup step {name} took {time.perf_counter() - started:.2f}s")
+
+
+def _create_models() -> dict[str, Any]:
+    models = {}
+    for model_name in settings.AVAILABLE_MODELS:
+        try:
+            models[model_name] = get_model(model_name)
+        except Exception as e:
+            logger.warning(f"Warmup could not create model {model_name}: {e}")
+    return models
+
+
+async def _warm_models() -> None:
+    # Creating a model imports its provider SDK, which would block the event loop
+    models = await asyncio.to_thread(_create_models)
+    results = await asyncio.gather(*map(preconnect, models.values()), return_exceptions=True)
+    for model_name, result in zip(models, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Warmup could not connect model {model_name}: {result!r}")
+
+
+async def _call_fake_model() -> None:
+    await get_model(FakeModelName.FAKE).ainvoke("warmup")
+
+
+async def _open_checkpointers(checkpointers: Iterable[BaseCheckpointSaver]) -> None:
+    config = RunnableConfig(configurable={"thread_id": "warmup", "checkpoint_ns": ""})
+    await asyncio.gather(*(saver.aget_tuple(config) for saver in checkpointers))
+
+
+async def warmup(agent_ids: list[str], checkpointers: Iterable[BaseCheckpointSaver]) -> None:
+    """
+    Prepare a fresh service for its first requests.
+
+    Opens the checkpointer connections, builds the agents in agent_ids, creates the models
+    in AVAILABLE_MODELS and connects to their providers, and calls the fake model once to
+    set up the model call path. A failing step is logged and doesn't stop the others.
+    """
+    started = time.perf_counter()
+    await _step("checkpointers", _open_checkpointers(checkpointers))
+    # Building graphs imports their modules, which would block the event loop
+    await _step("agents", asyncio.to_thread(load_agents, agent_ids))
+    await _step("models", _warm_models())
+    await _step("fake model", _call_fake_model())
+    logger.info(f"Warmup finished in {time.perf_counter() - started:.2f}s")
@@ -162,6 +162,7 @@ async def main() -> None:
                     message=user_input,
                     model=model,
                     thread_id=st.session_state.thread_id,
+                    coalesce_tokens=True,
                 )
                 await draw_messages(stream, is_new=True)
             else:
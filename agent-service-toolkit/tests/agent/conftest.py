@@ -0,0 +1,16 @@
+from unittest.mock import patch
+
+import pytest
+
+
+class WordEncoding:
+    """One token per word, so budgets in tests don't depend on the real tokenizer."""
+
+    def encode(self, text: str, **kwargs) -> list[str]:
+        return text.split()
+
+
+@pytest.fixture(autouse=True)
+def word_tokens():
+    with patch("agents.context._encoding", return_value=WordEncoding()):
+        yield
@@ -0,0 +1,89 @@
+import asyncio
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+from agents.agents import Agent, aget_agent, get_agent, load_agents, set_checkpointer
+
+
+def test_get_agent_builds_graph_on_first_use():
+    """Test that an agent's graph is imported on first use with its checkpointer attached."""
+    graph = Mock()
+    module = SimpleNamespace(graph=graph)
+    agent = Agent(description="A lazy agent.", graph_path="lazy_agent_module:graph")
+    checkpointer = Mock()
+    with (
+        patch.dict("agents.agents.agents", {"lazy-agent": agent}, clear=True),
+        patch.dict(sys.modules, {"lazy_agent_module": module}),
+    ):
+        set_checkpointer("lazy-agent", checkpointer)
+        assert agent.graph is None
+
+        assert get_agent("lazy-agent") is graph
+        assert graph.checkpointer is checkpointer
+
+        # Later checkpointers are applied to the built graph
+        other = Mock()
+        set_checkpointer("lazy-agent", other)
+        assert graph.checkpointer is other
+
+
+def test_aget_agent_builds_graph_once_off_the_event_loop():
+    """Test that concurrent first uses build the graph once, in a worker thread."""
+    graph = Mock()
+    imports = []
+
+    def slow_import(module_name):
+        imports.append(threading.current_thread())
+        time.sleep(0.05)
+        return SimpleNamespace(graph=graph)
+
+    agent = Agent(description="A slow agent.", graph_path="slow_agent_module:graph")
+
+    async def first_uses():
+        return await asyncio.gather(
+            aget_agent("slow-agent"),
+            aget_agent("slow-agent"),
+            asyncio.to_thread(get_agent, "slow-agent"),
+        )
+
+    with (
+        patch.dict("agents.agents.agents", {"slow-agent": agent}, clear=True),
+        patch("agents.agents.import_module", side_effect=slow_import),
+    ):
+        assert asyncio.run(first_uses()) == [graph, graph, graph]
+    assert len(imports) == 1
+    assert imports[0] is not threading.main_thread()
+
+
+def test_load_agents():
+    graphs = {"a": Mock(), "b": Mock()}
+    module = SimpleNamespace(**graphs)
+    registry = {key: Agent(description=key, graph_path=f"lazy_agents:{key}") for key in graphs}
+    with (
+        patch.dict("agents.agents.agents", registry, clear=True),
+        patch.dict(sys.modules, {"lazy_agents": module}),
+    ):
+        load_agents(["a"])
+        assert registry["a"].graph is graphs["a"]
+        assert registry["b"].graph is None
+        load_agents()
+        assert registry["b"].graph is graphs["b"]
+
+
+def test_service_import_is_lazy():
+    """Test that importing the service neither builds agents nor imports provider SDKs."""
+    lazy_modules = ["agents.research_assistant", "langchain_openai", "langchain_anthropic"]
+    code = f"import sys, service; print([m for m in {lazy_modules!r} if m in sys.modules])"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=Path(__file__).parents[2] / "src",
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,90 @@
+from unittest.mock import patch
+
+import pytest
+from langchain_community.chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from agents.context import asummarize_context, count_tokens, fit_context, trim_to_budget
+from core import settings
+
+
+def words(n: int, word: str = "w") -> str:
+    return " ".join([word] * n)
+
+
+def test_count_tokens():
+    # One token per word (see conftest.py) plus 4 tokens of overhead per message
+    assert count_tokens([HumanMessage(words(6))]) == 10
+    assert count_tokens([HumanMessage("a b"), AIMessage("c")]) == 11
+
+
+def test_trim_to_budget_keeps_recent_messages():
+    messages = [HumanMessage(words(6, str(i))) for i in range(5)]
+    assert trim_to_budget(messages, 25) == messages[-2:]
+    assert trim_to_budget(messages, 25, pin_first=True) == [messages[0], messages[-1]]
+    # The last message is kept even if it alone is over budget
+    assert trim_to_budget(messages, 1) == messages[-1:]
+
+
+def test_trim_to_budget_keeps_tool_results_with_their_call():
+    call = AIMessage("", tool_calls=[{"name": "calc", "args": {}, "id": "1"}])
+    messages = [
+        HumanMessage(words(6)),
+        call,
+        ToolMessage(words(6), tool_call_id="1"),
+        AIMessage(words(6)),
+    ]
+    # The tool result alone would fit, but not without its tool call. The window then has
+    # to go back to the human message, even over budget.
+    assert trim_to_budget(messages, 22) == messages
+    assert trim_to_budget(messages, 60) == messages
+
+
+def test_trim_to_budget_starts_on_a_human_message():
+    messages = [
+        HumanMessage(words(6, "a")),
+        AIMessage(words(6, "b")),
+        HumanMessage(words(6, "c")),
+        AIMessage(words(6, "d")),
+    ]
+    # The last three messages fit, but the window must not open with the AI message
+    assert trim_to_budget(messages, 30) == messages[2:]
+    assert trim_to_budget(messages, 30, pin_first=True) == [messages[0], *messages[2:]]
+    assert trim_to_budget(messages, 1) == messages[2:]
+
+
+def test_fit_context_strategies():
+    system = [SystemMessage("be brief")]
+    state = {"messages": [HumanMessage(words(6, str(i))) for i in range(5)]}
+
+    with patch.object(settings, "CONTEXT_MAX_TOKENS", 31):
+        with patch.object(settings, "CONTEXT_STRATEGY", "full"):
+            assert fit_context(state, system) == system + state["messages"]
+        with patch.object(settings, "CONTEXT_STRATEGY", "sliding"):
+            assert fit_context(state, system) == system + state["messages"][-2:]
+        with patch.object(settings, "CONTEXT_STRATEGY", "pinned"):
+            assert fit_context(state, system) == system + state["messages"][::4]
+        with patch.object(settings, "CONTEXT_STRATEGY", "summary"):
+            summarized = {**state, "context_summary": "earlier", "summarized_messages": 4}
+            prompt = fit_context(summarized, system)
+            assert prompt[1].content.endswith("earlier")
+            assert prompt[2:] == state["messages"][4:]
+
+
+@pytest.mark.asyncio
+async def test_asummarize_context_folds_older_messages():
+    model = FakeListChatModel(responses=["the user counted"])
+    state = {"messages": [HumanMessage(words(6, str(i))) for i in range(6)]}
+
+    with (
+        patch.object(settings, "CONTEXT_STRATEGY", "summary"),
+        patch.object(settings, "CONTEXT_MAX_TOKENS", 40),
+    ):
+        update = await asummarize_context(state, model)
+        assert update == {"context_summary": "the user counted", "summarized_messages": 4}
+
+        # Nothing to do while the rest fits the budget
+        assert await asummarize_context({**state, **update}, model) == {}
+
+    with patch.object(settings, "CONTEXT_STRATEGY", "pinned"):
+        assert await asummarize_context(state, model) == {}
@@ -0,0 +1,73 @@
+from unittest.mock import patch
+
+import pytest
+from langchain_community.chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from pydantic import SecretStr
+
+from agents.llama_guard import LlamaGuard, SafetyAssessment
+from core import settings
+
+
+def guard_with_responses(responses: list[str], cache_size: int = 1024) -> LlamaGuard:
+    model = FakeListChatModel(responses=responses)
+    with (
+        patch.object(settings, "GROQ_API_KEY", SecretStr("test_key")),
+        patch("agents.llama_guard.get_model", return_value=model),
+    ):
+        return LlamaGuard(cache_size=cache_size)
+
+
+def test_verdict_cache_skips_repeated_checks():
+    guard = guard_with_responses(["safe", "unsafe\nS1"])
+    conversation = [HumanMessage("hi")]
+
+    assert guard.invoke("User", conversation).safety_assessment == SafetyAssessment.SAFE
+    # Same role and conversation, message ids don't matter
+    assert guard.invoke("User", [HumanMessage("hi", id="x")]).safety_assessment == (
+        SafetyAssessment.SAFE
+    )
+    assert guard.model.i == 1
+
+    # A different role is a different check
+    verdict = guard.invoke("Agent", conversation)
+    assert verdict.safety_assessment == SafetyAssessment.UNSAFE
+    assert verdict.unsafe_categories == ["Violent Crimes"]
+
+    stats = guard.stats()
+    assert (stats.hits, stats.misses, stats.size) == (1, 2, 2)
+
+
+@pytest.mark.asyncio
+async def test_verdict_cache_is_lru_bounded():
+    guard = guard_with_responses(["safe"] * 4, cache_size=2)
+    first, second, third = ([HumanMessage(text)] for text in ("a", "b", "c"))
+
+    await guard.ainvoke("User", first)
+    await guard.ainvoke("User", second)
+    await guard.ainvoke("User", first)  # refreshes first
+    await guard.ainvoke("User", third)  # evicts second
+
+    stats = guard.stats()
+    assert (stats.hits, stats.misses, stats.evictions, stats.size) == (1, 3, 1, 2)
+    await guard.ainvoke("User", first)
+    assert guard.stats().hits == 2
+
+
+def test_errors_are_not_cached():
+    guard = guard_with_responses(["garbage", "safe"])
+    conversation = [HumanMessage("hi"), AIMessage("hello")]
+
+    assert guard.invoke("Agent", conversation).safety_assessment == SafetyAssessment.ERROR
+    assert guard.invoke("Agent", conversation).safety_assessment == SafetyAssessment.SAFE
+    assert guard.stats().hits == 0
+
+
+def test_fake_llama_guard():
+    with (
+        patch.object(settings, "GROQ_API_KEY", None),
+        patch.object(settings, "FAKE_MODEL_LLAMA_GUARD", True),
+    ):
+        guard = LlamaGuard()
+    assert guard.model is not None
+    assert guard.invoke("User", [HumanMessage("hi")]).safety_assessment == SafetyAssessment.SAFE
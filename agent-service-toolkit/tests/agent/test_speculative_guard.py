@@ -0,0 +1,218 @@
+import asyncio
+from collections.abc import AsyncIterator
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from langchain_community.chat_models import FakeListChatModel
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from agents.llama_guard import LlamaGuardOutput, SafetyAssessment
+from agents.research_assistant import acall_model_speculative
+from agents.utils import GateClosedError, GatedChatModel
+
+
+class SlowModel(BaseChatModel):
+    """Streams `reply` word by word, one word every `delay` seconds."""
+
+    reply: str = "hello there"
+    delay: float = 0.01
+    started: bool = False
+    cancelled: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow"
+
+    def _generate(self, messages: list[BaseMessage], *args: Any, **kwargs: Any) -> ChatResult:
+        raise NotImplementedError
+
+    async def _astream(
+        self, messages: list[BaseMessage], *args: Any, **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        self.started = True
+        try:
+            for word in self.reply.split(" "):
+                await asyncio.sleep(self.delay)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+class TokenRecorder(AsyncCallbackHandler):
+    def __init__(self) -> None:
+        self.tokens: list[str] = []
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.tokens.append(token)
+
+
+async def open_gate(gate: asyncio.Future, value: bool, delay: float) -> None:
+    await asyncio.sleep(delay)
+    gate.set_result(value)
+
+
+@pytest.mark.asyncio
+async def test_gated_model_streams_after_gate_opens():
+    inner = SlowModel()
+    gate = asyncio.get_running_loop().create_future()
+    model = GatedChatModel(model=inner, gate=gate)
+    recorder = TokenRecorder()
+
+    opener = asyncio.create_task(open_gate(gate, True, 0.05))
+    chunks = [c async for c in model.astream([HumanMessage("hi")], {"callbacks": [recorder]})]
+    await opener
+
+    assert inner.started
+    assert "".join(c.content for c in chunks) == "hello there "
+    assert recorder.tokens == ["hello ", "there "]
+
+
+@pytest.mark.asyncio
+async def test_gated_model_discards_output_when_gate_closes():
+    inner = SlowModel(delay=0.05)
+    gate = asyncio.get_running_loop().create_future()
+    model = GatedChatModel(model=inner, gate=gate)
+    recorder = TokenRecorder()
+
+    opener = asyncio.create_task(open_gate(gate, False, 0.01))
+    with pytest.raises(GateClosedError):
+        await model.ainvoke([HumanMessage("hi")], {"callbacks": [recorder]})
+    await opener
+
+    assert inner.started
+    assert inner.cancelled
+    assert recorder.tokens == []
+
+
+@pytest.mark.asyncio
+async def test_gated_model_holds_back_errors_until_gate_opens():
+    class FailingModel(SlowModel):
+        async def _astream(self, *args: Any, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+            raise RuntimeError("provider down")
+            yield
+
+    gate = asyncio.get_running_loop().create_future()
+    model = GatedChatModel(model=FailingModel(), gate=gate)
+
+    opener = asyncio.create_task(open_gate(gate, False, 0.01))
+    # An unsafe input is reported as such, not as the model's error
+    with pytest.raises(GateClosedError):
+        await model.ainvoke([HumanMessage("hi")])
+    await opener
+
+
+@pytest.mark.asyncio
+async def test_gated_model_sync_call_blocks_on_gate():
+    gate = asyncio.get_running_loop().create_future()
+    model = GatedChatModel(model=FakeListChatModel(responses=["hello", "again"]), gate=gate)
+
+    opener = asyncio.create_task(open_gate(gate, True, 0.05))
+    response = await asyncio.to_thread(model.invoke, [HumanMessage("hi")])
+    await opener
+    assert response.content == "hello"
+
+    closed = asyncio.get_running_loop().create_future()
+    closed.set_result(False)
+    with pytest.raises(GateClosedError):
+        await asyncio.to_thread(model.model_copy(update={"gate": closed}).invoke, "hi")
+
+
+class ToolSlowModel(SlowModel):
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "ToolSlowModel":
+        return self
+
+
+class DelayedGuard:
+    """Returns `output` for the input check, but only once `model` has started."""
+
+    def __init__(self, output: LlamaGuardOutput, model: SlowModel) -> None:
+        self.output = output
+        self.model = model
+
+    async def ainvoke(self, role: str, messages: list) -> LlamaGuardOutput:
+        async with asyncio.timeout(5):
+            while not self.model.started:
+                await asyncio.sleep(0.01)
+        if role == "User":
+            return self.output
+        return LlamaGuardOutput(safety_assessment=SafetyAssessment.SAFE)
+
+
+def state() -> dict:
+    return {"messages": [HumanMessage("hi")], "remaining_steps": 10}
+
+
+@pytest.mark.asyncio
+async def test_speculative_model_starts_before_guard_returns():
+    model = ToolSlowModel()
+    # The guard only answers once the model has started, so this would time out if the
+    # model call waited for the guard
+    guard = DelayedGuard(LlamaGuardOutput(safety_assessment=SafetyAssessment.SAFE), model)
+    with (
+        patch("agents.research_assistant.get_llama_guard", return_value=guard),
+        patch("agents.research_assistant.get_model", return_value=model),
+    ):
+        result = await acall_model_speculative(state(), {"configurable": {}})
+
+    assert result["safety"].safety_assessment == SafetyAssessment.SAFE
+    assert result["messages"][0].content == "hello there "
+
+
+@pytest.mark.asyncio
+async def test_speculative_model_blocks_unsafe_input():
+    model = ToolSlowModel(delay=0.5)
+    unsafe = LlamaGuardOutput(
+        safety_assessment=SafetyAssessment.UNSAFE, unsafe_categories=["Violent Crimes"]
+    )
+    with (
+        patch(
+            "agents.research_assistant.get_llama_guard", return_value=DelayedGuard(unsafe, model)
+        ),
+        patch("agents.research_assistant.get_model", return_value=model),
+    ):
+        result = await acall_model_speculative(state(), {"configurable": {}})
+
+    assert result["safety"] == unsafe
+    [message] = result["messages"]
+    assert isinstance(message, AIMessage)
+    assert "Violent Crimes" in message.content
+    assert model.cancelled
+
+
+@pytest.mark.asyncio
+async def test_speculative_summary_abandoned_on_unsafe_input():
+    summarizing = asyncio.Event()
+    summary_cancelled = False
+
+    async def slow_summary(*args: Any) -> dict:
+        nonlocal summary_cancelled
+        summarizing.set()
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            summary_cancelled = True
+            raise
+        return {}
+
+    model = ToolSlowModel()
+    # Already marked as started, so the guard answers right away
+    model.started = True
+    unsafe = LlamaGuardOutput(safety_assessment=SafetyAssessment.UNSAFE)
+    with (
+        patch(
+            "agents.research_assistant.get_llama_guard", return_value=DelayedGuard(unsafe, model)
+        ),
+        patch("agents.research_assistant.get_model", return_value=model),
+        patch("agents.research_assistant.asummarize_context", slow_summary),
+    ):
+        async with asyncio.timeout(1):
+            result = await acall_model_speculative(state(), {"configurable": {}})
+
+    assert summarizing.is_set()
+    assert summary_cancelled
+    assert result["safety"] == unsafe
@@ -1,11 +1,16 @@
+import asyncio
+import http.server
 import json
 import os
+import threading
+import time
 from unittest.mock import AsyncMock, Mock, patch
 
+import httpx
 import pytest
 from httpx import Request, Response
 
-from client import AgentClient, AgentClientError
+from client import AgentClient, AgentClientError, AgentSession
 from schema import AgentInfo, ChatHistory, ChatMessage, ServiceMetadata
 from schema.models import OpenAIModelName
 
@@ -53,14 +58,14 @@ def test_invoke(agent_client):
         json={"type": "ai", "content": ANSWER},
         request=mock_request,
     )
-    with patch("httpx.post", return_value=mock_response):
+    with patch("httpx.Client.post", return_value=mock_response):
         response = agent_client.invoke(QUESTION)
         assert isinstance(response, ChatMessage)
         assert response.type == "ai"
         assert response.content == ANSWER
 
     # Test with model and thread_id
-    with patch("httpx.post", return_value=mock_response) as mock_post:
+    with patch("httpx.Client.post", return_value=mock_response) as mock_post:
         response = agent_client.invoke(
             QUESTION,
             model="gpt-4o",
@@ -75,7 +80,7 @@ def test_invoke(agent_client):
 
     # Test error response
     error_response = Response(500, text="Internal Server Error", request=mock_request)
-    with patch("httpx.post", return_value=error_response):
+    with patch("httpx.Client.post", return_value=error_response):
         with pytest.raises(AgentClientError) as exc:
             agent_client.invoke(QUESTION)
         assert "500 Internal Server Error" in str(exc.value)
@@ -120,6 +125,50 @@ async def test_ainvoke(agent_client):
         assert "500 Internal Server Error" in str(exc.value)
 
 
+def test_batch(agent_client):
+    """Test synchronous batch invocation."""
+    RESULTS = {
+        "results": [
+            {"message": {"type": "ai", "content": "One"}},
+            {"error": "Unexpected error"},
+        ]
+    }
+    mock_response = Response(200, json=RESULTS, request=Request("POST", "http://test/batch"))
+    with patch("httpx.Client.post", return_value=mock_response) as mock_post:
+        results = agent_client.batch(["First", "Second"], model="gpt-4o", max_concurrency=2)
+        assert results[0].message.content == "One"
+        assert results[0].error is None
+        assert results[1].message is None
+        assert results[1].error == "Unexpected error"
+        # Verify request
+        args, kwargs = mock_post.call_args
+        assert args[0] == "http://test/test-agent/batch"
+        assert [i["message"] for i in kwargs["json"]["inputs"]] == ["First", "Second"]
+        assert kwargs["json"]["inputs"][0]["model"] == "gpt-4o"
+        assert kwargs["json"]["max_concurrency"] == 2
+
+    # Test error response
+    error_response = Response(
+        500, text="Internal Server Error", request=Request("POST", "http://test/batch")
+    )
+    with patch("httpx.Client.post", return_value=error_response):
+        with pytest.raises(AgentClientError) as exc:
+            agent_client.batch(["First"])
+        assert "500 Internal Server Error" in str(exc.value)
+
+
+@pytest.mark.asyncio
+async def test_abatch(agent_client):
+    """Test asynchronous batch invocation."""
+    RESULTS = {"results": [{"message": {"type": "ai", "content": "One"}}]}
+    mock_response = Response(200, json=RESULTS, request=Request("POST", "http://test/batch"))
+    with patch("httpx.AsyncClient.post", return_value=mock_response) as mock_post:
+        results = await agent_client.abatch(["First"])
+        assert results[0].message.content == "One"
+        args, kwargs = mock_post.call_args
+        assert kwargs["json"]["inputs"][0]["message"] == "First"
+
+
 def test_stream(agent_client):
     """Test synchronous streaming."""
     QUESTION = "What is the weather?"
@@ -143,7 +192,7 @@ def test_stream(agent_client):
     mock_response.__enter__ = Mock(return_value=mock_response)
     mock_response.__exit__ = Mock(return_value=None)
 
-    with patch("httpx.stream", return_value=mock_response):
+    with patch("httpx.Client.stream", return_value=mock_response):
         # Collect all streamed responses
         responses = list(agent_client.stream(QUESTION))
 
@@ -165,7 +214,7 @@ def test_stream(agent_client):
     error_response_mock = Mock()
     error_response_mock.__enter__ = Mock(return_value=error_response)
     error_response_mock.__exit__ = Mock(return_value=None)
-    with patch("httpx.stream", return_value=error_response_mock):
+    with patch("httpx.Client.stream", return_value=error_response_mock):
         with pytest.raises(AgentClientError) as exc:
             list(agent_client.stream(QUESTION))
         assert "500 Internal Server Error" in str(exc.value)
@@ -277,7 +326,7 @@ def test_get_history(agent_client):
 
     # Mock successful response
     mock_response = Response(200, json=HISTORY, request=Request("POST", "http://test/history"))
-    with patch("httpx.post", return_value=mock_response):
+    with patch("httpx.Client.post", return_value=mock_response):
         history = agent_client.get_history(THREAD_ID)
         assert isinstance(history, ChatHistory)
         assert len(history.messages) == 2
@@ -288,12 +337,33 @@ def test_get_history(agent_client):
     error_response = Response(
         500, text="Internal Server Error", request=Request("POST", "http://test/history")
     )
-    with patch("httpx.post", return_value=error_response):
+    with patch("httpx.Client.post", return_value=error_response):
         with pytest.raises(AgentClientError) as exc:
             agent_client.get_history(THREAD_ID)
         assert "500 Internal Server Error" in str(exc.value)
 
 
+def test_iter_history(agent_client):
+    """Test that iter_history() requests pages lazily until there are no older messages."""
+    pages = [
+        {"messages": [{"type": "ai", "content": "3"}], "next_cursor": "msg-3"},
+        {"messages": [{"type": "human", "content": "2"}], "next_cursor": None},
+    ]
+    responses = [
+        Response(200, json=page, request=Request("POST", "http://test/history")) for page in pages
+    ]
+    with patch("httpx.Client.post", side_effect=responses) as mock_post:
+        history = agent_client.iter_history("test-thread", page_size=1)
+        assert [m.content for m in next(history)] == ["3"]
+        assert mock_post.call_count == 1
+        assert [m.content for m in next(history)] == ["2"]
+        assert list(history) == []
+
+    assert mock_post.call_args_list[0].kwargs["json"]["before"] is None
+    assert mock_post.call_args_list[1].kwargs["json"]["before"] == "msg-3"
+    assert mock_post.call_args_list[1].kwargs["json"]["limit"] == 1
+
+
 def test_info(agent_client):
     assert agent_client.info is None
     assert agent_client.agent == "test-agent"
@@ -310,7 +380,7 @@ def test_info(agent_client):
     )
 
     # Update an existing client with info
-    with patch("httpx.get", return_value=test_response):
+    with patch("httpx.Client.get", return_value=test_response):
         agent_client.retrieve_info()
 
     assert agent_client.info == test_info
@@ -322,7 +392,7 @@ def test_info(agent_client):
     assert "Agent unknown-agent not found in available agents: custom-agent" in str(exc.value)
 
     # Test a fresh client with info
-    with patch("httpx.get", return_value=test_response):
+    with patch("httpx.Client.get", return_value=test_response):
         agent_client = AgentClient(base_url="http://test")
     assert agent_client.info == test_info
     assert agent_client.agent == "custom-agent"
@@ -332,3 +402,232 @@ def test_info(agent_client):
     with pytest.raises(AgentClientError) as exc:
         agent_client.invoke("test")
     assert "No agent selected. Use update_agent() to select an agent." in str(exc.value)
+
+
+def test_connection_pooling(mock_env):
+    """Test that the client reuses its pooled connections and closes them."""
+    mock_request = Request("POST", "http://test/invoke")
+    mock_response = Response(200, json={"type": "ai", "content": "Hi"}, request=mock_request)
+
+    with AgentClient(base_url="http://test", get_info=False, max_connections=5) as client:
+        client.update_agent("test-agent", verify=False)
+        assert client.limits.max_connections == 5
+        with patch("httpx.Client.post", return_value=mock_response):
+            client.invoke("Hello")
+            pool = client.client
+            client.invoke("Hello again")
+            assert client.client is pool
+    assert pool.is_closed
+
+
+@pytest.mark.asyncio
+async def test_aconnection_pooling(mock_env):
+    """Test that the async client reuses its pooled connections and closes them."""
+    mock_request = Request("POST", "http://test/invoke")
+    mock_response = Response(200, json={"type": "ai", "content": "Hi"}, request=mock_request)
+
+    async with AgentClient(base_url="http://test", get_info=False) as client:
+        client.update_agent("test-agent", verify=False)
+        with patch("httpx.AsyncClient.post", return_value=mock_response):
+            await client.ainvoke("Hello")
+            pool = client.aclient
+            await client.ainvoke("Hello again")
+            assert client.aclient is pool
+    assert pool.is_closed
+
+
+def test_stream_resumes_after_dropped_connection(agent_client):
+    """Test that stream() reconnects with Last-Event-ID when the connection drops."""
+
+    def token(content: str) -> str:
+        return f"data: {json.dumps({'type': 'token', 'content': content})}"
+
+    def dropped_lines():
+        yield "id: run:1"
+        yield token("Hello")
+        raise httpx.ReadError("connection reset")
+
+    first = Mock()
+    first.iter_lines.return_value = dropped_lines()
+    second = Mock()
+    second.iter_lines.return_value = ["id: run:2", token(" world"), "", "data: [DONE]"]
+    for response in (first, second):
+        response.__enter__ = Mock(return_value=response)
+        response.__exit__ = Mock(return_value=None)
+
+    with (
+        patch("httpx.Client.stream", side_effect=[first, second]) as mock_stream,
+        patch("client.client.time.sleep") as mock_sleep,
+    ):
+        assert list(agent_client.stream("Hi")) == ["Hello", " world"]
+
+    assert "Last-Event-ID" not in mock_stream.call_args_list[0].kwargs["headers"]
+    assert mock_stream.call_args_list[1].kwargs["headers"]["Last-Event-ID"] == "run:1"
+    mock_sleep.assert_called_once()
+
+    # Without an event id there's nothing to resume
+    failing = Mock()
+    failing.__enter__ = Mock(side_effect=httpx.ConnectError("refused"))
+    failing.__exit__ = Mock(return_value=None)
+    with patch("httpx.Client.stream", return_value=failing):
+        with pytest.raises(AgentClientError):
+            list(agent_client.stream("Hi"))
+
+
+@pytest.mark.asyncio
+async def test_session_astream():
+    """Test that a session multiplexes runs over one connection and cancels abandoned runs."""
+
+    class FakeConnection:
+        """Answers every run frame with a token and a message, but never ends "slow" runs."""
+
+        def __init__(self):
+            self.sent = []
+            self.events = asyncio.Queue()
+
+        async def send(self, raw):
+            frame = json.loads(raw)
+            self.sent.append(frame)
+            if frame["type"] == "run":
+                message = frame["input"]["message"]
+                self.events.put_nowait({"id": frame["id"], "type": "token", "content": message})
+                if message != "slow":
+                    content = {"type": "ai", "content": f"answer to {message}"}
+                    self.events.put_nowait(
+                        {"id": frame["id"], "type": "message", "content": content}
+                    )
+                    self.events.put_nowait({"id": frame["id"], "type": "end"})
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            return json.dumps(await self.events.get())
+
+    connection = FakeConnection()
+    session = AgentSession(connection)
+
+    slow = session.astream("slow")
+    assert await anext(slow) == "slow"
+    events = [event async for event in session.astream("fast")]
+    assert events[0] == "fast"
+    assert events[1] == ChatMessage(type="ai", content="answer to fast")
+
+    await slow.aclose()
+    assert connection.sent[-1] == {"type": "cancel", "id": connection.sent[0]["id"]}
+    assert connection.sent[0]["id"] != connection.sent[1]["id"]
+    await session.aclose()
+
+
+def test_retries_overloaded_requests(agent_client):
+    """Test that requests rejected as overloaded are retried after Retry-After."""
+    request = Request("POST", "http://test/invoke")
+    overloaded = Response(503, headers={"Retry-After": "2"}, request=request)
+    ok = Response(200, json={"type": "ai", "content": "Hi"}, request=request)
+
+    with (
+        patch("httpx.Client.post", side_effect=[overloaded, ok]) as mock_post,
+        patch("client.client.time.sleep") as mock_sleep,
+    ):
+        assert agent_client.invoke("Hi").content == "Hi"
+    assert mock_post.call_count == 2
+    assert 2 <= mock_sleep.call_args.args[0] <= 2.4
+
+    # Once the retries are used up, the rejection is raised
+    agent_client.max_retries = 1
+    with (
+        patch("httpx.Client.post", return_value=overloaded) as mock_post,
+        patch("client.client.time.sleep"),
+    ):
+        with pytest.raises(AgentClientError, match="503"):
+            agent_client.invoke("Hi")
+    assert mock_post.call_count == 2
+
+    # Other errors aren't retried
+    error = Response(500, request=request)
+    with patch("httpx.Client.post", return_value=error) as mock_post:
+        with pytest.raises(AgentClientError):
+            agent_client.invoke("Hi")
+    assert mock_post.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_aretries_overloaded_streams(agent_client):
+    """Test that astream() backs off and retries a rejected run."""
+    request = Request("POST", "http://test/stream")
+    overloaded = Response(429, request=request)
+    ok = Response(
+        200,
+        text='data: {"type": "token", "content": "Hi"}\n\ndata: [DONE]\n\n',
+        request=request,
+    )
+
+    class Stream:
+        def __init__(self, response):
+            self.response = response
+
+        async def __aenter__(self):
+            return self.response
+
+        async def __aexit__(self, *args):
+            return None
+
+    with (
+        patch(
+            "httpx.AsyncClient.stream", side_effect=[Stream(overloaded), Stream(ok)]
+        ) as mock_stream,
+        patch("client.client.asyncio.sleep") as mock_sleep,
+    ):
+        assert [event async for event in agent_client.astream("Hi")] == ["Hi"]
+    assert mock_stream.call_count == 2
+    # Without Retry-After, the exponential backoff applies
+    assert 0.5 <= mock_sleep.call_args.args[0] <= 0.6
+
+
+def test_aclient_closes_pool_of_previous_loop(mock_env):
+    """Test that the async pool of a finished event loop is closed, not leaked, on reuse."""
+    open_connections = set()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            open_connections.add(self)
+
+        def finish(self):
+            super().finish()
+            open_connections.discard(self)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            body = json.dumps({"type": "ai", "content": "Hi"}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = AgentClient(base_url=f"http://127.0.0.1:{server.server_port}", get_info=False)
+        client.update_agent("test-agent", verify=False)
+        # Like Streamlit reruns, every call runs in a new event loop
+        asyncio.run(client.ainvoke("Hello"))
+        first_pool = client._aclient
+        assert len(open_connections) == 1
+        asyncio.run(client.ainvoke("Hello again"))
+        assert client._aclient is not first_pool
+
+        deadline = time.monotonic() + 5
+        while len(open_connections) > 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(open_connections) == 1
+        client.close()
+    finally:
+        server.shutdown()
+        server.server_close()
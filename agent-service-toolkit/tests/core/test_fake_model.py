@@ -0,0 +1,85 @@
+import time
+
+import pytest
+from langchain_core.messages import HumanMessage, ToolMessage
+from langchain_core.tools import tool
+
+from core.fake_model import FakeModelError, FakeStreamingChatModel
+
+
+@tool
+def calculator(expression: str) -> str:
+    """Evaluate a math expression."""
+    return "4"
+
+
+def test_fake_model_streams_tokens_with_delays() -> None:
+    model = FakeStreamingChatModel(responses=["one two three"], first_token_delay=0.05, sleep=0.01)
+
+    started = time.perf_counter()
+    chunks = []
+    for chunk in model.stream("hi"):
+        chunks.append((chunk.content, time.perf_counter() - started))
+    assert [content for content, _ in chunks] == ["one ", "two ", "three"]
+    assert chunks[0][1] >= 0.05
+    assert chunks[-1][1] >= 0.07
+
+    # Non-streamed calls take as long
+    started = time.perf_counter()
+    message = model.invoke("hi")
+    assert time.perf_counter() - started >= 0.07
+    assert message.content == "one two three"
+    assert message.usage_metadata["output_tokens"] == 3
+
+
+@pytest.mark.asyncio
+async def test_fake_model_ainvoke_waits() -> None:
+    model = FakeStreamingChatModel(responses=["one two"], first_token_delay=0.02, sleep=0.02)
+    started = time.perf_counter()
+    assert (await model.ainvoke("hi")).content == "one two"
+    assert time.perf_counter() - started >= 0.04
+
+
+def test_fake_model_response_length() -> None:
+    model = FakeStreamingChatModel(responses=["unused"], response_tokens=(3, 5), seed=1)
+    lengths = {len(model.invoke("hi").content.split()) for _ in range(20)}
+    assert lengths <= {3, 4, 5}
+    assert len(lengths) > 1
+
+
+def test_fake_model_tool_calls() -> None:
+    script = [{"name": "calculator", "args": {"expression": "2 + 2"}}, {"name": "unbound"}]
+    model = FakeStreamingChatModel(responses=["It's 4."], tool_calls=script)
+
+    # Without bound tools the model just answers
+    assert model.invoke("hi").content == "It's 4."
+
+    bound = model.bind_tools([calculator])
+    request = bound.invoke([HumanMessage(content="What's 2 + 2?")])
+    assert [(c["name"], c["args"]) for c in request.tool_calls] == [
+        ("calculator", {"expression": "2 + 2"})
+    ]
+    streamed = list(bound.stream([HumanMessage(content="What's 2 + 2?")]))
+    assert streamed[-1].tool_calls[0]["args"] == {"expression": "2 + 2"}
+
+    # Once the tool result is in, the model answers
+    result = ToolMessage(content="4", tool_call_id=request.tool_calls[0]["id"])
+    answer = bound.invoke([HumanMessage(content="What's 2 + 2?"), request, result])
+    assert answer.content == "It's 4."
+    assert not answer.tool_calls
+
+
+def test_fake_model_error_injection() -> None:
+    model = FakeStreamingChatModel(responses=["one two three"], error_rate=1.0, seed=1)
+    with pytest.raises(FakeModelError):
+        model.invoke("hi")
+
+    model = FakeStreamingChatModel(responses=["one two three"], error_rate=0.5, seed=1)
+    outcomes = set()
+    for _ in range(20):
+        try:
+            model.invoke("hi")
+            outcomes.add("ok")
+        except FakeModelError:
+            outcomes.add("error")
+    assert outcomes == {"ok", "error"}
@@ -0,0 +1,135 @@
+import time
+import warnings
+from unittest.mock import patch
+
+from langchain_community.chat_models import FakeListChatModel
+from langchain_core._api import LangChainBetaWarning
+from langchain_core.embeddings import Embeddings
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from core.llm import get_model
+from core.llm_cache import SQLiteResponseCache, normalize_messages
+from schema.models import FakeModelName
+
+
+class KeywordEmbeddings(Embeddings):
+    """Embeds text by counting a few keywords, so similar questions are close."""
+
+    KEYWORDS = ["weather", "tokyo", "paris", "joke"]
+
+    def embed_query(self, text: str) -> list[float]:
+        text = text.lower()
+        return [float(text.count(k)) for k in self.KEYWORDS]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(t) for t in texts]
+
+
+def fake_model(cache: SQLiteResponseCache) -> FakeListChatModel:
+    return FakeListChatModel(responses=["first", "second", "third"], cache=cache)
+
+
+def test_normalize_messages_ignores_ids():
+    a = [
+        HumanMessage(content="Hi", id="1"),
+        AIMessage(content="", tool_calls=[{"name": "t", "args": {"x": 1}, "id": "call_a"}]),
+        ToolMessage(content="42", tool_call_id="call_a"),
+    ]
+    b = [
+        HumanMessage(content="Hi", id="2"),
+        AIMessage(content="", tool_calls=[{"name": "t", "args": {"x": 1}, "id": "call_b"}]),
+        ToolMessage(content="42", tool_call_id="call_b"),
+    ]
+    assert normalize_messages(a) == normalize_messages(b)
+
+
+def test_exact_cache_hit(tmp_path):
+    cache = SQLiteResponseCache(path=str(tmp_path / "cache.db"))
+    model = fake_model(cache)
+
+    first = model.invoke([HumanMessage(content="Hello", id="a")])
+    second = model.invoke([HumanMessage(content="Hello", id="b")])
+    third = model.invoke([HumanMessage(content="Something else")])
+
+    assert first.content == "first"
+    assert second.content == "first"
+    assert second.id != first.id
+    assert third.content == "second"
+
+    stats = cache.stats()
+    assert stats.exact_hits == 1
+    assert stats.misses == 2
+    assert stats.size == 2
+
+
+def test_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / "cache.db")
+    fake_model(SQLiteResponseCache(path=path)).invoke("Hello")
+    assert fake_model(SQLiteResponseCache(path=path)).invoke("Hello").content == "first"
+
+
+def test_ttl_and_lru_eviction(tmp_path):
+    cache = SQLiteResponseCache(path=str(tmp_path / "cache.db"), ttl=60, max_entries=2)
+    model = fake_model(cache)
+    model.invoke("one")
+    model.invoke("two")
+    model.invoke("one")  # Touch "one" so "two" is least recently used
+    model.invoke("three")
+
+    stats = cache.stats()
+    assert stats.size == 2
+    assert stats.evictions == 1
+    assert model.invoke("one").content == "first"
+
+    with patch("core.llm_cache.time.time", return_value=time.time() + 120):
+        assert cache.lookup(*_cache_args(model, "one")) is None
+
+
+def _cache_args(model: FakeListChatModel, text: str) -> tuple[str, str]:
+    return dumps([HumanMessage(content=text)]), model._get_llm_string()
+
+
+def test_semantic_cache_hit(tmp_path):
+    cache = SQLiteResponseCache(
+        path=str(tmp_path / "cache.db"),
+        embeddings=KeywordEmbeddings(),
+        similarity_threshold=0.99,
+    )
+    model = fake_model(cache)
+
+    assert model.invoke("What is the weather in Tokyo?").content == "first"
+    assert model.invoke("Tokyo weather please").content == "first"
+    assert model.invoke("Tell me a joke").content == "second"
+    # Entries added after the in-memory index was loaded are found too
+    assert model.invoke("A joke, a joke!").content == "second"
+
+    stats = cache.stats()
+    assert stats.semantic_hits == 2
+    assert stats.misses == 2
+
+
+def test_cache_scopes_beta_warnings(tmp_path):
+    cache = SQLiteResponseCache(path=str(tmp_path / "cache.db"))
+    model = fake_model(cache)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        model.invoke("Hello")
+        model.invoke("Hello")
+        assert not [w for w in caught if issubclass(w.category, LangChainBetaWarning)]
+        # Importing or using the cache doesn't silence beta warnings elsewhere
+        warnings.warn("beta", LangChainBetaWarning)
+        assert [w for w in caught if issubclass(w.category, LangChainBetaWarning)]
+
+
+def test_get_model_cache_opt_in(tmp_path):
+    get_model.cache_clear()
+    with (
+        patch("core.llm.settings.LLM_CACHE_ENABLED", True),
+        patch("core.llm.get_response_cache") as mock_get_cache,
+    ):
+        mock_get_cache.return_value = SQLiteResponseCache(path=str(tmp_path / "cache.db"))
+        model = get_model(FakeModelName.FAKE)
+        assert model.cache is mock_get_cache.return_value
+    get_model.cache_clear()
+    assert get_model(FakeModelName.FAKE).cache is None
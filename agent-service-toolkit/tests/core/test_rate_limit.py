@@ -0,0 +1,126 @@
+import asyncio
+import contextvars
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from langchain_community.chat_models import FakeListChatModel
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from core.llm import get_model
+from core.rate_limit import (
+    ProviderLimiter,
+    RateLimitedChatModel,
+    get_provider_limiter,
+    with_rate_limiter,
+)
+from core.settings import RateLimitConfig
+from schema.models import FakeModelName, Provider
+
+
+class SlowChatModel(BaseChatModel):
+    """Records how many calls are running at once."""
+
+    running: int = 0
+    max_running: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-fake"
+
+    def _generate(self, messages: list[BaseMessage], *args: Any, **kwargs: Any) -> ChatResult:
+        raise NotImplementedError
+
+    async def _agenerate(
+        self, messages: list[BaseMessage], *args: Any, **kwargs: Any
+    ) -> ChatResult:
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.02)
+        self.running -= 1
+        message = AIMessage(
+            content="done",
+            usage_metadata={"input_tokens": 7, "output_tokens": 3, "total_tokens": 10},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+@pytest.mark.asyncio
+async def test_max_concurrency():
+    limiter = ProviderLimiter(max_concurrency=2)
+    slow = SlowChatModel()
+    model = with_rate_limiter(slow, limiter)
+    assert type(slow) is SlowChatModel
+
+    results = await asyncio.gather(*(model.ainvoke("Hi") for _ in range(6)))
+
+    assert all(r.content == "done" for r in results)
+    assert slow.max_running == 2
+    stats = limiter.stats()
+    assert stats.in_flight == 0
+    assert stats.queue_depth == 0
+    assert stats.requests == 6
+    assert stats.tokens == 60
+    assert stats.max_wait_seconds > 0
+
+
+@pytest.mark.asyncio
+async def test_async_waiter_woken_on_release():
+    limiter = ProviderLimiter(max_concurrency=1)
+    assert limiter.acquire()
+    waiter = asyncio.ensure_future(limiter.aacquire())
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+
+    # Released from another thread, without the waiter polling for it
+    await asyncio.to_thread(limiter.release)
+    assert await asyncio.wait_for(waiter, timeout=0.05)
+    assert limiter.stats().in_flight == 1
+
+
+def test_stream_closed_in_another_context():
+    limiter = ProviderLimiter(max_concurrency=1)
+    model = with_rate_limiter(FakeListChatModel(responses=["Hello there"]), limiter)
+    stream = model.stream("Hi")
+    next(stream)
+    assert limiter.stats().in_flight == 1
+
+    contextvars.Context().run(stream.close)
+    assert limiter.stats().in_flight == 0
+
+
+def test_requests_per_minute():
+    limiter = ProviderLimiter(requests_per_minute=2)
+    assert limiter.acquire(blocking=False)
+    assert limiter.acquire(blocking=False)
+    assert not limiter.acquire(blocking=False)
+    assert limiter.stats().queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_tokens_per_minute():
+    limiter = ProviderLimiter(tokens_per_minute=15)
+    model = with_rate_limiter(SlowChatModel(), limiter)
+    await model.ainvoke("Hi")
+    assert await limiter.aacquire(blocking=False)
+    # The second call puts the budget in debt, so new requests have to wait
+    await model.ainvoke("Hi")
+    assert not await limiter.aacquire(blocking=False)
+
+
+def test_get_model_rate_limit():
+    get_model.cache_clear()
+    get_provider_limiter.cache_clear()
+    limits = {Provider.FAKE: RateLimitConfig(max_concurrency=1, requests_per_minute=100)}
+    with patch("core.rate_limit.settings.LLM_RATE_LIMITS", limits):
+        model = get_model(FakeModelName.FAKE)
+        assert isinstance(model, RateLimitedChatModel)
+        assert isinstance(model.model, FakeListChatModel)
+        assert model.invoke("Hi").content == "This is a test response from the fake model."
+        stats = get_provider_limiter(Provider.FAKE).stats()
+    assert stats.requests == 1
+    assert stats.in_flight == 0
+    get_model.cache_clear()
+    get_provider_limiter.cache_clear()
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import time
+from collections.abc import AsyncIterator
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from core.llm import get_model
+from core.routing import ROUTED_ATTEMPT_TAG, CircuitBreaker, NoModelAvailableError, RoutedChatModel
+from core.settings import Settings
+from schema.models import FakeModelName, OpenAIModelName, RoutedModelName
+
+
+class ScriptedModel(BaseChatModel):
+    """Streams `reply` word by word after `delay` seconds, or raises if `fail` is set."""
+
+    reply: str
+    delay: float = 0.0
+    fail: bool = False
+    calls: int = 0
+    cancelled: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _generate(self, messages: list[BaseMessage], *args: Any, **kwargs: Any) -> ChatResult:
+        raise NotImplementedError
+
+    async def _astream(
+        self, messages: list[BaseMessage], *args: Any, **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise RuntimeError(f"{self.reply} is down")
+        for word in self.reply.split(" "):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+
+def routed(*models: ScriptedModel, hedge_delay: float = 0.05) -> RoutedChatModel:
+    return RoutedChatModel(
+        models=list(models),
+        model_names=[m.reply for m in models],
+        hedge_delay=hedge_delay,
+    )
+
+
+@pytest.mark.asyncio
+async def test_primary_wins_within_budget():
+    primary = ScriptedModel(reply="primary answer")
+    secondary = ScriptedModel(reply="secondary answer")
+    response = await routed(primary, secondary).ainvoke("Hi")
+    assert response.content.strip() == "primary answer"
+    assert secondary.calls == 0
+
+
+@pytest.mark.asyncio
+async def test_hedge_wins_and_primary_is_cancelled():
+    primary = ScriptedModel(reply="slow", delay=1.0)
+    secondary = ScriptedModel(reply="fast")
+    model = routed(primary, secondary)
+
+    chunks = [chunk.content async for chunk in model.astream("Hi")]
+
+    assert "".join(chunks).strip() == "fast"
+    assert primary.cancelled
+    assert model.breakers["slow"].failures == 0
+
+
+@pytest.mark.asyncio
+async def test_failover_and_circuit_breaker():
+    primary = ScriptedModel(reply="broken", fail=True)
+    secondary = ScriptedModel(reply="backup")
+    model = routed(primary, secondary, hedge_delay=1.0)
+    model.breakers["broken"] = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    for _ in range(3):
+        response = await model.ainvoke("Hi")
+        assert response.content.strip() == "backup"
+
+    # The breaker opened after two failures, so the third call skipped the primary
+    assert primary.calls == 2
+    assert model.breakers["broken"].state == "open"
+
+
+@pytest.mark.asyncio
+async def test_all_models_fail():
+    model = routed(ScriptedModel(reply="a", fail=True), ScriptedModel(reply="b", fail=True))
+    with pytest.raises(RuntimeError, match="b is down"):
+        await model.ainvoke("Hi")
+
+
+@pytest.mark.asyncio
+async def test_all_circuits_open():
+    model = routed(ScriptedModel(reply="a"))
+    model.breakers["a"] = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    model.breakers["a"].record_failure()
+    with pytest.raises(NoModelAvailableError):
+        await model.ainvoke("Hi")
+    with pytest.raises(NoModelAvailableError):
+        model.invoke("Hi")
+
+
+def test_half_open_allows_a_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.02)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow()
+    assert breaker.allow()
+
+
+@pytest.mark.asyncio
+async def test_attempts_report_to_callbacks():
+    class Recorder(BaseCallbackHandler):
+        def __init__(self) -> None:
+            self.runs: list[list[str]] = []
+
+        def on_chat_model_start(self, *args: Any, tags: list[str] | None = None, **kwargs: Any):
+            self.runs.append(tags or [])
+
+    recorder = Recorder()
+    await routed(ScriptedModel(reply="primary")).ainvoke("Hi", {"callbacks": [recorder]})
+    assert recorder.runs == [[], [ROUTED_ATTEMPT_TAG]]
+
+
+def test_routed_settings():
+    env = {"OPENAI_API_KEY": "test_key", "USE_FAKE_MODEL": "true"}
+    with patch.dict(os.environ, env, clear=True):
+        settings = Settings(_env_file=None, ROUTED_MODELS=["gpt-4o-mini", "fake"])
+        assert RoutedModelName.ROUTED in settings.AVAILABLE_MODELS
+
+        with pytest.raises(ValueError, match="unavailable models"):
+            Settings(_env_file=None, ROUTED_MODELS=["claude-3-haiku"])
+
+
+def test_get_model_routed():
+    get_model.cache_clear()
+    routes = [FakeModelName.FAKE, OpenAIModelName.GPT_4O_MINI]
+    with patch("core.llm.settings.ROUTED_MODELS", routes):
+        model = get_model(RoutedModelName.ROUTED)
+    assert isinstance(model, RoutedChatModel)
+    assert model.model_names == ["fake", "gpt-4o-mini"]
+    assert model.invoke("Hi").content == "This is a test response from the fake model."
+    get_model.cache_clear()
@@ -19,7 +19,7 @@ def mock_agent():
     agent_mock = AsyncMock()
     agent_mock.ainvoke = AsyncMock(return_value={"messages": [AIMessage(content="Test response")]})
     agent_mock.get_state = Mock()  # Default empty mock for get_state
-    with patch("service.service.get_agent", Mock(return_value=agent_mock)):
+    with patch("service.service.aget_agent", AsyncMock(return_value=agent_mock)):
         yield agent_mock
 
 
@@ -27,25 +27,14 @@ def mock_agent():
 def mock_settings(mock_env):
     """Fixture to ensure settings are clean for each test."""
     with patch("service.service.settings") as mock_settings:
+        mock_settings.API_KEYS = []
         yield mock_settings
 
 
 @pytest.fixture
 def mock_httpx():
-    """Patch httpx.stream and httpx.get to use our test client."""
+    """Route the AgentClient's pooled sync client to our test client."""
 
     with TestClient(app) as client:
-
-        def mock_stream(method: str, url: str, **kwargs):
-            # Strip the base URL since TestClient expects just the path
-            path = url.replace("http://0.0.0.0", "")
-            return client.stream(method, path, **kwargs)
-
-        def mock_get(url: str, **kwargs):
-            # Strip the base URL since TestClient expects just the path
-            path = url.replace("http://0.0.0.0", "")
-            return client.get(path, **kwargs)
-
-        with patch("httpx.stream", mock_stream):
-            with patch("httpx.get", mock_get):
-                yield
+        with patch("httpx.Client", return_value=client):
+            yield
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+from pydantic import SecretStr
+
+from core.settings import ApiKeyConfig
+from service.admission import AdmissionController, Overloaded
+
+
+@pytest.mark.asyncio
+async def test_admission_caps_in_flight_runs() -> None:
+    controller = AdmissionController(max_in_flight=2, max_queue=4, queue_timeout=1.0)
+    first = await controller.acquire("a")
+    second = await controller.acquire("b")
+    waiting = asyncio.create_task(controller.acquire("a"))
+    await asyncio.sleep(0)
+    assert not waiting.done()
+    assert controller.stats().queue_depth == 1
+
+    first.release()
+    third = await waiting
+    assert controller.stats().in_flight == 2
+    # Releasing twice doesn't free a second slot
+    first.release()
+    assert controller.stats().in_flight == 2
+
+    second.release()
+    third.release()
+    stats = controller.stats()
+    assert (stats.in_flight, stats.admitted, stats.in_flight_by_agent) == (0, 3, {})
+
+
+@pytest.mark.asyncio
+async def test_admission_per_agent_cap_skips_saturated_agents() -> None:
+    controller = AdmissionController(max_in_flight_per_agent=1, queue_timeout=1.0)
+    busy = await controller.acquire("busy")
+    blocked = asyncio.create_task(controller.acquire("busy"))
+    await asyncio.sleep(0)
+
+    # The queued run of the saturated agent doesn't hold up other agents
+    other = await asyncio.wait_for(controller.acquire("other"), 0.1)
+    assert not blocked.done()
+
+    busy.release()
+    (await blocked).release()
+    other.release()
+
+
+@pytest.mark.asyncio
+async def test_admission_priority_order_and_shedding() -> None:
+    controller = AdmissionController(max_in_flight=1, max_queue=2, queue_timeout=1.0)
+    running = await controller.acquire("a")
+    low = asyncio.create_task(controller.acquire("a", "low"))
+    normal = asyncio.create_task(controller.acquire("a", "normal"))
+    await asyncio.sleep(0)
+
+    # The queue is full: a run of equal or lower priority is rejected right away...
+    with pytest.raises(Overloaded) as exc:
+        await controller.acquire("a", "low")
+    assert exc.value.retry_after >= 1
+
+    # ...and a higher-priority run sheds the lowest-priority waiter
+    high = asyncio.create_task(controller.acquire("a", "high"))
+    await asyncio.sleep(0)
+    with pytest.raises(Overloaded):
+        await low
+    assert controller.stats().rejected == 2
+
+    running.release()
+    slot = await high
+    assert not normal.done()
+    slot.release()
+    (await normal).release()
+
+
+@pytest.mark.asyncio
+async def test_admission_queue_timeout() -> None:
+    controller = AdmissionController(max_in_flight=1, queue_timeout=0.01)
+    running = await controller.acquire("a")
+    with pytest.raises(Overloaded, match="Timed out"):
+        await controller.acquire("a")
+    stats = controller.stats()
+    assert (stats.timed_out, stats.queue_depth) == (1, 0)
+    running.release()
+
+
+@pytest.mark.asyncio
+async def test_admission_weighted_fair_queue() -> None:
+    heavy = ApiKeyConfig(name="heavy", key=SecretStr("h"))
+    light = ApiKeyConfig(name="light", key=SecretStr("l"), weight=2.0)
+    controller = AdmissionController(max_in_flight=1, queue_timeout=1.0)
+    running = await controller.acquire("a", api_key=heavy)
+    backlog = [asyncio.create_task(controller.acquire("a", api_key=heavy)) for _ in range(3)]
+    await asyncio.sleep(0)
+    light_run = asyncio.create_task(controller.acquire("a", api_key=light))
+    await asyncio.sleep(0)
+
+    # The light key's run is served before the heavy key's backlog
+    running.release()
+    slot = await light_run
+    assert not any(task.done() for task in backlog)
+    assert controller.stats().in_flight_by_key == {"light": 1}
+    slot.release()
+    for task in backlog:
+        (await task).release()
+
+
+@pytest.mark.asyncio
+async def test_admission_per_key_cap() -> None:
+    capped = ApiKeyConfig(name="capped", key=SecretStr("c"), max_concurrency=1)
+    controller = AdmissionController(queue_timeout=1.0)
+    first = await controller.acquire("a", api_key=capped)
+    blocked = asyncio.create_task(controller.acquire("a", api_key=capped))
+    await asyncio.sleep(0)
+    # Other keys aren't held up by the capped key's queued run
+    (await asyncio.wait_for(controller.acquire("a"), 0.1)).release()
+    assert not blocked.done()
+    first.release()
+    (await blocked).release()
@@ -1,4 +1,12 @@
+from unittest.mock import patch
+
+import pytest
 from pydantic import SecretStr
+from starlette.websockets import WebSocketDisconnect
+
+from core.settings import ApiKeyConfig
+from schema import ApiKeyUsage
+from service.quotas import UsageTracker
 
 
 def test_no_auth_secret(mock_settings, mock_agent, test_client):
@@ -40,3 +48,47 @@ def test_auth_secret_incorrect(mock_settings, mock_agent, test_client):
     # Should also reject requests with no auth header
     response = test_client.post("/invoke", json={"message": "test"})
     assert response.status_code == 401
+
+
+def test_websocket_auth(mock_settings, mock_agent, test_client):
+    """Test that WebSocket sessions check AUTH_SECRET when they connect"""
+    mock_settings.AUTH_SECRET = SecretStr("test-secret")
+    with pytest.raises(WebSocketDisconnect) as exc_info:
+        with test_client.websocket_connect("/ws", headers={"Authorization": "Bearer wrong"}):
+            pass
+    assert exc_info.value.code == 1008
+
+    with test_client.websocket_connect(
+        "/ws", headers={"Authorization": "Bearer test-secret"}
+    ) as websocket:
+        websocket.send_json({"type": "cancel", "id": "unknown"})
+
+
+def test_api_keys(mock_settings, mock_agent, test_client):
+    """Test that every configured API key authenticates, and gets its own quota and usage"""
+    mock_settings.AUTH_SECRET = SecretStr("test-secret")
+    limited = ApiKeyConfig(name="batch", key=SecretStr("batch-key"), tokens_per_minute=100)
+    mock_settings.API_KEYS = [ApiKeyConfig(name="web", key=SecretStr("web-key")), limited]
+    tracker = UsageTracker()
+    with patch("service.service.get_usage_tracker", return_value=tracker):
+        for key in ("web-key", "batch-key", "test-secret"):
+            headers = {"Authorization": f"Bearer {key}"}
+            response = test_client.post("/invoke", json={"message": "test"}, headers=headers)
+            assert response.status_code == 200
+        headers = {"Authorization": "Bearer wrong-key"}
+        response = test_client.post("/invoke", json={"message": "test"}, headers=headers)
+        assert response.status_code == 401
+
+        # A key that spent its tokens per minute is rejected until its budget refills
+        tracker.record(limited, input_tokens=100, output_tokens=50)
+        headers = {"Authorization": "Bearer batch-key"}
+        response = test_client.post("/invoke", json={"message": "test"}, headers=headers)
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+
+        response = test_client.get("/usage", headers=headers)
+        assert response.status_code == 200
+        usage = ApiKeyUsage.model_validate(response.json())
+        assert (usage.name, usage.requests, usage.rejected) == ("batch", 1, 1)
+        assert (usage.input_tokens, usage.output_tokens) == (100, 50)
+        assert usage.tokens_per_minute == 100
@@ -0,0 +1,183 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, MessagesState, StateGraph
+
+from service.checkpointer import (
+    BatchedCommits,
+    _checkpoint_id_at,
+    agent_checkpointers,
+    maintain_checkpoints,
+    register_checkpointer_backend,
+    shard_path,
+)
+from service.metrics import InstrumentedCheckpointer
+
+
+def _config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+
+
+@pytest.mark.asyncio
+async def test_batched_commits():
+    """Test that commits within the interval are grouped and flush() commits right away."""
+    conn = Mock(commit=AsyncMock())
+    batched = BatchedCommits(conn, interval=0.01)
+    for _ in range(3):
+        await batched.commit()
+    conn.commit.assert_not_awaited()
+    await asyncio.sleep(0.05)
+    assert conn.commit.await_count == 1
+
+    await batched.commit()
+    await batched.flush()
+    assert conn.commit.await_count == 2
+    await asyncio.sleep(0.05)
+    assert conn.commit.await_count == 2
+
+    # Without an interval every commit goes through
+    unbatched = BatchedCommits(conn, interval=0)
+    await unbatched.commit()
+    assert conn.commit.await_count == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["sqlite", "sqlite-sharded"])
+async def test_agent_checkpointers(tmp_path, backend):
+    """Test that each agent gets its own checkpointer and checkpoints survive a restart."""
+    path = str(tmp_path / "checkpoints.db")
+    with (
+        patch("service.checkpointer.settings.CHECKPOINT_SQLITE_PATH", path),
+        patch("service.checkpointer.settings.CHECKPOINT_COMMIT_INTERVAL_MS", 1000),
+    ):
+        async with agent_checkpointers(["a", "b"], backend=backend) as savers:
+            assert savers["a"] is not savers["b"]
+            assert savers["a"].conn is not savers["b"].conn
+            checkpoint = empty_checkpoint()
+            await savers["a"].aput(_config("thread"), checkpoint, {}, {})
+            # The commit is still pending, but the agent reads its own write
+            assert (await savers["a"].aget_tuple(_config("thread"))).checkpoint == checkpoint
+            (journal_mode,) = await (
+                await savers["a"].conn.execute("PRAGMA journal_mode")
+            ).fetchone()
+            assert journal_mode == "wal"
+
+        # The pending commit was flushed on close
+        async with agent_checkpointers(["a", "b"], backend=backend) as savers:
+            assert (await savers["a"].aget_tuple(_config("thread"))).checkpoint == checkpoint
+            if backend == "sqlite-sharded":
+                assert await savers["b"].aget_tuple(_config("thread")) is None
+
+    if backend == "sqlite-sharded":
+        assert (tmp_path / "checkpoints.a.db").exists()
+        assert (tmp_path / "checkpoints.b.db").exists()
+
+
+@pytest.mark.asyncio
+async def test_register_checkpointer_backend():
+    """Test that custom backends can be plugged in and unknown backends are rejected."""
+    opened = []
+
+    @asynccontextmanager
+    async def memory_backend(agent_id):
+        opened.append(agent_id)
+        yield MemorySaver()
+
+    register_checkpointer_backend("memory", memory_backend)
+    async with agent_checkpointers(["a", "b"], backend="memory") as savers:
+        assert all(isinstance(saver, MemorySaver) for saver in savers.values())
+    assert opened == ["a", "b"]
+
+    with pytest.raises(ValueError, match="Unknown checkpointer backend"):
+        async with agent_checkpointers(["a"], backend="missing"):
+            pass
+
+
+def test_shard_path():
+    assert shard_path("data/checkpoints.db", "chatbot") == "data/checkpoints.chatbot.db"
+
+
+async def _put(saver, thread_id: str, age: float, size: int = 0) -> None:
+    checkpoint = empty_checkpoint()
+    checkpoint["id"] = _checkpoint_id_at(time.time() - age)
+    checkpoint["channel_values"] = {"padding": "x" * size}
+    config = await saver.aput(_config(thread_id), checkpoint, {}, {})
+    await saver.aput_writes(config, [("messages", "hi")], task_id="task")
+
+
+@pytest.mark.asyncio
+async def test_maintain_checkpoints(tmp_path):
+    """Test pruning old checkpoints, expiring inactive threads and vacuuming the database."""
+    with patch("service.checkpointer.settings.CHECKPOINT_SQLITE_PATH", str(tmp_path / "c.db")):
+        async with agent_checkpointers(["a", "b"], backend="sqlite") as savers:
+            saver = savers["a"]
+            for age in (1000, 999):
+                await _put(saver, "inactive", age)
+            for age in range(5, 0, -1):
+                await _put(saver, "active", age, size=100_000)
+            latest = await saver.aget_tuple(_config("active"))
+
+            # Both agents use the same database, which is only maintained once
+            report = await maintain_checkpoints(savers.values(), keep_per_thread=2, thread_ttl=100)
+            assert report.threads_expired == 1
+            assert report.checkpoints_deleted == 5
+            assert report.writes_deleted == 5
+            assert report.bytes_reclaimed > 200_000
+            assert report.size_bytes > 0
+
+            assert await saver.aget_tuple(_config("inactive")) is None
+            assert await saver.aget_tuple(_config("active")) == latest
+            assert len([c async for c in saver.alist(_config("active"))]) == 2
+
+            report = await maintain_checkpoints(
+                savers.values(), keep_per_thread=2, thread_ttl=100, full_vacuum=True
+            )
+            assert report.checkpoints_deleted == 0
+            assert await saver.aget_tuple(_config("active")) == latest
+
+            # Maintenance waits for every agent on the database, not just the first one
+            async with savers["b"].lock:
+                task = asyncio.create_task(maintain_checkpoints(savers.values()))
+                await asyncio.sleep(0.05)
+                assert not task.done()
+            await asyncio.wait_for(task, timeout=5)
+
+            # Instrumenting a saver for an agent leaves the saver itself to maintenance
+            instrumented = InstrumentedCheckpointer(saver, "a")
+            assert instrumented.conn is saver.conn
+            assert await instrumented.aget_tuple(_config("active")) == latest
+            report = await maintain_checkpoints(savers.values(), keep_per_thread=2)
+            assert report.size_bytes > 0
+
+            # Savers of other backends are skipped
+            report = await maintain_checkpoints([MemorySaver()], keep_per_thread=1)
+            assert report.size_bytes == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_run_does_not_lock_the_database(tmp_path):
+    """Test that the pending writes of a failed run are committed, so other agents can write."""
+
+    def fail(state: MessagesState) -> MessagesState:
+        raise RuntimeError("node failed")
+
+    graph = StateGraph(MessagesState)
+    graph.add_node("fail", fail)
+    graph.set_entry_point("fail")
+    graph.add_edge("fail", END)
+    with (
+        patch("service.checkpointer.settings.CHECKPOINT_SQLITE_PATH", str(tmp_path / "c.db")),
+        patch("service.checkpointer.settings.CHECKPOINT_SQLITE_BUSY_TIMEOUT_MS", 100),
+    ):
+        async with agent_checkpointers(["a", "b"], backend="sqlite") as savers:
+            with pytest.raises(RuntimeError, match="node failed"):
+                await graph.compile(checkpointer=savers["a"]).ainvoke(
+                    {"messages": [("user", "hi")]}, _config("failed")
+                )
+            await savers["b"].aput(_config("other"), empty_checkpoint(), {}, {})
+            assert await savers["b"].aget_tuple(_config("other")) is not None
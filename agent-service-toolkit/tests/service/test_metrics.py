@@ -0,0 +1,74 @@
+from uuid import uuid4
+
+import pytest
+from langchain_core.language_models import FakeListChatModel
+from langgraph.graph import END, MessagesState, StateGraph
+
+from service.metrics import (
+    CounterMetric,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+    RunMetricsHandler,
+    registry,
+)
+
+
+def test_registry_render() -> None:
+    test_registry = MetricsRegistry()
+    requests = test_registry.add(CounterMetric("requests_total", "Requests.", ["route"]))
+    in_flight = test_registry.add(Gauge("in_flight", "In flight."))
+    latency = test_registry.add(Histogram("latency_seconds", "Latency.", ["route"], [0.1, 1]))
+    test_registry.add_collector(lambda: [("size", "gauge", "Size.", [({"db": 'a"b'}, 3)])])
+
+    requests.inc(route="/invoke")
+    requests.inc(2, route="/invoke")
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+    latency.observe(0.05, route="/invoke")
+    latency.observe(0.5, route="/invoke")
+    latency.observe(5, route="/invoke")
+
+    assert test_registry.render().splitlines() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{route="/invoke"} 3',
+        "# HELP in_flight In flight.",
+        "# TYPE in_flight gauge",
+        "in_flight 1",
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/invoke",le="0.1"} 1',
+        'latency_seconds_bucket{route="/invoke",le="1"} 2',
+        'latency_seconds_bucket{route="/invoke",le="+Inf"} 3',
+        'latency_seconds_sum{route="/invoke"} 5.55',
+        'latency_seconds_count{route="/invoke"} 3',
+        "# HELP size Size.",
+        "# TYPE size gauge",
+        'size{db="a\\"b"} 3',
+    ]
+
+
+@pytest.mark.asyncio
+async def test_run_metrics_handler() -> None:
+    agent_id = f"agent-{uuid4()}"
+    model = FakeListChatModel(responses=["hi"])
+
+    async def respond(state: MessagesState) -> MessagesState:
+        return {"messages": [await model.ainvoke(state["messages"])]}
+
+    graph = StateGraph(MessagesState)
+    graph.add_node("respond", respond)
+    graph.set_entry_point("respond")
+    graph.add_edge("respond", END)
+    handler = RunMetricsHandler(agent_id)
+
+    await graph.compile().ainvoke({"messages": [("user", "hello")]}, {"callbacks": [handler]})
+
+    output = registry.render()
+    assert f'agent_service_runs_in_flight{{agent="{agent_id}"}} 0' in output
+    node = f'agent_service_graph_node_duration_seconds_count{{agent="{agent_id}",node="respond"}}'
+    assert f"{node} 1" in output
+    llm_call = "agent_service_llm_call_duration_seconds_count"
+    assert f'{llm_call}{{agent="{agent_id}",provider="fakelistchatmodel"' in output
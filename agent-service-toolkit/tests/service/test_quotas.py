@@ -0,0 +1,44 @@
+from unittest.mock import patch
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from pydantic import SecretStr
+
+from core.settings import ApiKeyConfig
+from service.quotas import QuotaExceeded, UsageHandler, UsageTracker
+
+
+def test_usage_tracker_enforces_tokens_per_minute() -> None:
+    api_key = ApiKeyConfig(name="tenant", key=SecretStr("secret"), tokens_per_minute=60)
+    tracker = UsageTracker()
+    tracker.check(api_key)
+    tracker.start(api_key)
+    # A run may overdraw the budget, later runs wait until it's paid back
+    tracker.record(api_key, input_tokens=50, output_tokens=40)
+    with pytest.raises(QuotaExceeded) as exc:
+        tracker.check(api_key)
+    assert 20 <= exc.value.retry_after <= 31
+
+    # Unlimited and anonymous requests are only counted
+    for _ in range(2):
+        tracker.check(None)
+        tracker.start(None)
+    tracker.record(None, input_tokens=1000, output_tokens=1000)
+
+    usage = tracker.usage()
+    assert (usage["tenant"].requests, usage["tenant"].rejected) == (1, 1)
+    assert (usage["tenant"].input_tokens, usage["tenant"].output_tokens) == (50, 40)
+    assert usage["anonymous"].requests == 2
+
+
+def test_usage_handler_charges_llm_tokens() -> None:
+    api_key = ApiKeyConfig(name="tenant", key=SecretStr("secret"))
+    tracker = UsageTracker()
+    message = AIMessage(
+        content="Hi", usage_metadata={"input_tokens": 7, "output_tokens": 3, "total_tokens": 10}
+    )
+    with patch("service.quotas.get_usage_tracker", return_value=tracker):
+        UsageHandler(api_key).on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]))
+    usage = tracker.usage()["tenant"]
+    assert (usage.input_tokens, usage.output_tokens) == (7, 3)
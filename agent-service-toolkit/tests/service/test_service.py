@@ -1,15 +1,41 @@
+import asyncio
 import json
+import threading
+import time
 from types import SimpleNamespace
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, Mock, patch
+from uuid import uuid4
 
+import httpx
 import langsmith
 import pytest
+import uvicorn
+from fastapi import HTTPException, WebSocket
 from langchain_core.messages import AIMessage, HumanMessage
-from langgraph.pregel.types import StateSnapshot
-
-from agents.agents import Agent
-from schema import ChatHistory, ChatMessage, ServiceMetadata
+from langgraph.checkpoint.base import CheckpointTuple
+from pydantic import SecretStr
+from websockets.sync.client import connect
+
+from agents.agents import DEFAULT_AGENT, Agent
+from core.settings import ApiKeyConfig
+from schema import (
+    BatchOutput,
+    ChatHistory,
+    ChatMessage,
+    CheckpointMaintenanceReport,
+    RunTimeline,
+    ServiceMetadata,
+    StreamInput,
+    TimelineSpan,
+)
 from schema.models import OpenAIModelName
+from service import app
+from service.admission import ANONYMOUS, AdmissionController
+from service.metrics import stream_metrics
+from service.quotas import UsageTracker
+from service.service import run_timeline, run_timeline_chrome, stream
+from service.sse import EventStreamResponse
+from service.timeline import TimelineTracer
 
 
 def test_invoke(test_client, mock_agent) -> None:
@@ -23,6 +49,8 @@ def test_invoke(test_client, mock_agent) -> None:
     mock_agent.ainvoke.assert_awaited_once()
     input_message = mock_agent.ainvoke.await_args.kwargs["input"]["messages"][0]
     assert input_message.content == QUESTION
+    # The thread's checkpoints record which API key it belongs to
+    assert mock_agent.ainvoke.await_args.kwargs["config"]["metadata"] == {"owner": ANONYMOUS}
 
     output = ChatMessage.model_validate(response.json())
     assert output.type == "ai"
@@ -43,13 +71,13 @@ def test_invoke_custom_agent(test_client, mock_agent) -> None:
     # Configure our custom mock agent
     mock_agent.ainvoke.return_value = {"messages": [AIMessage(content=CUSTOM_ANSWER)]}
 
-    # Patch get_agent to return the correct agent based on the provided agent_id
+    # Patch aget_agent to return the correct agent based on the provided agent_id
     def agent_lookup(agent_id):
         if agent_id == CUSTOM_AGENT:
             return mock_agent
         return default_mock
 
-    with patch("service.service.get_agent", side_effect=agent_lookup):
+    with patch("service.service.aget_agent", AsyncMock(side_effect=agent_lookup)):
         response = test_client.post(f"/{CUSTOM_AGENT}/invoke", json={"message": QUESTION})
         assert response.status_code == 200
 
@@ -123,6 +151,137 @@ def test_invoke_custom_agent_config(test_client, mock_agent) -> None:
     assert response.status_code == 422
 
 
+@pytest.mark.asyncio
+async def test_invoke_coalescing(mock_agent) -> None:
+    """Test that identical concurrent /invoke requests share a single graph run."""
+    QUESTION = "What is the weather in Tokyo?"
+    ANSWER = "The weather in Tokyo is sunny."
+    release = asyncio.Event()
+
+    async def slow_ainvoke(**kwargs):
+        await release.wait()
+        return {"messages": [AIMessage(content=ANSWER)]}
+
+    mock_agent.ainvoke.side_effect = slow_ainvoke
+    controller = AdmissionController()
+    tracker = UsageTracker()
+
+    transport = httpx.ASGITransport(app=app)
+    with (
+        patch("service.service.settings.COALESCE_INVOKES", True),
+        patch("service.service.get_admission_controller", return_value=controller),
+        patch("service.service.get_usage_tracker", return_value=tracker),
+    ):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            requests = [
+                asyncio.create_task(client.post("/invoke", json={"message": QUESTION}))
+                for _ in range(4)
+            ]
+            # A request with a thread_id never shares a run
+            threaded = asyncio.create_task(
+                client.post("/invoke", json={"message": QUESTION, "thread_id": "thread-1"})
+            )
+            async with asyncio.timeout(5):
+                while mock_agent.ainvoke.await_count < 2:
+                    await asyncio.sleep(0.01)
+            await asyncio.sleep(0.05)
+            # The shared run holds one slot, however many requests wait on it
+            assert controller.stats().in_flight == 2
+            # and keeps it when the request that started it goes away
+            requests[0].cancel()
+            await asyncio.sleep(0.05)
+            assert controller.stats().in_flight == 2
+            release.set()
+            responses = await asyncio.gather(*requests[1:], threaded)
+
+    assert all(r.status_code == 200 for r in responses)
+    outputs = [ChatMessage.model_validate(r.json()) for r in responses]
+    assert all(o.content == ANSWER for o in outputs)
+    # Only the request that started the shared run can leave feedback on it, and it's gone
+    assert all(o.run_id is None for o in outputs[:3])
+    assert outputs[3].run_id is not None
+    assert mock_agent.ainvoke.await_count == 2
+    assert controller.stats().in_flight == 0
+    assert tracker.usage()[ANONYMOUS].requests == 2
+
+    # Coalescing is opt-in
+    mock_agent.ainvoke.side_effect = None
+    mock_agent.ainvoke.return_value = {"messages": [AIMessage(content=ANSWER)]}
+    mock_agent.ainvoke.reset_mock()
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        await asyncio.gather(
+            *(client.post("/invoke", json={"message": QUESTION}) for _ in range(2))
+        )
+    assert mock_agent.ainvoke.await_count == 2
+
+
+def test_batch(test_client, mock_agent) -> None:
+    """Test that /batch runs every input and returns results in order with per-item errors."""
+
+    async def fake_ainvoke(input, config):
+        content = input["messages"][0].content
+        if content == "fail":
+            raise ValueError("boom")
+        return {"messages": [AIMessage(content=f"Answer to {content}")]}
+
+    mock_agent.ainvoke.side_effect = fake_ainvoke
+
+    inputs = [
+        {"message": "one"},
+        {"message": "fail"},
+        {"message": "two", "agent_config": {"model": "gpt-4o"}},
+        {"message": "three"},
+    ]
+    response = test_client.post("/batch", json={"inputs": inputs, "max_concurrency": 2})
+    assert response.status_code == 200
+
+    results = BatchOutput.model_validate(response.json()).results
+    assert len(results) == 4
+    assert results[0].message.content == "Answer to one"
+    assert results[0].message.run_id is not None
+    assert results[1].message is None
+    assert results[1].error == "Unexpected error"
+    assert "reserved keys" in results[2].error
+    assert results[3].message.content == "Answer to three"
+    assert mock_agent.ainvoke.await_count == 3
+
+    # An empty batch is rejected
+    response = test_client.post("/batch", json={"inputs": []})
+    assert response.status_code == 422
+    # So is an oversized one
+    response = test_client.post("/batch", json={"inputs": [{"message": "hi"}] * 101})
+    assert response.status_code == 422
+
+
+def test_batch_serializes_inputs_of_one_thread(test_client, mock_agent) -> None:
+    """Test that /batch runs inputs sharing a thread_id one after another, in input order."""
+    running: set[str] = set()
+    order: list[str] = []
+
+    async def fake_ainvoke(input, config):
+        thread_id = config["configurable"]["thread_id"]
+        assert thread_id not in running, "two runs of one thread overlapped"
+        running.add(thread_id)
+        order.append(input["messages"][0].content)
+        await asyncio.sleep(0.01)
+        running.discard(thread_id)
+        return {"messages": [AIMessage(content="ok")]}
+
+    mock_agent.ainvoke.side_effect = fake_ainvoke
+    inputs = [
+        {"message": "a1", "thread_id": "a"},
+        {"message": "b1", "thread_id": "b"},
+        {"message": "a2", "thread_id": "a"},
+        {"message": "a3", "thread_id": "a"},
+    ]
+    response = test_client.post("/batch", json={"inputs": inputs})
+    assert response.status_code == 200
+    assert all(r["error"] is None for r in response.json()["results"])
+    assert [m for m in order if m.startswith("a")] == ["a1", "a2", "a3"]
+    # Other threads still run alongside
+    assert order.index("b1") < order.index("a2")
+
+
 @patch("service.service.LangsmithClient")
 def test_feedback(mock_client: langsmith.Client, test_client) -> None:
     ls_instance = mock_client.return_value
@@ -147,14 +306,10 @@ def test_history(test_client, mock_agent) -> None:
     ANSWER = "The weather in Tokyo is 70 degrees."
     user_question = HumanMessage(content=QUESTION)
     agent_response = AIMessage(content=ANSWER)
-    mock_agent.get_state.return_value = StateSnapshot(
-        values={"messages": [user_question, agent_response]},
-        next=(),
+    mock_agent.checkpointer.aget_tuple.return_value = CheckpointTuple(
         config={},
-        metadata=None,
-        created_at=None,
-        parent_config=None,
-        tasks=(),
+        checkpoint={"channel_values": {"messages": [user_question, agent_response]}},
+        metadata={},
     )
 
     response = test_client.post(
@@ -167,6 +322,124 @@ def test_history(test_client, mock_agent) -> None:
     assert output.messages[0].content == QUESTION
     assert output.messages[1].type == "ai"
     assert output.messages[1].content == ANSWER
+    assert output.next_cursor is None
+
+    config = mock_agent.checkpointer.aget_tuple.await_args.args[0]
+    assert config["configurable"]["thread_id"] == "7bcc7cc1-99d7-4b1d-bdb5-e6f90ed44de6"
+
+
+def test_history_pagination(test_client, mock_agent) -> None:
+    """Test that /history pages through a thread from the newest messages to the oldest."""
+    messages = [HumanMessage(content=str(i), id=f"msg-{i}") for i in range(5)]
+
+    def set_messages(messages: list[HumanMessage]) -> None:
+        mock_agent.checkpointer.aget_tuple.return_value = CheckpointTuple(
+            config={}, checkpoint={"channel_values": {"messages": messages}}, metadata={}
+        )
+
+    def get_page(before: str | None) -> ChatHistory:
+        response = test_client.post(
+            "/test-agent/history", json={"thread_id": "t", "limit": 2, "before": before}
+        )
+        assert response.status_code == 200
+        return ChatHistory.model_validate(response.json())
+
+    set_messages(messages)
+    first = get_page(None)
+    assert [m.content for m in first.messages] == ["3", "4"]
+    assert first.next_cursor == "msg-3"
+
+    # Messages removed from or added to the thread between pages don't shift the cursor
+    set_messages([messages[0], *messages[2:], HumanMessage(content="5", id="msg-5")])
+    second = get_page(first.next_cursor)
+    assert [m.content for m in second.messages] == ["0", "2"]
+    assert second.next_cursor is None
+
+    # A cursor whose message is gone can't be resumed
+    response = test_client.post(
+        "/test-agent/history", json={"thread_id": "t", "limit": 2, "before": "msg-1"}
+    )
+    assert response.status_code == 410
+
+    # A thread without checkpoints has no history
+    mock_agent.checkpointer.aget_tuple.return_value = None
+    response = test_client.post("/history", json={"thread_id": "unknown"})
+    assert ChatHistory.model_validate(response.json()) == ChatHistory(messages=[])
+
+
+def test_threads_are_scoped_to_api_key(mock_settings, test_client, mock_agent) -> None:
+    """Test that only the API key that started a thread can read or continue it."""
+    mock_settings.AUTH_SECRET = None
+    mock_settings.API_KEYS = [
+        ApiKeyConfig(name="owner", key=SecretStr("owner-key")),
+        ApiKeyConfig(name="other", key=SecretStr("other-key")),
+    ]
+    mock_agent.checkpointer.aget_tuple.return_value = CheckpointTuple(
+        config={},
+        checkpoint={"channel_values": {"messages": [HumanMessage(content="secret")]}},
+        metadata={"owner": "owner"},
+    )
+    for key, status_code in (("other-key", 404), ("owner-key", 200)):
+        response = test_client.post(
+            "/history", json={"thread_id": "t"}, headers={"Authorization": f"Bearer {key}"}
+        )
+        assert response.status_code == status_code
+
+    response = test_client.post(
+        "/invoke",
+        json={"message": "Hi", "thread_id": "t"},
+        headers={"Authorization": "Bearer other-key"},
+    )
+    assert response.status_code == 404
+    mock_agent.ainvoke.assert_not_awaited()
+
+
+def test_checkpoint_maintenance(test_client) -> None:
+    """Test that the admin endpoint runs checkpoint maintenance with the configured limits."""
+    report = CheckpointMaintenanceReport(checkpoints_deleted=3, size_bytes=4096)
+    saver = Mock()
+    with (
+        patch("service.service.run_checkpoint_maintenance", return_value=report) as mock_run,
+        patch.object(app.state, "checkpointers", {"a": saver}, create=True),
+    ):
+        response = test_client.post("/admin/checkpoints/maintenance?full_vacuum=true")
+    assert response.status_code == 200
+    assert CheckpointMaintenanceReport.model_validate(response.json()) == report
+    assert list(mock_run.await_args.args[0]) == [saver]
+    assert mock_run.await_args.kwargs == {"full_vacuum": True}
+
+
+def test_checkpoint_maintenance_requires_admin(mock_settings, test_client) -> None:
+    """Test that only AUTH_SECRET and admin API keys may run checkpoint maintenance."""
+    mock_settings.AUTH_SECRET = SecretStr("test-secret")
+    mock_settings.API_KEYS = [
+        ApiKeyConfig(name="tenant", key=SecretStr("tenant-key")),
+        ApiKeyConfig(name="ops", key=SecretStr("ops-key"), admin=True),
+    ]
+    report = CheckpointMaintenanceReport()
+    with (
+        patch("service.service.run_checkpoint_maintenance", return_value=report) as mock_run,
+        patch.object(app.state, "checkpointers", {}, create=True),
+    ):
+        for key, status_code in (("tenant-key", 403), ("ops-key", 200), ("test-secret", 200)):
+            response = test_client.post(
+                "/admin/checkpoints/maintenance", headers={"Authorization": f"Bearer {key}"}
+            )
+            assert response.status_code == status_code
+    assert mock_run.await_count == 2
+
+
+def test_metrics_requires_admin(mock_settings, test_client) -> None:
+    """Test that only AUTH_SECRET and admin API keys may read the metrics of all keys."""
+    mock_settings.AUTH_SECRET = SecretStr("test-secret")
+    mock_settings.API_KEYS = [
+        ApiKeyConfig(name="tenant", key=SecretStr("tenant-key")),
+        ApiKeyConfig(name="ops", key=SecretStr("ops-key"), admin=True),
+    ]
+    assert test_client.get("/metrics").status_code == 401
+    for key, status_code in (("tenant-key", 403), ("ops-key", 200), ("test-secret", 200)):
+        response = test_client.get("/metrics", headers={"Authorization": f"Bearer {key}"})
+        assert response.status_code == status_code
 
 
 @pytest.mark.asyncio
@@ -207,7 +480,7 @@ async def test_stream(test_client, mock_agent) -> None:
         # Collect all SSE messages
         messages = []
         for line in response.iter_lines():
-            if line and line.strip() != "data: [DONE]":  # Skip [DONE] message
+            if line.startswith("data: ") and line.strip() != "data: [DONE]":  # Skip [DONE] message
                 messages.append(json.loads(line.lstrip("data: ")))
 
         # Verify streamed tokens
@@ -260,7 +533,7 @@ async def test_stream_no_tokens(test_client, mock_agent) -> None:
         # Collect all SSE messages
         messages = []
         for line in response.iter_lines():
-            if line and line.strip() != "data: [DONE]":  # Skip [DONE] message
+            if line.startswith("data: ") and line.strip() != "data: [DONE]":  # Skip [DONE] message
                 messages.append(json.loads(line.lstrip("data: ")))
 
         # Verify no token messages
@@ -329,7 +602,7 @@ async def test_stream_with_commands(test_client, mock_agent) -> None:
         # Collect all SSE messages
         messages = []
         for line in response.iter_lines():
-            if line and line.strip() != "data: [DONE]":  # Skip [DONE] message
+            if line.startswith("data: ") and line.strip() != "data: [DONE]":  # Skip [DONE] message
                 messages.append(json.loads(line.lstrip("data: ")))
 
     # Verify messages
@@ -344,3 +617,364 @@ async def test_stream_with_commands(test_client, mock_agent) -> None:
         assert second_message == "Hello C"
     assert final_messages[0]["content"]["type"] == "ai"
     assert final_messages[1]["content"]["type"] == "ai"
+
+
+@pytest.mark.asyncio
+async def test_stream_coalesced_tokens(test_client, mock_agent) -> None:
+    """Test that coalesced tokens are joined into frames, flushed by size, time and messages."""
+    QUESTION = "What is the weather in Tokyo?"
+
+    def token(content: str) -> dict:
+        return {
+            "event": "on_chat_model_stream",
+            "data": {"chunk": SimpleNamespace(content=content)},
+            "tags": [],
+        }
+
+    async def mock_astream_events(**kwargs):
+        for content in ["The", " weather", " in"]:
+            yield token(content)
+        # Longer than the window: the buffered tokens are sent without waiting for more
+        await asyncio.sleep(0.3)
+        for content in [" Tokyo", " is", " sunny", "."]:
+            yield token(content)
+        yield {
+            "event": "on_chain_end",
+            "data": {"output": {"messages": [AIMessage(content="The weather in Tokyo is sunny.")]}},
+            "tags": ["graph:step:1"],
+        }
+
+    mock_agent.astream_events = mock_astream_events
+
+    request = {
+        "message": QUESTION,
+        "coalesce_tokens": True,
+        "coalesce_window_ms": 50,
+        "coalesce_max_bytes": 10,
+    }
+    with test_client.stream("POST", "/stream", json=request) as response:
+        assert response.status_code == 200
+        frames = [
+            json.loads(line.removeprefix("data: "))
+            for line in response.iter_lines()
+            if line.startswith("data: ") and line.strip() != "data: [DONE]"
+        ]
+
+    assert [(f["type"], f["content"]) for f in frames[:-1]] == [
+        ("token", "The weather"),  # size
+        ("token", " in"),  # time window
+        ("token", " Tokyo is sunny"),  # size
+        ("token", "."),  # message boundary
+    ]
+    assert frames[-1]["type"] == "message"
+
+
+@pytest.mark.asyncio
+async def test_stream_cancelled_on_disconnect(mock_agent) -> None:
+    """Test that a client disconnect cancels the agent run and is counted."""
+    graph_closed = asyncio.Event()
+
+    async def mock_astream_events(**kwargs):
+        try:
+            yield {
+                "event": "on_chat_model_stream",
+                "data": {"chunk": SimpleNamespace(content="Hello")},
+                "tags": [],
+            }
+            # A long tool call the client won't wait for
+            await asyncio.sleep(10)
+            yield {"event": "on_chain_end", "data": {"output": {}}, "tags": []}
+        finally:
+            graph_closed.set()
+
+    mock_agent.astream_events = mock_astream_events
+
+    frames = []
+    disconnected = asyncio.Event()
+
+    async def receive() -> dict:
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None:
+        if message.get("body"):
+            frames.append(message["body"])
+            disconnected.set()
+
+    cancelled = stream_metrics.cancelled
+    with patch("service.service.settings.STREAM_RESUME_TIMEOUT", 0):
+        response = await stream(StreamInput(message="Hi"))
+        await asyncio.wait_for(response({"type": "http"}, receive, send), timeout=2)
+        await asyncio.wait_for(graph_closed.wait(), timeout=2)
+
+    [frame] = frames
+    assert frame.endswith(b'\ndata: {"type":"token","content":"Hello"}\n\n')
+    assert stream_metrics.cancelled == cancelled + 1
+
+
+@pytest.mark.asyncio
+async def test_stream_resume(mock_agent) -> None:
+    """Test that a dropped stream resumes from Last-Event-ID on the still running run."""
+    resume = asyncio.Event()
+
+    def token(content: str) -> dict:
+        return {
+            "event": "on_chat_model_stream",
+            "data": {"chunk": SimpleNamespace(content=content)},
+            "tags": [],
+        }
+
+    async def mock_astream_events(**kwargs):
+        yield token("one")
+        # The run keeps producing while the client is away
+        await resume.wait()
+        yield token("two")
+        yield token("three")
+
+    mock_agent.astream_events = mock_astream_events
+
+    async def read(response: EventStreamResponse, limit: int | None = None) -> list[bytes]:
+        frames = []
+        done = asyncio.Event()
+
+        async def receive() -> dict:
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: dict) -> None:
+            if message.get("body"):
+                frames.append(message["body"])
+            if len(frames) == limit or not message.get("more_body", True):
+                done.set()
+
+        await asyncio.wait_for(response({"type": "http"}, receive, send), timeout=2)
+        return frames
+
+    def parse(frame: bytes) -> tuple[str, str]:
+        id_line, data_line = frame.decode().strip().split("\n")
+        return id_line.removeprefix("id: "), data_line.removeprefix("data: ")
+
+    first = await read(await stream(StreamInput(message="Hi")), limit=1)
+    event_id, data = parse(first[0])
+    assert json.loads(data)["content"] == "one"
+
+    # Only the API key that started the stream can resume it
+    other_key = ApiKeyConfig(name="other", key="other-secret")
+    with pytest.raises(HTTPException) as exc:
+        await stream(StreamInput(message="Hi"), last_event_id=event_id, api_key=other_key)
+    assert exc.value.status_code == 404
+
+    resume.set()
+    resumed = stream_metrics.resumed
+    rest = await read(await stream(StreamInput(message="Hi"), last_event_id=event_id))
+    assert [json.loads(parse(f)[1]).get("content") for f in rest[:-1]] == ["two", "three"]
+    assert parse(rest[-1])[1] == "[DONE]"
+    assert stream_metrics.resumed == resumed + 1
+
+    # Unknown or expired streams can't be resumed
+    with pytest.raises(HTTPException) as exc:
+        await stream(StreamInput(message="Hi"), last_event_id="unknown:1")
+    assert exc.value.status_code == 404
+
+
+def test_websocket_session(test_client, mock_agent) -> None:
+    """Test that runs on one WebSocket are multiplexed and can be cancelled."""
+    cancelled = asyncio.Event()
+
+    async def mock_astream_events(**kwargs):
+        question = kwargs["input"]["messages"][0].content
+        yield {
+            "event": "on_chat_model_stream",
+            "data": {"chunk": SimpleNamespace(content=question.upper())},
+            "tags": [],
+        }
+        if question == "slow":
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        yield {
+            "event": "on_chain_end",
+            "data": {"output": {"messages": [AIMessage(content=f"answer to {question}")]}},
+            "tags": ["graph:step:1"],
+        }
+
+    mock_agent.astream_events = mock_astream_events
+
+    with test_client.websocket_connect("/ws/test-agent") as websocket:
+        websocket.send_json({"type": "run", "id": "slow", "input": {"message": "slow"}})
+        assert websocket.receive_json() == {"id": "slow", "type": "token", "content": "SLOW"}
+
+        # A second run completes while the first one is still running
+        websocket.send_json({"type": "run", "id": "fast", "input": {"message": "fast"}})
+        events = [websocket.receive_json() for _ in range(3)]
+        assert [e["type"] for e in events] == ["token", "message", "end"]
+        assert all(e["id"] == "fast" for e in events)
+        assert events[1]["content"]["content"] == "answer to fast"
+
+        websocket.send_json({"type": "cancel", "id": "slow"})
+        assert websocket.receive_json() == {"id": "slow", "type": "cancelled"}
+        assert cancelled.is_set()
+
+        websocket.send_json({"type": "run", "id": "bad", "input": {}})
+        error = websocket.receive_json()
+        assert error["id"] == "bad"
+        assert error["type"] == "error"
+
+
+def test_websocket_cancel_while_sending_closes_the_run(test_client) -> None:
+    """Test that a run cancelled while its frame is being sent stops its graph run at once."""
+    closed = threading.Event()
+
+    async def endless_frames(user_input, agent_id, api_key):
+        try:
+            while True:
+                yield b'data: {"type": "token", "content": "x"}\n\n'
+        finally:
+            closed.set()
+
+    send_text = WebSocket.send_text
+
+    async def slow_send_text(self, data):
+        await asyncio.sleep(0.01)
+        await send_text(self, data)
+
+    with (
+        patch("service.service.message_generator", endless_frames),
+        patch.object(WebSocket, "send_text", slow_send_text),
+        test_client.websocket_connect("/ws") as websocket,
+    ):
+        websocket.send_json({"type": "run", "id": "1", "input": {"message": "Hi"}})
+        assert websocket.receive_json()["type"] == "token"
+        websocket.send_json({"type": "cancel", "id": "1"})
+        while (event := websocket.receive_json())["type"] != "cancelled":
+            assert event["type"] == "token"
+        # Closed before the cancellation was reported, not when garbage collected
+        assert closed.is_set()
+
+
+def test_websocket_over_real_socket(mock_agent) -> None:
+    """Test /ws through uvicorn, which needs a WebSocket library the TestClient doesn't."""
+
+    async def mock_astream_events(**kwargs):
+        yield {
+            "event": "on_chat_model_stream",
+            "data": {"chunk": SimpleNamespace(content="Hello")},
+            "tags": [],
+        }
+
+    mock_agent.astream_events = mock_astream_events
+
+    server = uvicorn.Server(uvicorn.Config(app, port=0, lifespan="off", log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    try:
+        deadline = time.monotonic() + 5
+        while not server.started:
+            assert time.monotonic() < deadline, "uvicorn didn't start"
+            time.sleep(0.01)
+        port = server.servers[0].sockets[0].getsockname()[1]
+        with connect(f"ws://127.0.0.1:{port}/ws/test-agent") as websocket:
+            run = {"type": "run", "id": "1", "input": {"message": "Hi"}}
+            websocket.send(json.dumps(run))
+            assert json.loads(websocket.recv(timeout=5)) == {
+                "id": "1",
+                "type": "token",
+                "content": "Hello",
+            }
+            assert json.loads(websocket.recv(timeout=5)) == {"id": "1", "type": "end"}
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+def test_metrics(test_client, mock_agent) -> None:
+    mock_agent.ainvoke.return_value = {"messages": [AIMessage(content="hi")]}
+    assert test_client.post("/invoke", json={"message": "hello"}).status_code == 200
+
+    response = test_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+    # Requests are labeled with their route template and agent
+    assert (
+        'agent_service_http_requests_total{method="POST",route="/invoke",'
+        f'agent="{DEFAULT_AGENT}",status="200"}}' in response.text
+    )
+    assert "# TYPE agent_service_http_request_duration_seconds histogram" in response.text
+    assert "# TYPE agent_service_runs_in_flight gauge" in response.text
+
+    # Agent ids that don't exist share one label
+    test_client.post("/made-up-agent/invoke", json={"message": "hello"})
+    text = test_client.get("/metrics").text
+    assert 'route="/{agent_id}/invoke",agent="unknown"' in text
+    assert "made-up-agent" not in text
+
+
+def test_run_timeline(test_client) -> None:
+    with patch("service.service.settings.RUN_TIMELINE_ENABLED", False):
+        assert test_client.get("/runs/unknown/timeline").status_code == 404
+
+    timeline = RunTimeline(
+        run_id="run-1", agent_id="chatbot", thread_id="thread-1", started_at=0.0, duration=1.0
+    )
+    timeline.spans.append(TimelineSpan(id="run-1", name="chatbot", kind="run", start=0, end=1))
+    with (
+        patch("service.service.settings.RUN_TIMELINE_ENABLED", True),
+        patch("service.service.get_timeline", Mock(return_value=timeline)) as get_timeline,
+    ):
+        response = test_client.get("/runs/run-1/timeline")
+        assert response.status_code == 200
+        assert RunTimeline.model_validate(response.json()) == timeline
+        get_timeline.assert_called_with("run-1", ANONYMOUS)
+
+        response = test_client.get("/runs/run-1/timeline/chrome")
+        assert response.status_code == 200
+        assert [e["name"] for e in response.json()["traceEvents"]] == ["process_name", "chatbot"]
+
+        get_timeline.return_value = None
+        assert test_client.get("/runs/run-2/timeline").status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_run_timeline_is_scoped_to_api_key() -> None:
+    """Test that only the API key that started a run can read its timeline."""
+    owner = ApiKeyConfig(name="owner", key="owner-secret")
+    other_key = ApiKeyConfig(name="other", key="other-secret")
+    tracer = TimelineTracer(uuid4(), "chatbot", "thread-1", owner="owner")
+    tracer.on_chain_start({}, {}, run_id=uuid4(), name="chatbot")
+    run_id = tracer.timeline.run_id
+    with patch("service.service.settings.RUN_TIMELINE_ENABLED", True):
+        assert await run_timeline(run_id, api_key=owner) is tracer.timeline
+        for endpoint in (run_timeline, run_timeline_chrome):
+            with pytest.raises(HTTPException) as exc:
+                await endpoint(run_id, api_key=other_key)
+            assert exc.value.status_code == 404
+
+
+def test_admission_rejects_when_saturated(test_client, mock_agent) -> None:
+    """Test that runs over the admission caps are rejected with 503 and Retry-After."""
+    saturated = AdmissionController(max_in_flight=0, max_queue=0)
+    tracker = UsageTracker()
+    with (
+        patch("service.service.get_admission_controller", return_value=saturated),
+        patch("service.service.get_usage_tracker", return_value=tracker),
+    ):
+        response = test_client.post("/invoke", json={"message": "Hi"})
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) >= 1
+
+        response = test_client.post("/stream", json={"message": "Hi"})
+        assert response.status_code == 503
+
+        response = test_client.post("/batch", json={"inputs": [{"message": "Hi"}]})
+        assert response.status_code == 200
+        assert "overloaded" in response.json()["results"][0]["error"]
+    mock_agent.ainvoke.assert_not_awaited()
+    # Rejected runs don't count as runs of the API key
+    assert ANONYMOUS not in tracker.usage()
+
+    response = test_client.post("/invoke", json={"message": "Hi"}, headers={"X-Priority": "urgent"})
+    assert response.status_code == 422
+    response = test_client.post("/invoke", json={"message": "Hi"}, headers={"X-Priority": "high"})
+    assert response.status_code == 200
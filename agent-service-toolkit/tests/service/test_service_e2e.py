@@ -1,4 +1,4 @@
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 from langchain_core.messages import AIMessage, ToolCall, ToolMessage
 from langchain_core.runnables import RunnableConfig
@@ -93,7 +93,7 @@ def test_agent_stream(mock_httpx):
             return static_agent
         return None
 
-    with patch("service.service.get_agent", side_effect=agent_lookup):
+    with patch("service.service.aget_agent", AsyncMock(side_effect=agent_lookup)):
         for response in client.stream("Test message", stream_tokens=False):
             if isinstance(response, ChatMessage):
                 messages.append(response)
@@ -0,0 +1,66 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+
+from schema import ChatMessage
+from service import sse
+from service.streams import StreamRun
+
+
+def parse(frame: bytes) -> dict:
+    assert frame.startswith(b"data: ") and frame.endswith(b"\n\n")
+    return json.loads(frame[6:])
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_encode_frames(use_orjson: bool) -> None:
+    orjson = sse.orjson if use_orjson else None
+    message = ChatMessage(
+        type="ai",
+        content='Quotes " and ünïcode',
+        tool_calls=[{"name": "calc", "args": {"x": 1}, "id": "1", "type": "tool_call"}],
+        run_id="run",
+    )
+    with patch.object(sse, "orjson", orjson):
+        assert parse(sse.encode_token('say "hi"')) == {"type": "token", "content": 'say "hi"'}
+        assert parse(sse.encode_message(message)) == {
+            "type": "message",
+            "content": message.model_dump(),
+        }
+    assert parse(sse.ERROR_FRAME) == {"type": "error", "content": "Unexpected error"}
+
+
+def test_token_coalescer() -> None:
+    coalescer = sse.TokenCoalescer(max_bytes=8, window=10)
+    assert coalescer.timeout() is None
+    assert coalescer.flush() is None
+
+    assert coalescer.add("ab") is None
+    assert 0 < coalescer.timeout() <= 10
+    assert coalescer.add("ü") is None  # two bytes in UTF-8
+    assert parse(coalescer.add("cdef"))["content"] == "abücdef"
+    assert coalescer.timeout() is None
+
+    assert coalescer.add("g") is None
+    assert parse(coalescer.flush())["content"] == "g"
+
+
+@pytest.mark.asyncio
+async def test_stream_run_ring_buffer() -> None:
+    async def frames():
+        for i in range(5):
+            await asyncio.sleep(0)
+            yield f"data: {i}\n\n".encode()
+
+    run = StreamRun(frames(), buffer_size=3, resume_timeout=60)
+    # A reader attached from the start sees every frame, in order
+    received = [frame async for frame in run.subscribe()]
+    assert [f.split(b"\n")[1] for f in received] == [f"data: {i}".encode() for i in range(5)]
+    assert received[0].startswith(f"id: {run.id}:1\n".encode())
+
+    # Only the last three frames are kept
+    assert run.can_resume(2) and run.can_resume(5)
+    assert not run.can_resume(1)
+    assert len([frame async for frame in run.subscribe(after=3)]) == 2
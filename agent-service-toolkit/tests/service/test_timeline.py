@@ -0,0 +1,114 @@
+from unittest.mock import patch
+from uuid import uuid4
+
+import pytest
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, MessagesState, StateGraph
+
+from schema import RunTimeline, TimelineSpan
+from service.metrics import InstrumentedCheckpointer
+from service.timeline import TimelineTracer, chrome_trace, get_timeline
+
+
+@tool
+def add(a: int, b: int) -> int:
+    """Add two numbers."""
+    return a + b
+
+
+def build_graph():
+    model = FakeListChatModel(responses=["the answer"])
+    guard = FakeListChatModel(responses=["safe"]).with_config(tags=["llama_guard"])
+
+    async def guard_input(state: MessagesState) -> MessagesState:
+        await guard.ainvoke(state["messages"])
+        return {"messages": []}
+
+    async def respond(state: MessagesState) -> MessagesState:
+        await add.ainvoke({"a": 1, "b": 2})
+        return {"messages": [await model.ainvoke(state["messages"])]}
+
+    graph = StateGraph(MessagesState)
+    graph.add_node("guard_input", guard_input)
+    graph.add_node("respond", respond)
+    graph.set_entry_point("guard_input")
+    graph.add_edge("guard_input", "respond")
+    graph.add_edge("respond", END)
+    return graph.compile(checkpointer=InstrumentedCheckpointer(MemorySaver(), "test-agent"))
+
+
+@pytest.mark.asyncio
+async def test_timeline_tracer() -> None:
+    run_id = uuid4()
+    tracer = TimelineTracer(run_id, "test-agent", "thread-1", owner="tenant")
+    config = {"run_id": run_id, "callbacks": [tracer], "configurable": {"thread_id": "thread-1"}}
+
+    await build_graph().ainvoke({"messages": [("user", "hello")]}, config)
+
+    timeline = get_timeline(str(run_id), "tenant")
+    assert timeline is tracer.timeline
+    # Other API keys can't read it
+    assert get_timeline(str(run_id), "other-tenant") is None
+    assert timeline.duration is not None
+    spans = {(span.kind, span.name): span for span in timeline.spans}
+    run = spans["run", "test-agent"]
+    guard_node = spans["guard", "guard_input"]
+    node = spans["node", "respond"]
+    assert run.parent_id is None
+    assert guard_node.parent_id == node.parent_id == str(run_id)
+    # Calls are nested under the node they ran in
+    assert spans["tool", "add"].parent_id == node.id
+    [guard_call] = [s for s in timeline.spans if s.kind == "guard" and s.parent_id == guard_node.id]
+    [llm_call] = [s for s in timeline.spans if s.kind == "llm"]
+    assert llm_call.parent_id == node.id
+    assert llm_call.provider == "fakelistchatmodel"
+    assert guard_call.end is not None
+    assert "put" in {s.name for s in timeline.spans if s.kind == "checkpoint"}
+    assert set(timeline.breakdown) == {"guard", "llm", "tool", "checkpoint"}
+
+
+def test_timeline_buffer_is_bounded() -> None:
+    tracers = [TimelineTracer(uuid4(), "test-agent", f"thread-{i}") for i in range(3)]
+    with patch("service.timeline.settings.RUN_TIMELINE_BUFFER_SIZE", 2):
+        for tracer in tracers:
+            tracer.on_chain_start({}, {}, run_id=uuid4(), name="test-agent")
+    assert get_timeline(tracers[0].timeline.run_id, None) is None
+    assert get_timeline(tracers[2].timeline.run_id, None) is tracers[2].timeline
+
+
+def test_chrome_trace() -> None:
+    timeline = RunTimeline(
+        run_id="run",
+        agent_id="agent",
+        thread_id="thread",
+        started_at=100.0,
+        duration=1.0,
+        spans=[
+            TimelineSpan(id="run", name="agent", kind="run", start=0.0, end=1.0),
+            TimelineSpan(id="a", parent_id="run", name="model", kind="node", start=0.1, end=0.6),
+            TimelineSpan(
+                id="b",
+                parent_id="a",
+                name="gpt",
+                kind="llm",
+                start=0.2,
+                end=0.5,
+                first_token=0.3,
+                provider="openai",
+            ),
+            # Runs alongside the model node, so it gets a row of its own
+            TimelineSpan(id="c", parent_id="run", name="add", kind="tool", start=0.4, end=0.8),
+        ],
+    )
+    trace = chrome_trace(timeline)
+    events = {e["name"]: e for e in trace["traceEvents"] if e["ph"] == "X"}
+    assert events["agent"]["tid"] == events["model"]["tid"] == events["gpt"]["tid"] == 0
+    assert events["add"]["tid"] == 1
+    assert events["gpt"]["ts"] == pytest.approx(100.2 * 1_000_000)
+    assert events["gpt"]["dur"] == pytest.approx(300_000)
+    assert events["gpt"]["args"] == {
+        "provider": "openai",
+        "time_to_first_token_ms": pytest.approx(100),
+    }
@@ -1,6 +1,7 @@
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolCall, ToolMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
 
-from service.utils import langchain_to_chat_message
+from service.utils import langchain_to_chat_message, token_usage
 
 
 def test_messages_from_langchain() -> None:
@@ -42,3 +43,17 @@ def test_messages_tool_calls() -> None:
     assert ai_message.tool_calls[0]["id"] == "call_Jja7"
     assert ai_message.tool_calls[0]["name"] == "test_tool"
     assert ai_message.tool_calls[0]["args"] == {"x": 1, "y": 2}
+
+
+def test_token_usage() -> None:
+    with_usage = AIMessage(
+        content="a", usage_metadata={"input_tokens": 10, "output_tokens": 2, "total_tokens": 12}
+    )
+    # Providers without usage_metadata report usage in the response metadata
+    with_metadata = AIMessage(
+        content="b", response_metadata={"token_usage": {"prompt_tokens": 5, "completion_tokens": 1}}
+    )
+    result = LLMResult(
+        generations=[[ChatGeneration(message=with_usage)], [ChatGeneration(message=with_metadata)]]
+    )
+    assert token_usage(result) == (15, 3)
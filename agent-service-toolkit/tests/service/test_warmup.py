@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+from unittest.mock import AsyncMock, Mock, patch
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from langchain_community.chat_models import FakeListChatModel
+from langchain_openai import ChatOpenAI
+
+from core.routing import RoutedChatModel
+from schema.models import OpenAIModelName
+from service import app
+from service.warmup import preconnect, warmup
+
+
+@pytest.mark.asyncio
+async def test_preconnect():
+    """Test that preconnect() opens a connection through the model's own HTTP client."""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(404)
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http_client:
+        model = ChatOpenAI(
+            api_key="sk-fake",
+            base_url="https://llm.example.com/v1",
+            http_async_client=http_client,
+        )
+        assert await preconnect(model) == 1
+        assert requests[0].method == "HEAD"
+        assert str(requests[0].url) == "https://llm.example.com/v1/"
+
+        routed = RoutedChatModel(
+            models=[model, FakeListChatModel(responses=["hi"])], model_names=["a", "b"]
+        )
+        assert await preconnect(routed) == 1
+        assert len(requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_warmup():
+    """Test that every warmup step runs, even when an earlier one fails."""
+    saver = Mock(aget_tuple=AsyncMock(side_effect=RuntimeError("database is locked")))
+    model = Mock()
+    threads = set()
+
+    def fake_get_model(model_name):
+        threads.add(threading.current_thread())
+        return model
+
+    with (
+        patch("service.warmup.settings.AVAILABLE_MODELS", {OpenAIModelName.GPT_4O_MINI}),
+        patch("service.warmup.get_model", side_effect=fake_get_model) as mock_get_model,
+        patch("service.warmup.preconnect", AsyncMock(return_value=1)) as mock_preconnect,
+        patch("service.warmup.load_agents") as mock_load_agents,
+    ):
+        model.ainvoke = AsyncMock()
+        await warmup(["chatbot"], [saver])
+
+    saver.aget_tuple.assert_awaited_once()
+    mock_load_agents.assert_called_once_with(["chatbot"])
+    mock_get_model.assert_any_call(OpenAIModelName.GPT_4O_MINI)
+    # Models are created off the event loop, except the fake model, which imports nothing
+    assert len(threads - {threading.main_thread()}) == 1
+    mock_preconnect.assert_awaited_once_with(model)
+    model.ainvoke.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_warmup_step_timeout():
+    """Test that a hanging step is abandoned after WARMUP_TIMEOUT."""
+
+    async def hang(config):
+        await asyncio.sleep(10)
+
+    saver = Mock(aget_tuple=hang)
+    with (
+        patch("service.warmup.settings.WARMUP_TIMEOUT", 0.01),
+        patch("service.warmup.settings.AVAILABLE_MODELS", set()),
+        patch("service.warmup.load_agents"),
+    ):
+        started = time.perf_counter()
+        await warmup([], [saver])
+    assert time.perf_counter() - started < 5
+
+
+def test_ready_after_warmup(tmp_path):
+    """Test that /ready only reports ready once warmup has finished, unlike /health."""
+    # Not started yet
+    assert TestClient(app).get("/ready").status_code == 503
+
+    warmed_up = asyncio.Event()
+
+    async def slow_warmup(agent_ids, checkpointers):
+        await warmed_up.wait()
+
+    with (
+        patch("service.service.warmup", slow_warmup),
+        patch("service.service.settings.CHECKPOINT_MAINTENANCE_INTERVAL", 0),
+        patch("service.checkpointer.settings.CHECKPOINT_SQLITE_PATH", str(tmp_path / "c.db")),
+        TestClient(app) as client,
+    ):
+        assert client.get("/health").status_code == 200
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json() == {"detail": "Warming up"}
+
+        client.portal.call(warmed_up.set)
+        for _ in range(100):
+            if client.get("/ready").status_code == 200:
+                break
+            time.sleep(0.01)
+        assert client.get("/ready").json() == {"status": "ready"}
@@ -2,6 +2,7 @@ import re
 import subprocess
 import tempfile
 import time
+from collections import deque
 from typing import Optional, Tuple
 from openai import OpenAI
 
@@ -14,8 +15,8 @@ class DatabaseCodeGenerator:
             base_url="https://api.moonshot.cn/v1"  # Moonshot AI 的 API 地址
         )
         self.max_retries = 3  # 最大重试次数
-        self.api_call_count = 0  # API 调用计数器
-        self.last_api_call_time = 0  # 上次 API 调用时间
+        self.max_calls_per_minute = 3  # 每分钟最多调用次数
+        self.api_call_times = deque()  # 最近一分钟内的 API 调用时间
 
     def generate_and_test(self, requirement: str) -> str:
         """主工作流程：生成并测试数据库代码"""
@@ -55,10 +56,8 @@ class DatabaseCodeGenerator:
 
     def _get_llm_response(self, prompt: str) -> str:
         """获取大模型响应，带频率限制"""
-        # 检查调用频率
-        current_time = time.time()
-        if self.api_call_count >= 3 and current_time - self.last_api_call_time < 60:
-            raise Exception("API 调用频率超限，请稍后再试")
+        # 超过调用频率时等待，而不是直接报错
+        self._wait_for_rate_limit()
 
         try:
             # 调用 Moonshot AI API
@@ -68,15 +67,24 @@ class DatabaseCodeGenerator:
                 max_tokens=500
             )
             
-            # 更新调用状态
-            self.api_call_count += 1
-            self.last_api_call_time = current_time
-            
             return response.choices[0].message.content.strip()
         except Exception as e:
             print(f"API 调用失败: {e}")
             raise Exception(f"API 调用失败，请检查 API Key 和网络连接: {e}")
 
+    def _wait_for_rate_limit(self) -> None:
+        """滑动窗口限流：每 60 秒最多 max_calls_per_minute 次调用，超出时等待最早的调用过期"""
+        while True:
+            current_time = time.monotonic()
+            while self.api_call_times and current_time - self.api_call_times[0] >= 60:
+                self.api_call_times.popleft()
+            if len(self.api_call_times) < self.max_calls_per_minute:
+                self.api_call_times.append(current_time)
+                return
+            wait = 60 - (current_time - self.api_call_times[0])
+            print(f"API 调用频率超限，等待 {wait:.1f} 秒")
+            time.sleep(wait)
+
     def _execute_with_tests(self, code: str) -> Tuple[bool, str]:
         """执行测试"""
         with tempfile.NamedTemporaryFile(mode="w", suffix=".ts", delete=False) as f: